@@ -0,0 +1,117 @@
+"""Local stand-in for Reddit's JSON listings, for the http fetch backend.
+
+    python benchmarks/fake_reddit.py --port 8766
+    python scraper.py reddit --backend http --base-url http://127.0.0.1:8766 -s bench -k job
+
+Serves /r/<subreddit>/search.json and /r/<subreddit>/comments/<id>/<slug>.json with
+the same synthetic posts and comment trees as fake_urs, over HTTP/1.1 keep-alive.
+--fail-every answers every n-th request with a 429 to exercise the retries.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+sys.path[:0] = [str(Path(__file__).resolve().parent), str(Path(__file__).resolve().parent.parent)]
+
+from instrumentation import log  # noqa: E402
+from synthetic import make_comment_tree, make_posts  # noqa: E402
+
+
+def listing(kind, items, after=None):
+    return {"kind": "Listing", "data": {"after": after, "children": [{"kind": kind, "data": item} for item in items]}}
+
+
+def comment_listing(comments):
+    return listing("t1", [{**comment, "replies": comment_listing(comment["replies"]) if comment["replies"] else ""}
+                          for comment in comments])
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failing = server.fail_every and server.requests % server.fail_every == 0
+        time.sleep(server.delay)
+        if failing:
+            return self.send_json({"error": 429, "message": "Too Many Requests"}, 429, {'Retry-After': '0'})
+
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if len(parts) == 3 and parts[0] == 'r' and parts[2] == 'search.json':
+            return self.send_json(self.search(parts[1], query))
+        if len(parts) == 5 and parts[0] == 'r' and parts[2] == 'comments' and parts[4].endswith('.json'):
+            return self.send_json(self.comments(parts[1], parts[3], parts[4][:-5], query))
+        self.send_json({"error": 404, "message": "Not Found"}, 404)
+
+    def search(self, subreddit, query):
+        rng = random.Random(f"{subreddit}/{query.get('q', '')}")
+        posts = make_posts(subreddit, query.get('q', ''), self.server.posts, rng, comments_per_post=20)
+        start = int(query['after'][3:]) if query.get('after', '').startswith('t3_') else 0
+        end = start + int(query.get('limit', 25))
+        return listing("t3", posts[start:end], f"t3_{end}" if end < len(posts) else None)
+
+    def comments(self, subreddit, post_id, slug, query):
+        rng = random.Random(f"{subreddit}/{post_id}")
+        n_comments = int(query.get('limit', 100))
+        post = {"id": post_id, "title": slug, "author": "op", "created_utc": 0, "num_comments": n_comments,
+                "permalink": f"/r/{subreddit}/comments/{post_id}/{slug}/"}
+        comments = comment_listing(make_comment_tree(post_id, n_comments, self.server.depth, rng))
+        # a "load more comments" stub, which the backend skips
+        comments["data"]["children"].append({"kind": "more", "data": {"count": 0, "children": []}})
+        return [listing("t3", [post]), comments]
+
+    def send_json(self, document, status=200, headers=None):
+        body = json.dumps(document, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host='127.0.0.1', port=0, posts=25, depth=12, delay=0.0, fail_every=0):
+    """Start the server on a daemon thread; port 0 picks a free one (see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.posts, server.depth, server.delay, server.fail_every = posts, depth, delay, fail_every
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic Reddit JSON listings.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--posts', type=int, default=25, help="Posts per search")
+    parser.add_argument('--depth', type=int, default=12, help="Maximum reply depth")
+    parser.add_argument('--delay', type=float, default=0.0, help="Seconds per request, standing in for the network")
+    parser.add_argument('--fail-every', type=int, default=0, help="Answer every n-th request with a 429")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.posts, args.depth, args.delay, args.fail_every)
+    log("INFO", f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Stand-in for `python -m urs.Urs` that writes synthetic scrape files instead of calling Reddit.
+
+Understands the two invocations scraper.py makes:
+
+    -r SUBREDDIT s KEYWORD [TIME_FILTER]    (confirmed with 'y' on stdin)
+    -c URL N_COMMENTS
+
+Files are written to $FAKE_URS_OUTPUT/<date>/{subreddits,comments}/. $FAKE_URS_POSTS,
+$FAKE_URS_DEPTH and $FAKE_URS_DELAY (seconds per call, standing in for the network)
+tune the output.
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from synthetic import (comments_document, make_comment_tree, make_posts, posts_document, scrape_dir,  # noqa: E402
+                       write_json)
+
+
+def main(argv):
+    output = Path(os.environ.get("FAKE_URS_OUTPUT", "scrapes"))
+    posts_per_search = int(os.environ.get("FAKE_URS_POSTS", 25))
+    max_depth = int(os.environ.get("FAKE_URS_DEPTH", 12))
+    time.sleep(float(os.environ.get("FAKE_URS_DELAY", 0)))
+
+    if argv[:1] == ['-r'] and len(argv) >= 4 and argv[2] == 's':
+        subreddit, keyword = argv[1], argv[3]
+        time_filter = argv[4] if len(argv) > 4 else None
+        if sys.stdin.readline().strip().lower() != 'y':
+            print("Cancelled.")
+            return 1
+        rng = random.Random(f"{subreddit}/{keyword}")
+        posts = make_posts(subreddit, keyword, posts_per_search, rng, comments_per_post=20)
+        write_json(scrape_dir(output) / 'subreddits' / f"{subreddit}-search-'{keyword}'.json",
+                   posts_document(subreddit, keyword, posts, time_filter))
+        return 0
+
+    if argv[:1] == ['-c'] and len(argv) >= 3:
+        url, n_comments = argv[1], int(argv[2])
+        parts = url.rstrip('/').split('/')
+        subreddit, post_id = parts[parts.index('r') + 1], parts[-2]
+        rng = random.Random(url)
+        post = {
+            "author": "op", "created_utc": 0, "num_comments": n_comments, "title": post_id,
+            "permalink": f"/r/{subreddit}/comments/{post_id}/{parts[-1]}/",
+        }
+        comments = make_comment_tree(post_id, n_comments, max_depth, rng)
+        write_json(scrape_dir(output) / 'comments' / f"{post_id}-{n_comments}.json",
+                   comments_document(post, comments))
+        return 0
+
+    print(f"Unsupported arguments: {' '.join(argv)}", file=sys.stderr)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,234 @@
+"""Benchmark ingestion, export and clustering on synthetic URS data.
+
+    python benchmarks/run.py --posts 50 --comments 40 -o bench_results.json
+    python benchmarks/run.py --compare bench_results.json
+
+Each run writes its timings to a JSON file tagged with the git commit, so two
+commits can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT))
+
+import cluster  # noqa: E402
+import export_all_to_csv  # noqa: E402
+import fake_reddit  # noqa: E402
+import scraper  # noqa: E402
+from instrumentation import log  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from near_duplicates import update_index  # noqa: E402
+from synthetic import write_scrapes  # noqa: E402
+
+OUTPUT = ROOT / 'bench_results.json'
+FAKE_URS = BENCH_DIR / 'fake_urs'
+
+# metrics compared by --compare; the rest describe the workload
+HIGHER_IS_BETTER = ('rows_per_s', 'files_per_s')
+LOWER_IS_BETTER = ('seconds', 'load_seconds', 'query_seconds', 'seconds_per_call', 'peak_mb')
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def use_db(path):
+    """Point scraper's module-level database at a fresh file."""
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    scraper.DB_PATH = path
+    scraper.init_db(path)
+    return path
+
+
+def count_rows(db_path, table):
+    with scraper.connect_db(db_path) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def bench_inserts(db_path, files, keywords):
+    """Serial insert_subreddit_posts / insert_comments, one call per file as the CLI used to."""
+    use_db(db_path)
+    matcher = KeywordMatcher(keywords)
+    post_files = [path for path in files if path.parent.name == 'subreddits']
+    comment_files = [path for path in files if path.parent.name == 'comments']
+
+    _, post_seconds = timed(lambda: [scraper.insert_subreddit_posts(path, matcher) for path in post_files])
+    posts = count_rows(db_path, 'reddit_post')
+    _, comment_seconds = timed(lambda: [scraper.insert_comments(path, matcher) for path in comment_files])
+    comments = count_rows(db_path, 'reddit_comment')
+    _, fts_seconds = timed(lambda: scraper.sync_fts(scraper.connect_db(db_path)))
+    indexed, index_seconds = timed(lambda: update_index(scraper.connect_db(db_path)))
+    return {
+        "insert_posts": {"rows": posts, "seconds": post_seconds, "rows_per_s": posts / post_seconds},
+        "insert_comments": {"rows": comments, "seconds": comment_seconds,
+                            "rows_per_s": comments / comment_seconds},
+        "fts_sync": {"rows": posts + comments, "seconds": fts_seconds,
+                     "rows_per_s": (posts + comments) / max(fts_seconds, 1e-9)},
+        "near_duplicate_index": {"rows": indexed, "seconds": index_seconds,
+                                 "rows_per_s": indexed / max(index_seconds, 1e-9)},
+    }
+
+
+def bench_ingest(db_path, files, keywords, workers):
+    use_db(db_path)
+    _, seconds = timed(scraper.ingest_jsons, files, keywords, workers)
+    rows = count_rows(db_path, 'reddit_post') + count_rows(db_path, 'reddit_comment')
+    return {"workers": workers, "files": len(files), "rows": rows, "seconds": seconds,
+            "rows_per_s": rows / seconds, "files_per_s": len(files) / seconds}
+
+
+def bench_export(db_path, workdir):
+    output = workdir / 'export.csv'
+    rows, seconds = timed(export_all_to_csv.export, db_path, output)
+    with scraper.connect_db(db_path) as conn:
+        _, query_seconds = timed(lambda: sum(len(chunk) for chunk in export_all_to_csv.iter_rows(conn)))
+    return {"rows": rows, "seconds": seconds, "query_seconds": query_seconds, "rows_per_s": rows / seconds,
+            "bytes": output.stat().st_size}
+
+
+def bench_cluster(db_path, n_clusters, engine, memory=True):
+    data, load_seconds = timed(cluster.load_and_filter_texts, db_path)
+    _, seconds = timed(cluster.cluster_texts, data, n_clusters, engine)
+    result = {"engine": engine, "texts": len(data), "load_seconds": load_seconds, "seconds": seconds,
+              "rows_per_s": len(data) / seconds}
+    if memory:
+        # a second run under tracemalloc, which slows allocation-heavy code down
+        tracemalloc.start()
+        cluster.cluster_texts(data, n_clusters, engine)
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def bench_scrape(db_path, workdir, searches, posts, jobs, backend='urs'):
+    """End-to-end run_reddit_scraper against the fake URS or the fake Reddit server."""
+    use_db(db_path)
+    scrapes = workdir / f'scrapes_{backend}'
+    scraper.URS_PATH = FAKE_URS
+    scraper.URS_VENV_PYTHON = Path(sys.executable)
+    scraper.SCRAPES_DIR = scrapes
+    os.environ.update(FAKE_URS_OUTPUT=str(scrapes), FAKE_URS_POSTS=str(posts))
+    server = fake_reddit.serve(posts=posts) if backend == 'http' else None
+    base_url = f"http://127.0.0.1:{server.server_address[1]}" if server else None
+
+    keywords = [f"stichwort{i}" for i in range(searches)]
+    failures, seconds = timed(scraper.run_reddit_scraper, ['bench'], keywords, jobs, rate_limit=10 ** 6,
+                              backend=backend, base_url=base_url)
+    if server:
+        calls = server.requests
+        server.shutdown()
+    else:
+        calls = len(list(scrapes.rglob('*.json')))
+    return {"backend": backend, "calls": calls, "jobs": jobs, "seconds": seconds,
+            "seconds_per_call": seconds / max(calls, 1),
+            "rows": count_rows(db_path, 'reddit_post') + count_rows(db_path, 'reddit_comment'),
+            "failed": len(failures or [])}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """Print each metric next to the baseline with its relative change."""
+    for name, metrics in current["results"].items():
+        before = baseline["results"].get(name, {})
+        for key, value in metrics.items():
+            old = before.get(key)
+            if key not in HIGHER_IS_BETTER + LOWER_IS_BETTER or not old:
+                continue
+            change = value / old - 1
+            better = change > 0 if key in HIGHER_IS_BETTER else change < 0
+            mark = '' if abs(change) < 0.05 else (' (better)' if better else ' (WORSE)')
+            print(f"{name + '.' + key:<40} {old:>12.4g} -> {value:>12.4g} {change:+7.1%}{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper pipeline on synthetic URS data.")
+    parser.add_argument('--subreddits', type=int, default=4)
+    parser.add_argument('--keywords', type=int, default=5)
+    parser.add_argument('--posts', type=int, default=50, help="Posts per search file")
+    parser.add_argument('--comments', type=int, default=40, help="Average comments per post")
+    parser.add_argument('--depth', type=int, default=12, help="Maximum reply depth")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[scraper.INGEST_WORKERS],
+                        help="Workers for the ingest_jsons benchmark; several values measure scaling")
+    parser.add_argument('--clusters', type=int, default=cluster.N_CLUSTERS)
+    parser.add_argument('--engine', choices=cluster.ENGINES, default='auto')
+    parser.add_argument('--scrape-searches', type=int, default=4,
+                        help="Searches in the end-to-end scrapes (0 to skip)")
+    parser.add_argument('--scrape-backends', nargs='+', choices=scraper.FETCH_BACKENDS,
+                        default=list(scraper.FETCH_BACKENDS),
+                        help="Fetch backends to run the end-to-end scrape with")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip the tracemalloc run of the clustering")
+    parser.add_argument('--workdir', type=Path,
+                        help="Keep fixtures and databases here instead of a temporary directory")
+    parser.add_argument('-o', '--output', type=Path, default=OUTPUT)
+    parser.add_argument('--compare', type=Path,
+                        help="Earlier results file to compare this run against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='scraper-bench-') as tmp:
+        workdir = args.workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        db_path = workdir / 'bench.db'
+
+        fixtures, seconds = timed(write_scrapes, workdir / 'scrapes', args.subreddits, args.keywords,
+                                  args.posts, args.comments, args.depth, args.seed)
+        keywords = fixtures.pop("keywords")
+        log("INFO", f"Wrote {fixtures['files']} files ({fixtures['bytes'] / 2 ** 20:.1f} MB) in {seconds:.1f}s")
+        files = sorted((workdir / 'scrapes').rglob('*.json'))
+
+        results = {"fixtures": {**fixtures, "seconds": seconds}}
+        results.update(bench_inserts(db_path, files, keywords))
+        for i, workers in enumerate(args.workers):
+            results["ingest" if i == 0 else f"ingest_w{workers}"] = bench_ingest(workdir / 'ingest.db', files,
+                                                                                 keywords, workers)
+        results["export"] = bench_export(db_path, workdir)
+        results["cluster"] = bench_cluster(db_path, args.clusters, args.engine, not args.no_memory)
+        for backend in args.scrape_backends if args.scrape_searches else []:
+            name = 'scrape' if backend == 'urs' else f'scrape_{backend}'
+            results[name] = bench_scrape(workdir / f'scrape_{backend}.db', workdir, args.scrape_searches, 5,
+                                         min(args.workers[0], 4), backend)
+
+    report = {
+        "commit": git_commit(),
+        "created_utc": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    log("INFO", f"Results written to {args.output}")
+
+    for name, metrics in results.items():
+        print(f"{name:<22} " + ', '.join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                                          for key, value in metrics.items()))
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
+
+
+if __name__ == '__main__':
+    main()
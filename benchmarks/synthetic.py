@@ -0,0 +1,145 @@
+"""Synthetic scrape files shaped like URS output, for benchmarks."""
+import hashlib
+import json
+import random
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_UTC = 1_735_689_600    # 2025-01-01
+TOPICS = [
+    ["job", "gehalt", "arbeit", "chef", "kollegen", "büro", "überstunden", "vertrag", "kündigung", "urlaub"],
+    ["studium", "uni", "prüfung", "master", "bachelor", "semester", "bafög", "professor", "klausur", "thesis"],
+    ["umschulung", "ausbildung", "jobcenter", "förderung", "kurs", "zertifikat", "weiterbildung", "quereinstieg",
+     "bildungsgutschein", "praktikum"],
+    ["wohnung", "miete", "vermieter", "nebenkosten", "umzug", "kaution", "wg", "makler", "besichtigung", "heizung"],
+    ["bewerbung", "lebenslauf", "anschreiben", "vorstellungsgespräch", "absage", "zusage", "recruiter",
+     "probezeit", "linkedin", "gehaltsverhandlung"],
+]
+FILLER = ["ich", "habe", "seit", "jahren", "und", "frage", "mich", "ob", "das", "normal", "ist", "bei", "euch",
+          "wirklich", "gerade", "eigentlich", "meiner", "meinung", "nach", "total", "schwierig", "gut"]
+
+
+def make_id(*parts):
+    return hashlib.sha1('/'.join(map(str, parts)).encode('utf-8')).hexdigest()[:10]
+
+
+def make_text(rng, words, keyword=None, keyword_rate=0.3):
+    topic = rng.choice(TOPICS)
+    tokens = [rng.choice(topic) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(words)]
+    if keyword and rng.random() < keyword_rate:
+        tokens.insert(rng.randrange(len(tokens) + 1), keyword)
+    return ' '.join(tokens).capitalize() + '.'
+
+
+def make_posts(subreddit, keyword, n, rng, comments_per_post):
+    posts = []
+    for i in range(n):
+        post_id = make_id(subreddit, keyword, i)
+        title = make_text(rng, rng.randint(5, 12), keyword, keyword_rate=0.8)
+        posts.append({
+            "author": f"user{rng.randrange(5000)}",
+            "created_utc": BASE_UTC + rng.randrange(365 * 24 * 3600),
+            "id": post_id,
+            "num_comments": max(0, int(rng.gauss(comments_per_post, comments_per_post / 4))),
+            "permalink": f"/r/{subreddit}/comments/{post_id}/{'_'.join(title.lower().split()[:5]).strip('.')}/",
+            "score": rng.randrange(500),
+            "selftext": make_text(rng, rng.randint(20, 150), keyword),
+            "title": title,
+        })
+    return posts
+
+
+def make_comment_tree(post_id, n, max_depth, rng, keyword=None):
+    """Top-level comments with nested replies; replies favour recent comments, so chains get deep."""
+    top, recent = [], []
+    for i in range(n):
+        comment = {
+            "author": f"user{rng.randrange(5000)}",
+            "body": make_text(rng, rng.randint(5, 80), keyword),
+            "created_utc": BASE_UTC + rng.randrange(365 * 24 * 3600),
+            "id": make_id(post_id, i),
+            "link_id": f"t3_{post_id}",
+            "parent_id": f"t3_{post_id}",
+            "score": rng.randrange(100),
+            "replies": [],
+        }
+        candidates = [(parent, depth) for parent, depth in recent[-20:] if depth < max_depth]
+        if candidates and rng.random() < 0.8:
+            parent, depth = rng.choice(candidates)
+            comment["parent_id"] = f"t1_{parent['id']}"
+            parent["replies"].append(comment)
+        else:
+            depth = 0
+            top.append(comment)
+        recent.append((comment, depth + 1))
+    return top
+
+
+def posts_document(subreddit, keyword, posts, time_filter=None):
+    return {
+        "scrape_settings": {
+            "subreddit": subreddit,
+            "category": "s",
+            "n_results_or_keywords": keyword,
+            "time_filter": time_filter or "all",
+        },
+        "data": posts,
+    }
+
+
+def comments_document(post, comments):
+    return {
+        "scrape_settings": {
+            "n_results": post["num_comments"],
+            "url": f"https://www.reddit.com{post['permalink']}",
+        },
+        "data": {
+            "submission_metadata": {
+                "author": post["author"],
+                "created_utc": post["created_utc"],
+                "num_comments": post["num_comments"],
+                "subreddit": post["permalink"].split('/')[2],
+                "title": post["title"],
+            },
+            "comments": comments,
+        },
+    }
+
+
+def scrape_dir(root):
+    return Path(root) / datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+def write_json(path, document):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(document, ensure_ascii=False), encoding='utf-8')
+    return path.stat().st_size
+
+
+def write_scrapes(root, subreddits=4, keywords=5, posts_per_search=50, comments_per_post=40, max_depth=12,
+                  seed=0):
+    """Write one posts file per subreddit and keyword and one comment file per post under root.
+
+    Returns the keyword list and counts of files, posts, comments and bytes written.
+    """
+    rng = random.Random(seed)
+    out = scrape_dir(root)
+    subreddit_names = [f"bench{i}" for i in range(subreddits)]
+    keyword_names = [rng.choice(topic) for topic in TOPICS][:keywords]
+    keyword_names += [f"stichwort{i}" for i in range(keywords - len(keyword_names))]
+
+    summary = {"keywords": keyword_names, "files": 0, "posts": 0, "comments": 0, "bytes": 0}
+    for subreddit in subreddit_names:
+        for keyword in keyword_names:
+            posts = make_posts(subreddit, keyword, posts_per_search, rng, comments_per_post)
+            summary["bytes"] += write_json(out / 'subreddits' / f"{subreddit}-search-'{keyword}'.json",
+                                           posts_document(subreddit, keyword, posts))
+            summary["files"] += 1
+            summary["posts"] += len(posts)
+            for post in posts:
+                comments = make_comment_tree(post["id"], post["num_comments"], max_depth, rng, keyword)
+                summary["bytes"] += write_json(out / 'comments' / f"{post['id']}-{post['num_comments']}.json",
+                                               comments_document(post, comments))
+                summary["files"] += 1
+                summary["comments"] += post["num_comments"]
+    return summary
@@ -3,116 +3,886 @@ import re
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.utils.extmath import row_norms
+from sklearn.preprocessing import normalize
+from scipy.optimize import linear_sum_assignment
+import scipy.sparse as sp
+import argparse
 import csv
+import json
+import sqlite3
+import time
+
+import instrumentation
+from feature_cache import CACHE_DIR, MAX_CACHE_BYTES, FeatureCache, cache_version
+from instrumentation import log, record, span
+from near_duplicates import NEAR_DUP_THRESHOLD, duplicate_hashes, update_index
+from scraper import content_hash
+from tokens import OPENAI_MODEL, token_counter
 
 
 CSV_INPUT_PATH = Path(__file__).resolve().parent / "db_output_all.csv"
 CSV_OUTPUT_PATH = Path(__file__).resolve().parent / "clustered_representatives.csv"
+MODEL_DIR = Path(__file__).resolve().parent / "cluster_model"
+DRIFT_THRESHOLD = 0.2       # refit once new texts sit this much farther from their centroids
+DRIFT_MIN_ROWS = 200        # assigned rows needed before drift is judged
 N_CLUSTERS = 5
+ENGINES = ('exact', 'minibatch', 'embedding', 'auto')
+EXACT_MAX_TEXTS = 50000     # 'auto' engine switches to minibatch above this
+BATCH_SIZE = 10000          # rows per HashingVectorizer / MiniBatchKMeans chunk
+HASH_FEATURES = 2 ** 20
+K_MIN, K_MAX = 2, 20
+SILHOUETTE_SAMPLE = 5000
+MAX_DF = 0.85
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBED_BATCH_SIZE = 64
+REP_POOL = 50               # nearest members per centroid considered as representatives
+REPS_PER_CLUSTER = 5
+REP_TOKENS = 2000           # default token budget for one cluster's representatives
+MMR_LAMBDA = 0.7            # 1.0 ranks by centrality only, lower values favour diversity
+DUP_SIMILARITY = 0.9        # candidates this similar to a pick are treated as duplicates
 
+DB_PATH = Path(__file__).resolve().parent / "reddit_data.db"
+LOAD_CHUNK_SIZE = 50000
+WORD_RE = re.compile(r"\w+")
+MIN_WORDS = 10
+DELETED_MARKERS = ("", "deleted", "[deleted]", "removed", "[removed]")
+DEFAULT_RULES = {
+    "min_words": MIN_WORDS,
+    "deleted_markers": DELETED_MARKERS,
+    "bot_authors": ("AutoModerator",),
+    "bot_pattern": None,
+    "language": None,
+}
 
-def is_low_effort(text: str) -> bool:
-    """Filter out very short or empty/deleted texts."""
-    wc = len(re.findall(r"\w+", text))
-    return wc < 10 or text.strip().lower() in {"", "deleted", "[deleted]"}
+GERMAN_STOP_WORDS = [
+    "aber", "alle", "allem", "allen", "aller", "alles", "als", "also", "am", "an", "ander", "andere", "anderem", "anderen",
+    "anderer", "anderes", "anderm", "andern", "anderr", "anders", "auch", "auf", "aus", "bei", "bin", "bis", "bist", "da",
+    "damit", "dann", "der", "den", "des", "dem", "die", "das", "dass", "du", "dein", "deine", "deinem", "deinen", "deiner",
+    "deines", "doch", "dort", "durch", "ein", "eine", "einem", "einen", "einer", "eines", "er", "es", "etwas", "für", "hat",
+    "haben", "ich", "ihr", "ihre", "ihrem", "ihren", "ihrer", "ihres", "im", "in", "ist", "ja", "jede", "jedem", "jeden",
+    "jeder", "jedes", "kein", "keine", "keinem", "keinen", "keiner", "keines", "man", "mit", "muss", "nicht", "noch", "nun",
+    "oder", "seid", "sein", "seine", "seinem", "seinen", "seiner", "seines", "selbst", "sich", "sie", "sind", "so", "solche",
+    "solchem", "solchen", "solcher", "solches", "und", "uns", "unser", "unserem", "unseren", "unserer", "unseres", "unter",
+    "viel", "vom", "von", "vor", "war", "waren", "warst", "was", "weg", "weil", "weiter", "welche", "welchem", "welchen",
+    "welcher", "welches", "wenn", "wer", "werde", "werden", "wie", "wieder", "will", "wir", "wird", "wirst", "wo", "wollen",
+    "wollte", "würde", "würden", "zu", "zum", "zur", "über"
+]
 
-def load_and_filter_texts(csv_path):
-    df = pd.read_csv(csv_path, dtype=str)
-    text = df.iloc[:, 3].fillna("").tolist()
-    source = df.iloc[:, 0].fillna("").tolist()
 
-    filtered = [
-        {"text": t, "source": src}
-        for src, t in zip(source, text)
-        if not is_low_effort(t)
-    ]
-    return filtered
+def filter_frame(df, rules=None):
+    """Vectorized low-effort filter over a frame with text, source and optional author columns."""
+    rules = {**DEFAULT_RULES, **(rules or {})}
+    text = df["text"].fillna("")
 
+    # \w+ words; str.count still runs the regex once per row, but it beats finditer and
+    # findall loops over the same pattern
+    keep = text.str.count(WORD_RE) >= rules["min_words"]
+    keep &= ~text.str.strip().str.lower().isin([m.lower() for m in rules["deleted_markers"]])
+    if "author" in df and (rules["bot_authors"] or rules["bot_pattern"]):
+        author = df["author"].fillna("")
+        keep &= ~author.isin(rules["bot_authors"])
+        if rules["bot_pattern"]:
+            keep &= ~author.str.contains(rules["bot_pattern"], regex=True)
 
-def cluster_texts(filtered_data, n_clusters):
-    texts = [entry["text"] for entry in filtered_data]
-    sources = [entry["source"] for entry in filtered_data]
-
-    german_stop_words = [
-        "aber", "alle", "allem", "allen", "aller", "alles", "als", "also", "am", "an", "ander", "andere", "anderem", "anderen",
-        "anderer", "anderes", "anderm", "andern", "anderr", "anders", "auch", "auf", "aus", "bei", "bin", "bis", "bist", "da",
-        "damit", "dann", "der", "den", "des", "dem", "die", "das", "dass", "du", "dein", "deine", "deinem", "deinen", "deiner",
-        "deines", "doch", "dort", "durch", "ein", "eine", "einem", "einen", "einer", "eines", "er", "es", "etwas", "für", "hat",
-        "haben", "ich", "ihr", "ihre", "ihrem", "ihren", "ihrer", "ihres", "im", "in", "ist", "ja", "jede", "jedem", "jeden",
-        "jeder", "jedes", "kein", "keine", "keinem", "keinen", "keiner", "keines", "man", "mit", "muss", "nicht", "noch", "nun",
-        "oder", "seid", "sein", "seine", "seinem", "seinen", "seiner", "seines", "selbst", "sich", "sie", "sind", "so", "solche",
-        "solchem", "solchen", "solcher", "solches", "und", "uns", "unser", "unserem", "unseren", "unserer", "unseres", "unter",
-        "viel", "vom", "von", "vor", "war", "waren", "warst", "was", "weg", "weil", "weiter", "welche", "welchem", "welchen",
-        "welcher", "welches", "wenn", "wer", "werde", "werden", "wie", "wieder", "will", "wir", "wird", "wirst", "wo", "wollen",
-        "wollte", "würde", "würden", "zu", "zum", "zur", "über"
-    ]
+    df = df[keep]
+    if rules["language"] and len(df):
+        df = df[df["text"].map(detect_language) == rules["language"]]
+    return df
+
+
+def detect_language(text):
+    try:
+        from langdetect import detect, LangDetectException
+    except ImportError:
+        raise SystemExit("[ERROR] Language filtering needs langdetect: pip install langdetect")
+    try:
+        return detect(text)
+    except LangDetectException:
+        return None
+
+
+def iter_csv_chunks(csv_path, chunk_size=LOAD_CHUNK_SIZE):
+    for chunk in pd.read_csv(csv_path, dtype=str, chunksize=chunk_size):
+        frame = pd.DataFrame({"text": chunk.iloc[:, 3], "source": chunk.iloc[:, 0].fillna("")})
+        if "content_hash" in chunk:
+            frame["hash"] = chunk["content_hash"]
+        yield frame
 
-    vec = TfidfVectorizer(stop_words=german_stop_words, max_df=0.85)
+
+def iter_db_chunks(db_path=DB_PATH, chunk_size=LOAD_CHUNK_SIZE, after_rowid=0):
+    from scraper import init_db
+    init_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        chunks = pd.read_sql_query("""
+            SELECT content AS text, source, author, content_hash AS hash
+            FROM unified_text
+            WHERE content IS NOT NULL AND rowid > ?
+            ORDER BY created_utc DESC
+        """, conn, params=(after_rowid,), chunksize=chunk_size)
+        query_seconds, rows = 0.0, 0
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            query_seconds += time.perf_counter() - started
+            if chunk is None:
+                break
+            rows += len(chunk)
+            yield chunk
+        record('sql_query', query_seconds, {'rows': rows}, query='cluster_texts')
+
+
+def near_duplicate_hashes(db_path=DB_PATH, threshold=NEAR_DUP_THRESHOLD):
+    """Content hashes of texts that have an earlier near-duplicate at threshold."""
+    from scraper import init_db
+    init_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        update_index(conn)
+        return duplicate_hashes(conn, threshold)
+
+
+def load_and_filter_texts(path, rules=None, chunk_size=LOAD_CHUNK_SIZE, after_rowid=0, exclude=None):
+    """Load texts from the export CSV or, for a .db path, straight from reddit_data.db.
+
+    Rows are read and filtered chunk by chunk; duplicates are dropped by content hash.
+    after_rowid limits database input to rows added after that unified_text rowid;
+    rows whose hash is in exclude (e.g. near_duplicate_hashes) are dropped.
+    """
+    path = Path(path)
+    if path.suffix == '.db':
+        chunks = iter_db_chunks(path, chunk_size, after_rowid)
+    else:
+        chunks = iter_csv_chunks(path, chunk_size)
+
+    filtered = []
+    seen = set()
+    for chunk in chunks:
+        chunk = filter_frame(chunk, rules)
+        if exclude and "hash" in chunk:
+            chunk = chunk[~chunk["hash"].isin(exclude)]
+        if "hash" in chunk:
+            dup = chunk["hash"].notna() & (chunk["hash"].isin(seen) | chunk["hash"].duplicated())
+            chunk = chunk[~dup]
+            seen.update(chunk["hash"].dropna())
+        filtered.extend(chunk[[c for c in ("text", "source", "hash") if c in chunk]].to_dict("records"))
+    return filtered
+
+
+def exact_engine(texts, n_clusters, k_range=(K_MIN, K_MAX)):
+    """Full-vocabulary TF-IDF and KMeans; best quality for small corpora."""
+    vec = TfidfVectorizer(stop_words=GERMAN_STOP_WORDS, max_df=MAX_DF)
     # X is a sparse matrix of shape (n_samples, n_features) where:
     # - Each row corresponds to a post or comment (as a TF-IDF vector)
     # - Each column corresponds to a unique word (feature) in the vocabulary
     # This matrix represents how important each word is in each text sample.
-    X = vec.fit_transform(texts)
+    with span('vectorize', engine='exact') as fields:
+        X = vec.fit_transform(texts)
+        fields['rows'] = X.shape[0]
+    if n_clusters is None:
+        n_clusters = choose_k(X, *k_range)
 
     km = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
     # labels is a 1D array of shape (n_samples,) containing the cluster index (0 to n_clusters-1)
     # for each corresponding row in X — i.e., each post or comment.
     # It tells us which cluster each text was assigned to by KMeans.
-    labels = km.fit_predict(X)
+    with span('fit', engine='exact') as fields:
+        labels = km.fit_predict(X)
+        fields.update(rows=X.shape[0], k=n_clusters)
+    featurizer = {'kind': 'vocabulary', 'vocabulary': {term: int(col) for term, col in vec.vocabulary_.items()},
+                  'weights': vec.idf_}
+    return X, labels, km.cluster_centers_, featurizer
 
-    n=5
-    token_limit=2000
 
-    reps = []
+def make_hasher():
+    return HashingVectorizer(stop_words=GERMAN_STOP_WORDS, n_features=HASH_FEATURES,
+                             alternate_sign=False, norm=None)
+
+
+def hashing_cache(root=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Feature cache for hashed term counts, versioned by the hasher's parameters."""
+    return FeatureCache(cache_version(make_hasher().get_params()), root, max_bytes)
+
+
+def hashed_counts(texts, batch_size=BATCH_SIZE, hashes=None, cache=None):
+    """Raw hashed term counts, looked up by content hash when a cache is given."""
+    hasher = make_hasher()
+
+    def vectorize(positions):
+        return sp.vstack([
+            hasher.transform([texts[i] for i in positions[start:start + batch_size]])
+            for start in range(0, len(positions), batch_size)
+        ]).tocsr()
+
+    if cache is not None:
+        return cache.fetch(hashes or [content_hash(text) for text in texts], vectorize)
+    return vectorize(list(range(len(texts))))
+
+
+def hashed_tfidf(texts, batch_size=BATCH_SIZE, hashes=None, cache=None):
+    """TF-IDF without a vocabulary: hash counts chunk by chunk, then reweight.
+
+    With a cache, raw hashed counts are looked up by content hash and only new
+    texts are vectorized; IDF is cheap and always refitted on the full corpus.
+    Returns the matrix and the per-feature weights (IDF, zero for dropped terms).
+    """
+    counts = hashed_counts(texts, batch_size, hashes, cache)
+
+    # same effect as TfidfVectorizer(max_df=...): drop terms found in too many texts
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    counts = counts @ sp.diags((df <= MAX_DF * counts.shape[0]).astype(np.float64))
+    counts.eliminate_zeros()
+
+    tfidf = TfidfTransformer()
+    X = tfidf.fit_transform(counts).tocsr()
+    return X, tfidf.idf_ * (df <= MAX_DF * counts.shape[0])
+
+
+def minibatch_engine(texts, n_clusters, batch_size=BATCH_SIZE, k_range=(K_MIN, K_MAX), epochs=3,
+                     hashes=None, cache=None):
+    """Hashed TF-IDF and MiniBatchKMeans fitted chunk by chunk; scales to large corpora."""
+    with span('vectorize', engine='minibatch') as fields:
+        X, weights = hashed_tfidf(texts, batch_size, hashes, cache)
+        fields['rows'] = X.shape[0]
+    if n_clusters is None:
+        n_clusters = choose_k(X, *k_range)
+    with span('fit', engine='minibatch') as fields:
+        labels, centers = fit_minibatch(X, n_clusters, batch_size, epochs)
+        fields.update(rows=X.shape[0], k=n_clusters)
+    return X, labels, centers, {'kind': 'hashed', 'weights': weights}
+
 
-    for cid in range(km.n_clusters):
+def fit_minibatch(X, n_clusters, batch_size=BATCH_SIZE, epochs=3):
+    km = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=min(batch_size, X.shape[0]),
+                         n_init=3)
+    rng = np.random.default_rng(42)
+    for _ in range(epochs):
+        order = rng.permutation(X.shape[0])
+        for start in range(0, X.shape[0], batch_size):
+            chunk = X[order[start:start + batch_size]]
+            if chunk.shape[0] >= n_clusters:
+                km.partial_fit(chunk)
+
+    labels = np.concatenate([
+        km.predict(X[start:start + batch_size])
+        for start in range(0, X.shape[0], batch_size)
+    ])
+    return labels, km.cluster_centers_
+
+
+def embedding_cache(model_name=EMBEDDING_MODEL, root=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Feature cache for sentence embeddings, versioned by model."""
+    return FeatureCache(cache_version({'model': model_name, 'normalize': True}), root, max_bytes)
+
+
+def embed_texts(texts, model_name=EMBEDDING_MODEL, batch_size=EMBED_BATCH_SIZE, hashes=None, cache=None):
+    """L2-normalized sentence embeddings from a local CPU model, computed in batches.
+
+    The model is only loaded when some texts are missing from the cache. Pass a local
+    directory as model_name (or set HF_HUB_OFFLINE=1) to run without network access.
+    """
+    model = None
+
+    def encode(positions):
+        nonlocal model
+        if model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise SystemExit("[ERROR] The embedding engine needs sentence-transformers: "
+                                 "pip install sentence-transformers")
+            model = SentenceTransformer(model_name, device='cpu')
+        return model.encode([texts[i] for i in positions], batch_size=batch_size,
+                            normalize_embeddings=True, convert_to_numpy=True,
+                            show_progress_bar=False).astype(np.float32)
+
+    if cache is not None:
+        return cache.fetch(hashes or [content_hash(text) for text in texts], encode)
+    return encode(list(range(len(texts))))
+
+
+def embedding_engine(texts, n_clusters, batch_size=BATCH_SIZE, k_range=(K_MIN, K_MAX),
+                     hashes=None, cache=None, model_name=EMBEDDING_MODEL):
+    """Sentence embeddings clustered with MiniBatchKMeans; groups texts by meaning, not vocabulary."""
+    with span('vectorize', engine='embedding') as fields:
+        E = embed_texts(texts, model_name, hashes=hashes, cache=cache)
+        fields['rows'] = E.shape[0]
+    if n_clusters is None:
+        n_clusters = choose_k(E, *k_range)
+    with span('fit', engine='embedding') as fields:
+        labels, centers = fit_minibatch(E, n_clusters, batch_size)
+        fields.update(rows=E.shape[0], k=n_clusters)
+    return E, labels, centers, {'kind': 'embedding', 'model': model_name}
+
+
+def featurize(featurizer, texts, batch_size=BATCH_SIZE, hashes=None, cache=None):
+    """Vectors for new texts in the feature space of a fitted engine."""
+    with span('vectorize', engine=featurizer['kind']) as fields:
+        fields['rows'] = len(texts)
+        if featurizer['kind'] == 'embedding':
+            return embed_texts(texts, featurizer['model'], hashes=hashes, cache=cache)
+        if featurizer['kind'] == 'hashed':
+            counts = hashed_counts(texts, batch_size, hashes, cache)
+        else:
+            counts = CountVectorizer(vocabulary=featurizer['vocabulary']).transform(texts)
+        return normalize(counts @ sp.diags(featurizer['weights'])).tocsr()
+
+
+def nearest_centers(X, centers, batch_size=BATCH_SIZE):
+    """Nearest centroid (euclidean, as KMeans assigns) and cosine distance to it for every row.
+
+    Texts without any known feature get distance 1, so they count as drift.
+    """
+    center_norms = np.linalg.norm(centers, axis=1)
+    labels, distances = [np.empty(0, dtype=int)], [np.empty(0)]
+    for start in range(0, X.shape[0], batch_size):
+        chunk = X[start:start + batch_size]
+        dots = np.asarray(chunk @ centers.T)
+        nearest = (center_norms ** 2 - 2 * dots).argmin(axis=1)
+        norms = row_norms(chunk) * center_norms[nearest]
+        cos = dots[np.arange(len(nearest)), nearest] / np.maximum(norms, 1e-12)
+        labels.append(nearest)
+        distances.append(1 - cos)
+    return np.concatenate(labels), np.concatenate(distances)
+
+
+def choose_k(X, k_min=K_MIN, k_max=K_MAX, sample_size=SILHOUETTE_SAMPLE):
+    """Pick the k with the best silhouette score on a random sample of rows."""
+    rng = np.random.default_rng(42)
+    sample = X[rng.choice(X.shape[0], min(sample_size, X.shape[0]), replace=False)]
+    k_max = min(k_max, sample.shape[0] - 1)
+    if k_max < k_min:
+        return max(1, min(k_min, sample.shape[0]))
+
+    best_k, best_score = k_min, -1.0
+    for k in range(k_min, k_max + 1):
+        labels = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3).fit_predict(sample)
+        if len(set(labels)) < 2:
+            continue
+        score = silhouette_score(sample, labels)
+        log("INFO", f"k={k}: silhouette {score:.4f}")
+        if score > best_score:
+            best_k, best_score = k, score
+    log("INFO", f"Chose k={best_k}")
+    return best_k
+
+
+def centroid_ranking(X, labels, centers):
+    """Cluster members ordered by cosine similarity to their centroid, most similar first."""
+    ranking = {}
+    for cid in range(len(centers)):
         idxs = np.where(labels == cid)[0]
         if len(idxs) == 0:
             continue
 
         cluster_vecs = X[idxs]
-        centroid = km.cluster_centers_[cid].reshape(1, -1)
+        centroid = centers[cid].reshape(1, -1)
         sims = cosine_similarity(cluster_vecs, centroid).flatten()
 
         # most similar first
-        sorted_idxs = idxs[np.argsort(sims)[::-1]]
-        cluster_samples = []
-
-        total_tokens = 0
-        for idx in sorted_idxs:
-            text = texts[idx]
-            approx_tokens = len(text) // 4
-            if total_tokens + approx_tokens > token_limit:
-                break
+        ranking[cid] = idxs[np.argsort(sims)[::-1]]
+    return ranking
 
-            cluster_samples.append({
-                "text": text,
-                "source": sources[idx]
-            })
-            total_tokens += approx_tokens
 
-            if len(cluster_samples) >= n:
+def ann_ranking(E, labels, centers, pool=REP_POOL):
+    """Up to pool members nearest each centroid, found through an HNSW index.
+
+    Avoids a dense similarity pass over every member of every cluster; the query is
+    widened until enough neighbours from the centroid's own cluster are found.
+    """
+    try:
+        import hnswlib
+    except ImportError:
+        log("WARN", "hnswlib not installed, ranking representatives by exact similarity")
+        return centroid_ranking(E, labels, centers)
+
+    index = hnswlib.Index(space='cosine', dim=E.shape[1])
+    index.init_index(max_elements=len(E), ef_construction=200, M=16)
+    index.add_items(E, np.arange(len(E)))
+
+    ranking = {}
+    for cid in range(len(centers)):
+        members = int(np.count_nonzero(labels == cid))
+        if not members:
+            continue
+        wanted = min(pool, members)
+        k = min(len(E), wanted * 4)
+        while True:
+            index.set_ef(max(k, 64))
+            ids = index.knn_query(centers[cid], k=k)[0][0]
+            ids = ids[labels[ids] == cid]
+            if len(ids) >= wanted or k == len(E):
                 break
+            k = min(len(E), k * 4)
+        ranking[cid] = ids[:wanted]
+    return ranking
 
+
+def candidate_similarity(texts):
+    """Pairwise cosine similarity of candidate texts by their word TF-IDF vectors."""
+    try:
+        vectors = TfidfVectorizer(stop_words=GERMAN_STOP_WORDS).fit_transform(texts)
+    except ValueError:
+        # only stop words or no words at all
+        return np.eye(len(texts))
+    return cosine_similarity(vectors)
+
+
+def mmr_pick(relevance, similarity, costs, n, budget, diversity=MMR_LAMBDA, dup_similarity=DUP_SIMILARITY):
+    """Greedy maximal marginal relevance under a token budget.
+
+    Each step takes the candidate with the best diversity * relevance minus
+    (1 - diversity) * its highest similarity to the texts already picked.
+    Candidates that no longer fit the budget or nearly duplicate a pick are skipped.
+    """
+    picked, spent = [], 0
+    open_ = [i for i in range(len(relevance)) if costs[i] <= budget]
+    closest = np.zeros(len(relevance))
+    while open_ and len(picked) < n:
+        scores = [diversity * relevance[i] - (1 - diversity) * closest[i] for i in open_]
+        best = open_[int(np.argmax(scores))]
+        picked.append(best)
+        spent += costs[best]
+        closest = np.maximum(closest, similarity[best])
+        open_ = [i for i in open_
+                 if i != best and spent + costs[i] <= budget and similarity[best, i] < dup_similarity]
+    return picked
+
+
+def select_representatives(ranking, texts, sources, n=REPS_PER_CLUSTER, token_limit=REP_TOKENS,
+                           budgets=None, diversity=MMR_LAMBDA, relevance=None, count_tokens=None):
+    """Pick up to n diverse representatives per cluster within a token budget.
+
+    ranking maps cluster ids to member indices, most central first; the first
+    REP_POOL are candidates. relevance optionally maps cluster ids to a score per
+    ranked member (defaults to falling linearly with rank). budgets overrides
+    token_limit for single clusters. diversity=1 keeps the pure centrality order.
+    """
+    count_tokens = count_tokens or token_counter()
+    budgets = budgets or {}
+    reps = []
+
+    for cid, sorted_idxs in sorted(ranking.items()):
+        candidates = list(sorted_idxs)[:REP_POOL]
+        if relevance and cid in relevance:
+            scores = np.asarray(relevance[cid], dtype=float)[:len(candidates)]
+        else:
+            scores = 1 - np.arange(len(candidates)) / max(len(candidates), 1)
+        candidate_texts = [texts[idx] for idx in candidates]
+        costs = [count_tokens(text) for text in candidate_texts]
+        similarity = candidate_similarity(candidate_texts) if len(candidates) > 1 else np.eye(len(candidates))
+
+        picked = mmr_pick(scores, similarity, costs, n, budgets.get(cid, token_limit), diversity)
         reps.append({
             "cluster": cid,
-            "samples": cluster_samples
+            "samples": [{"text": texts[candidates[i]], "source": sources[candidates[i]]} for i in picked],
+            "tokens": sum(costs[i] for i in picked),
         })
 
     return reps
 
 
-if __name__ == '__main__':
-    data = load_and_filter_texts(CSV_INPUT_PATH)
-    reps = cluster_texts(data, N_CLUSTERS)
-    with open(CSV_OUTPUT_PATH, mode="w", newline="", encoding="utf-8") as f:
+def fit_clusters(filtered_data, n_clusters=N_CLUSTERS, engine='exact', batch_size=BATCH_SIZE,
+                 k_range=(K_MIN, K_MAX), cache=None, embedding_model=EMBEDDING_MODEL):
+    """Vectorize and cluster texts with one engine. n_clusters=None chooses k automatically.
+
+    cache is an optional FeatureCache (hashing_cache for the minibatch engine,
+    embedding_cache for the embedding engine).
+    """
+    texts = [entry["text"] for entry in filtered_data]
+    hashes = [entry.get("hash") or content_hash(entry["text"]) for entry in filtered_data]
+
+    if engine == 'auto':
+        engine = 'exact' if len(texts) <= EXACT_MAX_TEXTS else 'minibatch'
+    log("INFO", f"Clustering {len(texts)} texts with the {engine} engine")
+
+    if engine == 'exact':
+        X, labels, centers, featurizer = exact_engine(texts, n_clusters, k_range)
+    elif engine == 'minibatch':
+        X, labels, centers, featurizer = minibatch_engine(texts, n_clusters, batch_size, k_range,
+                                                          hashes=hashes, cache=cache)
+    elif engine == 'embedding':
+        X, labels, centers, featurizer = embedding_engine(texts, n_clusters, batch_size, k_range,
+                                                          hashes=hashes, cache=cache,
+                                                          model_name=embedding_model)
+    else:
+        raise ValueError(f"Unknown clustering engine: {engine}")
+
+    return {
+        "engine": engine,
+        "X": X,
+        "labels": labels,
+        "centers": centers,
+        "featurizer": featurizer,
+        "texts": texts,
+        "sources": [entry["source"] for entry in filtered_data],
+        "hashes": hashes,
+    }
+
+
+def cluster_texts(filtered_data, n_clusters=N_CLUSTERS, engine='exact', batch_size=BATCH_SIZE,
+                  k_range=(K_MIN, K_MAX), cache=None, embedding_model=EMBEDDING_MODEL):
+    """Cluster texts and pick representatives. n_clusters=None chooses k automatically."""
+    fit = fit_clusters(filtered_data, n_clusters, engine, batch_size, k_range, cache, embedding_model)
+    rank = ann_ranking if fit["engine"] == 'embedding' else centroid_ranking
+    reps = select_representatives(rank(fit["X"], fit["labels"], fit["centers"]), fit["texts"], fit["sources"])
+    sizes = np.bincount(fit["labels"], minlength=len(fit["centers"]))
+    for rep in reps:
+        rep["size"] = int(sizes[rep["cluster"]])
+    return reps
+
+
+def max_rowid(db_path=DB_PATH):
+    from scraper import init_db
+    init_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM unified_text").fetchone()[0]
+
+
+def previous_assignments(conn, hashes):
+    """Return {position: (cluster id, distance)} for hashes that already have a stored assignment."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (pos INTEGER, hash TEXT)")
+    conn.execute("DELETE FROM wanted")
+    conn.executemany("INSERT INTO wanted VALUES (?, ?)", enumerate(hashes))
+    found = {
+        pos: (cluster, distance)
+        for pos, cluster, distance in conn.execute("""
+            SELECT w.pos, a.cluster, a.distance
+            FROM wanted w JOIN cluster_assignments a ON a.content_hash = w.hash
+        """)
+    }
+    conn.execute("DELETE FROM wanted")
+    return found
+
+
+def stable_ids(previous, labels, n_clusters, next_id=0):
+    """Map fitted labels to cluster ids that persist across refits.
+
+    Each new cluster takes the old id it shares the most texts with (one-to-one,
+    maximizing the total overlap); clusters without overlap get fresh ids. Texts
+    count by their similarity to the old centroid, so outliers that were only
+    assigned to it for lack of a better cluster carry no weight.
+    """
+    old_ids = sorted({old for old, _ in previous.values()})
+    next_id = max([next_id] + [old + 1 for old in old_ids])
+    column = {old: col for col, old in enumerate(old_ids)}
+    overlap = np.zeros((n_clusters, len(old_ids)))
+    for pos, (old, distance) in previous.items():
+        overlap[labels[pos], column[old]] += max(0.0, 1 - (distance or 0.0))
+
+    ids = [None] * n_clusters
+    if old_ids:
+        for row, col in zip(*linear_sum_assignment(-overlap)):
+            if overlap[row, col] > 0:
+                ids[row] = old_ids[col]
+    for row in range(n_clusters):
+        if ids[row] is None:
+            ids[row] = next_id
+            next_id += 1
+    return ids, next_id
+
+
+def store_assignments(conn, hashes, ids, distances, replace=False):
+    now = time.time()
+    with conn:
+        if replace:
+            conn.execute("DELETE FROM cluster_assignments")
+        conn.executemany(
+            "INSERT OR REPLACE INTO cluster_assignments (content_hash, cluster, distance, assigned_utc) "
+            "VALUES (?, ?, ?, ?)",
+            ((h, int(cid), float(dist), now) for h, cid, dist in zip(hashes, ids, distances))
+        )
+
+
+def merge_pool(pool, members, distances, texts, sources, hashes):
+    """Keep the REP_POOL texts nearest the centroid as representative candidates."""
+    known = {entry["hash"] for entry in pool}
+    nearest = members[np.argsort(distances[members])][:REP_POOL]
+    pool = pool + [
+        {"hash": hashes[i], "source": sources[i], "text": texts[i], "distance": float(distances[i])}
+        for i in nearest if hashes[i] not in known
+    ]
+    return sorted(pool, key=lambda entry: entry["distance"])[:REP_POOL]
+
+
+def fit_model(filtered_data, db_path=DB_PATH, rowid=0, previous=None, **fit_options):
+    """Fit clusters and keep what is needed to assign new texts to them later.
+
+    Cluster ids are carried over from the stored assignments of the previous fit,
+    so a refit keeps the ids of clusters that still hold the same texts.
+    rowid is the unified_text rowid the input data reaches up to.
+    """
+    from scraper import init_db
+    fit = fit_clusters(filtered_data, **fit_options)
+    labels, distances = nearest_centers(fit["X"], fit["centers"])
+    n_clusters = len(fit["centers"])
+    # embeddings: look up each centroid's candidates in the HNSW index instead of sorting every member
+    nearest = ann_ranking(fit["X"], labels, fit["centers"]) if fit["engine"] == 'embedding' else {}
+
+    init_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        ids, next_id = stable_ids(previous_assignments(conn, fit["hashes"]), labels, n_clusters,
+                                  previous["next_id"] if previous else 0)
+        store_assignments(conn, fit["hashes"], np.array(ids)[labels], distances, replace=True)
+
+    clusters = []
+    for label in range(n_clusters):
+        members = np.where(labels == label)[0]
+        clusters.append({
+            "id": ids[label],
+            "size": int(len(members)),
+            "pool": merge_pool([], nearest.get(label, members), distances, fit["texts"], fit["sources"],
+                               fit["hashes"]),
+        })
+
+    return {
+        "engine": fit["engine"],
+        "featurizer": fit["featurizer"],
+        "centers": fit["centers"],
+        "clusters": clusters,
+        "next_id": next_id,
+        "rowid": rowid,
+        "baseline": float(distances.mean()) if len(distances) else 0.0,
+        "assigned": 0,
+        "assigned_distance": 0.0,
+        "fitted_utc": time.time(),
+    }
+
+
+def assign_new(model, db_path=DB_PATH, rules=None, chunk_size=LOAD_CHUNK_SIZE, batch_size=BATCH_SIZE,
+               cache=None, exclude=None):
+    """Assign texts added to the database since the model's last run to their nearest centroids."""
+    rowid = max_rowid(db_path)
+    data = load_and_filter_texts(db_path, rules, chunk_size, after_rowid=model["rowid"], exclude=exclude)
+    log("INFO", f"Assigning {len(data)} new texts to {len(model['clusters'])} clusters")
+    if data:
+        texts = [entry["text"] for entry in data]
+        sources = [entry["source"] for entry in data]
+        hashes = [entry.get("hash") or content_hash(entry["text"]) for entry in data]
+        X = featurize(model["featurizer"], texts, batch_size, hashes, cache)
+        labels, distances = nearest_centers(X, model["centers"], batch_size)
+        ids = np.array([cluster["id"] for cluster in model["clusters"]])
+
+        with sqlite3.connect(db_path) as conn:
+            store_assignments(conn, hashes, ids[labels], distances)
+        for label, cluster in enumerate(model["clusters"]):
+            members = np.where(labels == label)[0]
+            cluster["size"] += int(len(members))
+            cluster["pool"] = merge_pool(cluster["pool"], members, distances, texts, sources, hashes)
+        model["assigned"] += len(data)
+        model["assigned_distance"] += float(distances.sum())
+
+    model["rowid"] = rowid
+    return model
+
+
+def drift(model):
+    """Relative increase of the mean centroid distance of assigned texts over the fit."""
+    if model["assigned"] < DRIFT_MIN_ROWS or not model["baseline"]:
+        return 0.0
+    return model["assigned_distance"] / model["assigned"] / model["baseline"] - 1
+
+
+def model_reps(model, **options):
+    """Representatives from the saved candidate pools; options go to select_representatives."""
+    texts, sources, ranking, relevance = [], [], {}, {}
+    for cluster in model["clusters"]:
+        ranking[cluster["id"]] = range(len(texts), len(texts) + len(cluster["pool"]))
+        relevance[cluster["id"]] = [1 - entry["distance"] for entry in cluster["pool"]]
+        texts.extend(entry["text"] for entry in cluster["pool"])
+        sources.extend(entry["source"] for entry in cluster["pool"])
+    reps = select_representatives(ranking, texts, sources, relevance=relevance, **options)
+    sizes = {cluster["id"]: cluster["size"] for cluster in model["clusters"]}
+    for rep in reps:
+        rep["size"] = sizes[rep["cluster"]]
+    return reps
+
+
+def save_model(model, model_dir=MODEL_DIR):
+    """Write model.json plus the centroids and feature weights as arrays.npz."""
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    arrays = {"centers": model["centers"]}
+    if "weights" in model["featurizer"]:
+        arrays["weights"] = model["featurizer"]["weights"]
+    np.savez_compressed(model_dir / "arrays.npz", **arrays)
+
+    meta = {key: value for key, value in model.items() if key != "centers"}
+    meta["featurizer"] = {key: value for key, value in model["featurizer"].items() if key != "weights"}
+    (model_dir / "model.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+
+def load_model(model_dir=MODEL_DIR):
+    model_dir = Path(model_dir)
+    if not (model_dir / "model.json").exists():
+        return None
+    model = json.loads((model_dir / "model.json").read_text(encoding="utf-8"))
+    arrays = np.load(model_dir / "arrays.npz")
+    model["centers"] = arrays["centers"]
+    if "weights" in arrays:
+        model["featurizer"]["weights"] = arrays["weights"]
+    return model
+
+
+def feature_cache(engine, embedding_model=EMBEDDING_MODEL, root=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    if engine == 'embedding':
+        return embedding_cache(embedding_model, root, max_bytes)
+    if engine == 'exact':
+        return None
+    return hashing_cache(root, max_bytes)
+
+
+def export_rowid(csv_path):
+    """unified_text rowid an export CSV was written up to, 0 when unknown."""
+    from export_all_to_csv import load_state
+    return load_state(Path(csv_path))["rowid"]
+
+
+def parse_k(value):
+    return None if value == 'auto' else int(value)
+
+
+def parse_budget(value):
+    cluster_id, _, tokens = value.partition('=')
+    try:
+        return int(cluster_id), int(tokens)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected CLUSTER=TOKENS, got {value!r}")
+
+
+def write_reps(reps, csv_path):
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow(["cluster", "source", "text"])
+        writer.writerow(["cluster", "source", "text", "cluster_size"])
         for rep in reps:
             cluster_id = rep["cluster"]
             for sample in rep["samples"]:
-                writer.writerow([cluster_id, sample["source"], sample["text"]])
-    print(f"✅ Clustered texts written to {CSV_OUTPUT_PATH}")
+                writer.writerow([cluster_id, sample["source"], sample["text"], rep.get("size", "")])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Cluster exported posts and comments.")
+    parser.add_argument('--input', type=Path, default=CSV_INPUT_PATH,
+                        help="Export CSV, or reddit_data.db to read the database directly")
+    parser.add_argument('--output', type=Path, default=CSV_OUTPUT_PATH)
+    parser.add_argument('--engine', choices=ENGINES, default='auto',
+                        help="exact: TF-IDF + KMeans, minibatch: hashed TF-IDF + MiniBatchKMeans, "
+                             "embedding: sentence embeddings + MiniBatchKMeans (needs sentence-transformers), "
+                             f"auto: exact up to {EXACT_MAX_TEXTS} texts")
+    parser.add_argument('--embedding-model', default=EMBEDDING_MODEL,
+                        help="sentence-transformers model name or local directory for the embedding engine")
+    parser.add_argument('-k', '--clusters', type=parse_k, default=N_CLUSTERS,
+                        help="Number of clusters, or 'auto' to pick k by sampled silhouette score")
+    parser.add_argument('--k-min', type=int, default=K_MIN)
+    parser.add_argument('--k-max', type=int, default=K_MAX)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="Rows per chunk for the minibatch engine")
+    parser.add_argument('--from-db', action='store_true',
+                        help=f"Read from {DB_PATH.name} instead of the export CSV")
+    parser.add_argument('--min-words', type=int, default=MIN_WORDS,
+                        help="Drop texts with fewer words")
+    parser.add_argument('--deleted-markers', nargs='*', default=list(DELETED_MARKERS),
+                        help="Texts equal to one of these markers are dropped")
+    parser.add_argument('--exclude-authors', nargs='*', default=list(DEFAULT_RULES["bot_authors"]),
+                        help="Authors to drop (database input only)")
+    parser.add_argument('--bot-pattern',
+                        help="Regex; authors matching it are dropped, e.g. '(?i)bot$'")
+    parser.add_argument('--language',
+                        help="Keep only texts detected as this language code, e.g. de (needs langdetect)")
+    parser.add_argument('--chunk-size', type=int, default=LOAD_CHUNK_SIZE,
+                        help="Rows read and filtered per chunk")
+    parser.add_argument('--cache-dir', type=Path, default=CACHE_DIR,
+                        help="Directory of the per-text feature cache (minibatch and embedding engines)")
+    parser.add_argument('--cache-max-mb', type=int, default=MAX_CACHE_BYTES // 2 ** 20,
+                        help="Evict least recently used cache shards above this size")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Vectorize everything from scratch")
+    parser.add_argument('--assign', action='store_true',
+                        help="Assign texts added to the database (--input if it is a .db, else "
+                             f"{DB_PATH.name}) since the last run to the saved clusters instead of refitting")
+    parser.add_argument('--model-dir', type=Path, default=MODEL_DIR,
+                        help="Where the fitted clustering model is saved and loaded")
+    parser.add_argument('--drift-threshold', type=float, default=DRIFT_THRESHOLD,
+                        help="With --assign, refit once the mean centroid distance of assigned texts "
+                             "exceeds the fit's by this fraction")
+    parser.add_argument('--near-dup-threshold', type=float, nargs='?', const=NEAR_DUP_THRESHOLD,
+                        help="Cluster one text per group of near-duplicates at this estimated similarity "
+                             f"(default {NEAR_DUP_THRESHOLD})")
+    parser.add_argument('--reps', type=int, default=REPS_PER_CLUSTER,
+                        help="Representatives per cluster")
+    parser.add_argument('--rep-tokens', type=int, default=REP_TOKENS,
+                        help="Token budget for each cluster's representatives")
+    parser.add_argument('--cluster-tokens', type=parse_budget, nargs='*', default=[], metavar='CLUSTER=TOKENS',
+                        help="Token budget for single clusters, e.g. 3=4000")
+    parser.add_argument('--diversity', type=float, default=MMR_LAMBDA,
+                        help="MMR trade-off: 1.0 picks the most central texts, lower values more diverse ones")
+    parser.add_argument('--token-model', default=OPENAI_MODEL,
+                        help="Model whose tokenizer counts representative tokens (needs tiktoken)")
+    return parser
+
+
+def run(args):
+    """Cluster (or assign) texts as configured by build_parser() and return the representatives."""
+    rules = {
+        "min_words": args.min_words,
+        "deleted_markers": args.deleted_markers,
+        "bot_authors": args.exclude_authors,
+        "bot_pattern": args.bot_pattern,
+        "language": args.language,
+    }
+    max_bytes = args.cache_max_mb * 2 ** 20
+    # assignments, the near-duplicate index and the rowid high-water mark all come from
+    # the database the texts are read from; an export CSV stands for the default one
+    db_path = args.input if Path(args.input).suffix == '.db' else DB_PATH
+    exclude = None
+    if args.near_dup_threshold is not None:
+        exclude = near_duplicate_hashes(db_path, args.near_dup_threshold)
+        log("INFO", f"Collapsing {len(exclude)} near-duplicate texts")
+    model = load_model(args.model_dir)
+    engine, embedding_model = args.engine, args.embedding_model
+    input_path = db_path if args.from_db or args.assign else args.input
+    refit = not args.assign
+
+    if args.assign and model is None:
+        log("WARN", f"No clustering model in {args.model_dir}, fitting one")
+        refit = True
+    elif args.assign:
+        embedding_model = model["featurizer"].get("model", embedding_model)
+        cache = None if args.no_cache else feature_cache(model["engine"], embedding_model, args.cache_dir, max_bytes)
+        model = assign_new(model, db_path, rules, args.chunk_size, args.batch_size, cache, exclude)
+        score = drift(model)
+        log("INFO", f"Cluster drift {score:.1%}")
+        if score > args.drift_threshold:
+            log("WARN", f"Drift exceeds {args.drift_threshold:.0%}, refitting all clusters")
+            engine = model["engine"]
+            refit = True
+
+    if refit:
+        rowid = max_rowid(db_path) if Path(input_path).suffix == '.db' else export_rowid(input_path)
+        data = load_and_filter_texts(input_path, rules, args.chunk_size, exclude=exclude)
+        cache = None if args.no_cache else feature_cache(engine, embedding_model, args.cache_dir, max_bytes)
+        model = fit_model(data, db_path, rowid, model, n_clusters=args.clusters, engine=engine,
+                          batch_size=args.batch_size, k_range=(args.k_min, args.k_max), cache=cache,
+                          embedding_model=embedding_model)
+
+    save_model(model, args.model_dir)
+    reps = model_reps(model, n=args.reps, token_limit=args.rep_tokens, budgets=dict(args.cluster_tokens),
+                      diversity=args.diversity, count_tokens=token_counter(args.token_model))
+    write_reps(reps, args.output)
+    log("INFO", f"Clustered texts written to {args.output}")
+    return reps
+
+
+def main(argv=None):
+    parser = build_parser()
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.configure_from_args(args)
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,42 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
 import pandas as pd
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, OpenAI, RateLimitError
 from pathlib import Path
 from dotenv import load_dotenv
 
-CSV_PATH = Path(__file__).resolve().parent / "clustered_representatives.csv"
-
-load_dotenv()
-client = OpenAI()
+import instrumentation
+from instrumentation import count, log, span
+from tokens import CONTEXT_WINDOWS, OPENAI_MODEL, estimate_cost, token_counter, token_truncator
 
+CSV_PATH = Path(__file__).resolve().parent / "clustered_representatives.csv"
+CACHE_DIR = Path(__file__).resolve().parent / ".llm_cache"
+TEMPERATURE = 0.7
+CONCURRENCY = 4             # simultaneous OpenAI requests in map-reduce mode
+RETRIES = 4                 # extra attempts after a rate limit, timeout or server error
+BACKOFF = 2.0               # seconds, doubled on every retry
+RETRYABLE = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+MAX_PROMPT_TOKENS = 12000   # budget for one prompt including the instructions
+MAX_OUTPUT_TOKENS = 4096
+SUMMARY_OUTPUT_TOKENS = 600 # per cluster summary in map-reduce mode
+MIN_SNIPPET_TOKENS = 40     # shorter truncated samples are dropped instead
+MESSAGE_OVERHEAD = 4        # tokens the chat format adds per message
 
-def load_clustered_reps(csv_path):
-    df = pd.read_csv(csv_path)
-    reps = []
-    for cluster_id in sorted(df['cluster'].unique()):
-        cluster_df = df[df['cluster'] == cluster_id]
-        samples = [
-            {"source": row['source'], "text": row['text']}
-            for _, row in cluster_df.iterrows()
-        ]
-        reps.append({
-            "cluster": cluster_id,
-            "samples": samples
-        })
-    return reps
-
-def build_openai_prompt(reps):
-    blocks = []
-    for rep in reps:
-        block = f"Cluster {rep['cluster']}:\n"
-        for sample in rep["samples"]:
-            snippet = sample["text"].strip()
-            block += f"- ({sample['source']}): [ANFANG] {snippet} [ENDE]\n"
-        blocks.append(block)
+SYSTEM_PROMPT = (
+    "Du bist ein erfahrener deutscher Content-Stratege für Instagram. "
+    "Du entwickelst Carousel-Posts für @franklin_ias – ein Bildungsinstitut, das Erwachsenen zwischen 25 und 45 Jahren hilft, sich beruflich neu zu orientieren, weiterzubilden oder eine Umschulung zu machen. "
+    "Deine Sprache ist aktivierend, verständlich, sympathisch und auf die Zielgruppe zugeschnitten. "
+    "Du nutzt konkrete Sprache, vermeidest Floskeln und beziehst dich auf reale Erfahrungen."
+)
 
-    return f"""
-Hier sind Cluster von Reddit-Posts und -Kommentaren zu Themen wie Quereinstieg, Weiterbildung, Arbeitslosigkeit und Umschulung. 
+TASK = """
+Hier sind Cluster von Reddit-Posts und -Kommentaren zu Themen wie Quereinstieg, Weiterbildung, Arbeitslosigkeit und Umschulung.
 Bitte analysiere sie tief und gib eine strukturierte Antwort auf **Deutsch** zurück:
 
 ---
@@ -49,7 +50,7 @@ Fasse die wichtigsten Erkenntnisse, wiederkehrenden Probleme, Chancen oder Meinu
 Für jeden Post gib bitte folgende Struktur zurück (alles auf Deutsch, kein Englisch):
 
 - **Titel:** Kurz & klar
-- **Format-Typ:** (z. B. Story, Vergleich, Zitat, Anleitung…)
+- **Format-Typ:** (z. B. Story, Vergleich, Zitat, Anleitung…)
 - **Slides:** Eine Liste von 5 Slides mit echtem Text (max. 250 Zeichen pro Slide)
   - Slide 1: Hook
   - Slide 2–4: Inhaltliche Aufbereitung
@@ -60,27 +61,402 @@ Schreibe den tatsächlichen Text pro Slide, nicht nur eine Beschreibung. Nutze e
 ---
 
 **Datenbasis:**
-{'\n\n'.join(blocks)}
+{data}
 """
 
-def call_openai(prompt):
-    response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        temperature=0.7,
-        messages=[
-            {"role": "system", "content": (
-            "Du bist ein erfahrener deutscher Content-Stratege für Instagram. "
-            "Du entwickelst Carousel-Posts für @franklin_ias – ein Bildungsinstitut, das Erwachsenen zwischen 25 und 45 Jahren hilft, sich beruflich neu zu orientieren, weiterzubilden oder eine Umschulung zu machen. "
-            "Deine Sprache ist aktivierend, verständlich, sympathisch und auf die Zielgruppe zugeschnitten. "
-            "Du nutzt konkrete Sprache, vermeidest Floskeln und beziehst dich auf reale Erfahrungen."
-        )},
-            {"role": "user", "content": prompt}
+CLUSTER_SUMMARY_TASK = """
+Hier ist ein Cluster von Reddit-Posts und -Kommentaren zu Themen wie Quereinstieg, Weiterbildung, Arbeitslosigkeit und Umschulung.
+Fasse ihn auf **Deutsch** in höchstens 200 Wörtern zusammen:
+
+- Worum geht es in dem Cluster?
+- Welche Sorgen, Fragen, Probleme und Chancen werden genannt?
+- 2–3 kurze, wörtliche Zitate, die die Stimmung gut einfangen.
+
+{data}
+"""
+
+SUMMARIES_NOTE = "(Zusammenfassungen der einzelnen Cluster; die Zitate stammen wörtlich aus Reddit.)"
+
+
+def load_clustered_reps(csv_path):
+    df = pd.read_csv(csv_path)
+    reps = []
+    for cluster_id in sorted(df['cluster'].unique()):
+        cluster_df = df[df['cluster'] == cluster_id]
+        samples = [
+            {"source": row['source'], "text": row['text']}
+            for _, row in cluster_df.iterrows()
         ]
-    )
-    return response.choices[0].message.content
+        # older CSVs have no cluster_size; the sample count stands in for it
+        size = cluster_df['cluster_size'].iloc[0] if 'cluster_size' in cluster_df else None
+        reps.append({
+            "cluster": cluster_id,
+            "samples": samples,
+            "size": int(size) if pd.notna(size) else len(samples),
+        })
+    return reps
+
+
+def cluster_header(rep):
+    return f"Cluster {rep['cluster']}:\n"
+
+
+def sample_line(sample):
+    return f"- ({sample['source']}): [ANFANG] {sample['text'].strip()} [ENDE]\n"
+
+
+def cluster_block(rep):
+    return ''.join([cluster_header(rep)] + [sample_line(sample) for sample in rep["samples"]])
+
+
+def allocate_budget(needs, sizes, budget):
+    """Split a token budget across clusters in proportion to their size.
+
+    Clusters that need less than their share keep only what they need, and the
+    rest is shared among the others in the same way.
+    """
+    allocation = {}
+    open_ = set(needs)
+    # empty or unknown sizes still get a share; they must count towards the total too
+    weights = {c: sizes[c] or 1 for c in needs}
+    while open_:
+        total = sum(weights[c] for c in open_)
+        share = {c: budget * weights[c] / total for c in open_}
+        satisfied = {c for c in open_ if needs[c] <= share[c]}
+        if not satisfied:
+            allocation.update({c: int(share[c]) for c in open_})
+            break
+        for c in satisfied:
+            allocation[c] = needs[c]
+            budget -= needs[c]
+        open_ -= satisfied
+    return allocation
+
+
+def pack_reps(reps, budget, model=OPENAI_MODEL):
+    """Fit cluster samples into budget tokens, allocated across clusters by cluster size.
+
+    Samples are kept in their ranked order. The first one that does not fit is
+    truncated to the space left, or dropped if that would be under
+    MIN_SNIPPET_TOKENS, and the cluster ends there.
+    """
+    count, truncate = token_counter(model), token_truncator(model)
+    needs = {i: count(cluster_block(rep)) for i, rep in enumerate(reps)}
+    # the blank lines between blocks, and tokens that a joined text counts differently
+    # than its parts, come out of the budget up front
+    allocation = allocate_budget(needs, {i: rep.get("size", len(rep["samples"])) for i, rep in enumerate(reps)},
+                                 budget - 2 * len(reps))
+
+    packed = []
+    truncated = dropped = 0
+    for i, rep in enumerate(reps):
+        # whole blocks are counted, since their token count is not the sum of their lines'
+        def block_tokens(samples, rep=rep):
+            return count(cluster_block({**rep, "samples": samples}))
+
+        samples = []
+        for sample in rep["samples"]:
+            if block_tokens(samples + [sample]) <= allocation[i]:
+                samples.append(sample)
+                continue
+            # the ellipsis and line frame cost tokens too
+            room = allocation[i] - block_tokens(samples + [{**sample, "text": "…"}])
+            while room >= MIN_SNIPPET_TOKENS:
+                cut = {**sample, "text": truncate(sample["text"].strip(), room) + "…"}
+                over = block_tokens(samples + [cut]) - allocation[i]
+                if over <= 0:
+                    samples.append(cut)
+                    truncated += 1
+                    break
+                room -= over
+            break
+        dropped += len(rep["samples"]) - len(samples)
+        if samples:
+            packed.append({**rep, "samples": samples})
+        else:
+            log("WARN", f"No sample of cluster {rep['cluster']} fits its {allocation[i]} token share")
+
+    if truncated or dropped:
+        log("INFO", f"Packing: {truncated} samples truncated, {dropped} dropped to fit {budget} tokens")
+    return packed
+
+
+def chat_tokens(prompt, model=OPENAI_MODEL):
+    count = token_counter(model)
+    return count(SYSTEM_PROMPT) + count(prompt) + 3 * MESSAGE_OVERHEAD
+
+
+def data_budget(template, max_prompt_tokens, model=OPENAI_MODEL):
+    """Tokens left for the cluster data once the instructions are counted."""
+    return max_prompt_tokens - chat_tokens(template.format(data=""), model)
+
+
+def report_prompt(label, prompt_tokens, model=OPENAI_MODEL, max_output_tokens=MAX_OUTPUT_TOKENS):
+    cost = estimate_cost(model, prompt_tokens, max_output_tokens)
+    cost_text = f"~${estimate_cost(model, prompt_tokens):.4f} input, at most ${cost:.4f}" if cost is not None \
+        else "no price known for this model"
+    log("INFO", f"{label}: {prompt_tokens} prompt tokens, up to {max_output_tokens} output tokens, {cost_text}")
+
+
+def build_openai_prompt(reps):
+    blocks = [cluster_block(rep) for rep in reps]
+    return TASK.format(data='\n\n'.join(blocks))
+
+
+def build_summary_prompt(rep):
+    return CLUSTER_SUMMARY_TASK.format(data=cluster_block(rep))
+
+
+def build_reduce_prompt(summaries, budget=None, model=OPENAI_MODEL):
+    """Prompt for the carousel ideas from (cluster id, summary, cluster size) tuples.
+
+    With a budget, summaries are truncated to token shares allocated by cluster size.
+    """
+    blocks = [f"Cluster {cluster_id}:\n{summary.strip()}" for cluster_id, summary, _ in summaries]
+    if budget is not None:
+        count, truncate = token_counter(model), token_truncator(model)
+        budget -= count(SUMMARIES_NOTE) + 2 * len(blocks)
+        allocation = allocate_budget({i: count(block) for i, block in enumerate(blocks)},
+                                     {i: size for i, (_, _, size) in enumerate(summaries)}, budget)
+        blocks = [block if count(block) <= allocation[i] else truncate(block, allocation[i] - 1) + "…"
+                  for i, block in enumerate(blocks)]
+    return TASK.format(data=SUMMARIES_NOTE + '\n\n' + '\n\n'.join(blocks))
+
+
+def chat_messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def cache_key(model, messages, max_tokens, temperature=TEMPERATURE):
+    payload = json.dumps({"model": model, "temperature": temperature, "max_tokens": max_tokens,
+                          "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cached_response(cache_dir, key):
+    if cache_dir is None:
+        return None
+    path = Path(cache_dir) / f"{key}.json"
+    return json.loads(path.read_text(encoding='utf-8'))["content"] if path.exists() else None
+
+
+def store_response(cache_dir, key, content):
+    if cache_dir is None:
+        return
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f"{key}.tmp"
+    tmp.write_text(json.dumps({"content": content}, ensure_ascii=False), encoding='utf-8')
+    tmp.replace(cache_dir / f"{key}.json")
+
+
+def make_client(base_url=None, is_async=False):
+    """OpenAI client; base_url (or OPENAI_BASE_URL) can point at a local mock server."""
+    base_url = base_url or os.getenv("OPENAI_BASE_URL")
+    # a local mock server does not check the key, but the SDK insists on one
+    api_key = os.getenv("OPENAI_API_KEY") or ("local" if base_url else None)
+    cls = AsyncOpenAI if is_async else OpenAI
+    # retries are handled here so backoff and logging are the same in both modes
+    return cls(base_url=base_url, api_key=api_key, max_retries=0)
+
+
+def record_usage(response, model, fields):
+    """Token counts reported by the API, as span fields and counters."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    fields.update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    count('openai_tokens', usage.prompt_tokens, model=model, type='prompt')
+    count('openai_tokens', usage.completion_tokens, model=model, type='completion')
+
+
+def retry_delay(backoff, attempt):
+    # jitter keeps concurrent requests from retrying in lockstep
+    return backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def call_openai(prompt, client=None, model=OPENAI_MODEL, cache_dir=CACHE_DIR, retries=RETRIES, backoff=BACKOFF,
+                max_tokens=MAX_OUTPUT_TOKENS):
+    client = client or make_client()
+    messages = chat_messages(prompt)
+    key = cache_key(model, messages, max_tokens)
+    content = cached_response(cache_dir, key)
+    if content is not None:
+        log("INFO", "Using cached response")
+        count('llm_cache_hits', model=model)
+        return content
+
+    for attempt in range(retries + 1):
+        try:
+            with span('openai_request', model=model) as fields:
+                response = client.chat.completions.create(model=model, temperature=TEMPERATURE,
+                                                          messages=messages, max_tokens=max_tokens)
+                record_usage(response, model, fields)
+            break
+        except RETRYABLE as e:
+            count('openai_retries', model=model, error=e.__class__.__name__)
+            if attempt == retries:
+                raise
+            delay = retry_delay(backoff, attempt)
+            log("WARN", f"OpenAI request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    content = response.choices[0].message.content
+    store_response(cache_dir, key, content)
+    return content
+
+
+async def call_openai_async(client, prompt, semaphore, label, model=OPENAI_MODEL, cache_dir=CACHE_DIR,
+                            retries=RETRIES, backoff=BACKOFF, max_tokens=MAX_OUTPUT_TOKENS):
+    messages = chat_messages(prompt)
+    key = cache_key(model, messages, max_tokens)
+    content = cached_response(cache_dir, key)
+    if content is not None:
+        log("INFO", f"{label}: cached")
+        count('llm_cache_hits', model=model)
+        return content
+
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                with span('openai_request', model=model) as fields:
+                    fields['label'] = label
+                    response = await client.chat.completions.create(model=model, temperature=TEMPERATURE,
+                                                                    messages=messages, max_tokens=max_tokens)
+                    record_usage(response, model, fields)
+                break
+            except RETRYABLE as e:
+                count('openai_retries', model=model, error=e.__class__.__name__)
+                if attempt == retries:
+                    raise
+                delay = retry_delay(backoff, attempt)
+                log("WARN", f"{label}: {e.__class__.__name__}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    content = response.choices[0].message.content
+    store_response(cache_dir, key, content)
+    log("INFO", f"{label}: done")
+    return content
+
+
+async def map_reduce(reps, client, model=OPENAI_MODEL, concurrency=CONCURRENCY, cache_dir=CACHE_DIR,
+                     retries=RETRIES, backoff=BACKOFF, max_prompt_tokens=MAX_PROMPT_TOKENS,
+                     max_output_tokens=MAX_OUTPUT_TOKENS):
+    """Summarise every cluster concurrently, then generate the carousel ideas from the summaries.
+
+    reps should already be packed per cluster (see summary_reps). A cluster whose
+    summary fails is left out of the reduce step; its successful neighbours are
+    cached, so a re-run only repeats the failed calls.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    options = dict(model=model, cache_dir=cache_dir, retries=retries, backoff=backoff)
+    results = await asyncio.gather(*(
+        call_openai_async(client, build_summary_prompt(rep), semaphore, f"Cluster {rep['cluster']}",
+                          max_tokens=SUMMARY_OUTPUT_TOKENS, **options)
+        for rep in reps
+    ), return_exceptions=True)
+
+    summaries = []
+    for rep, result in zip(reps, results):
+        if isinstance(result, Exception):
+            log("ERROR", f"Cluster {rep['cluster']} summary failed: {result}")
+        else:
+            summaries.append((rep['cluster'], result, rep.get("size", 1)))
+    if not summaries:
+        raise SystemExit("[ERROR] No cluster could be summarised")
+
+    prompt = build_reduce_prompt(summaries, data_budget(TASK, max_prompt_tokens, model), model)
+    report_prompt("Carousel ideas", chat_tokens(prompt, model), model, max_output_tokens)
+    return await call_openai_async(client, prompt, semaphore, "Carousel ideas", max_tokens=max_output_tokens,
+                                   **options)
+
+
+def summary_reps(reps, max_prompt_tokens=MAX_PROMPT_TOKENS, model=OPENAI_MODEL):
+    """Pack every cluster into its own summary prompt budget."""
+    budget = data_budget(CLUSTER_SUMMARY_TASK, max_prompt_tokens, model)
+    return [packed for rep in reps for packed in pack_reps([rep], budget, model)]
+
+
+def fit_context(model, max_prompt_tokens, max_output_tokens):
+    window = CONTEXT_WINDOWS.get(model)
+    if window and max_prompt_tokens + max_output_tokens > window:
+        log("WARN", f"{model} has a {window} token context window, "
+            f"lowering the prompt budget to {window - max_output_tokens}")
+        return window - max_output_tokens
+    return max_prompt_tokens
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate Instagram carousel ideas from clustered Reddit texts.")
+    parser.add_argument('--input', type=Path, default=CSV_PATH)
+    parser.add_argument('--output', type=Path,
+                        help="Also write the generated ideas to this file")
+    parser.add_argument('--mode', choices=['single', 'map-reduce'], default='single',
+                        help="single: one prompt with all clusters, "
+                             "map-reduce: summarise clusters concurrently, then one final call")
+    parser.add_argument('--model', default=OPENAI_MODEL)
+    parser.add_argument('--max-prompt-tokens', type=int, default=MAX_PROMPT_TOKENS,
+                        help="Token budget per prompt; samples are truncated or dropped to fit")
+    parser.add_argument('--max-output-tokens', type=int, default=MAX_OUTPUT_TOKENS,
+                        help="Upper bound on the tokens generated for the carousel ideas")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only report prompt tokens and estimated cost, do not call OpenAI")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help="Simultaneous requests in map-reduce mode")
+    parser.add_argument('--retries', type=int, default=RETRIES)
+    parser.add_argument('--base-url',
+                        help="OpenAI-compatible endpoint, e.g. a local mock server (or set OPENAI_BASE_URL)")
+    parser.add_argument('--cache-dir', type=Path, default=CACHE_DIR,
+                        help="Responses are cached here by prompt and model")
+    parser.add_argument('--no-cache', action='store_true')
+    return parser
+
+
+def run(args, reps=None):
+    """Generate the carousel ideas; reps default to the clusters in args.input."""
+    load_dotenv()
+    cache_dir = None if args.no_cache else args.cache_dir
+    max_prompt_tokens = fit_context(args.model, args.max_prompt_tokens, args.max_output_tokens)
+    if reps is None:
+        reps = load_clustered_reps(args.input)
+
+    if args.mode == 'map-reduce':
+        reps = summary_reps(reps, max_prompt_tokens, args.model)
+        map_tokens = sum(chat_tokens(build_summary_prompt(rep), args.model) for rep in reps)
+        report_prompt(f"{len(reps)} cluster summaries", map_tokens, args.model, SUMMARY_OUTPUT_TOKENS * len(reps))
+        if args.dry_run:
+            return
+
+        async def _run_async():
+            async with make_client(args.base_url, is_async=True) as client:
+                return await map_reduce(reps, client, args.model, args.concurrency, cache_dir, args.retries,
+                                        max_prompt_tokens=max_prompt_tokens,
+                                        max_output_tokens=args.max_output_tokens)
+        response = asyncio.run(_run_async())
+    else:
+        reps = pack_reps(reps, data_budget(TASK, max_prompt_tokens, args.model), args.model)
+        prompt = build_openai_prompt(reps)
+        report_prompt("Prompt", chat_tokens(prompt, args.model), args.model, args.max_output_tokens)
+        if args.dry_run:
+            return
+        response = call_openai(prompt, make_client(args.base_url), args.model, cache_dir, args.retries,
+                               max_tokens=args.max_output_tokens)
+    if args.output:
+        args.output.write_text(response, encoding="utf-8")
+    print(response)
+    return response
+
+
+def main(argv=None):
+    parser = build_parser()
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.configure_from_args(args)
+    run(args)
+
 
 if __name__ == "__main__":
-    reps = load_clustered_reps(CSV_PATH)
-    prompt = build_openai_prompt(reps)
-    response = call_openai(prompt)
-    print(response)
\ No newline at end of file
+    main()
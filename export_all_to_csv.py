@@ -1,57 +1,207 @@
+import argparse
+import csv
+import json
 import sqlite3
-import pandas as pd
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
+import instrumentation
+from instrumentation import log, record, span
+from near_duplicates import NEAR_DUP_THRESHOLD, duplicate_hashes, update_index
+from scraper import init_db
+
 # Paths
 DB_PATH = Path(__file__).resolve().parent / "reddit_data.db"
 OUTPUT_CSV = Path(__file__).resolve().parent / "db_output_all.csv"
 
-# SQL query (equivalent to the view)
+CHUNK_SIZE = 10000
+COLUMNS = ['source', 'id', 'title', 'content', 'subreddit', 'created_utc', 'keywords', 'content_hash']
+
+# unified_text is maintained by triggers in reddit_data.db (see scraper.MIGRATIONS).
+# Only the first row (lowest rowid) per content_hash is exported: the NOT EXISTS probe
+# runs on idx_unified_content_hash, so deduplication needs no memory per hash, and on
+# incremental runs it also skips texts already exported at or below the stored rowid.
+# idx_unified_created_utc drives the ORDER BY; the unary + keeps the snapshot bound
+# from turning the scan into a rowid range that would need a temp B-tree to sort.
 QUERY = """
-WITH unified AS (
-    SELECT 
-        'post' AS source,
-        p.id AS id,
-        p.title AS title,
-        p.selftext AS content,
-        p.subreddit AS subreddit,
-        p.created_utc AS created_utc,
-        GROUP_CONCAT(pk.keyword, ', ') AS keywords
-    FROM reddit_post p
-    LEFT JOIN reddit_post_keywords pk ON p.id = pk.post_id
-    GROUP BY p.id
-
-    UNION ALL
-
-    SELECT 
-        'comment' AS source,
-        c.id AS id,
-        NULL AS title,
-        c.comment AS content,
-        c.subreddit AS subreddit,
-        c.created_utc AS created_utc,
-        GROUP_CONCAT(ck.keyword, ', ') AS keywords
-    FROM reddit_comment c
-    LEFT JOIN reddit_comment_keywords ck ON c.id = ck.comment_id
-    GROUP BY c.id
-)
-
-SELECT * FROM unified
-WHERE content IS NOT NULL
-GROUP BY content
-ORDER BY created_utc DESC;
+SELECT u.source, u.id, u.title, u.content, u.subreddit, u.created_utc, u.keywords, u.content_hash
+FROM unified_text u
+WHERE u.content IS NOT NULL
+  AND +u.rowid <= :max_rowid
+  {filters}
+  AND NOT EXISTS (
+      SELECT 1 FROM unified_text d
+      WHERE d.content_hash = u.content_hash AND d.rowid < u.rowid AND d.content IS NOT NULL
+        {earlier_filter}
+  )
+ORDER BY u.created_utc DESC;
 """
 
-# Connect and query
-conn = sqlite3.connect(DB_PATH)
-df = pd.read_sql_query(QUERY, conn)
 
-# Save to CSV
-df.to_csv(OUTPUT_CSV, index=False, encoding='utf-8')
-print(f"[INFO] Exported {len(df)} rows to {OUTPUT_CSV}")
+def parse_since(value):
+    """Accept a unix timestamp or an ISO date such as 2025-05-10."""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def state_path(output_path):
+    return output_path.with_name(output_path.name + '.state.json')
+
+
+def load_state(output_path):
+    path = state_path(output_path)
+    state = json.loads(path.read_text()) if path.exists() else {}
+    return {'rowid': state.get('rowid', 0)}
+
+
+def export_query(since=0, incremental=False):
+    filters = []
+    if incremental:
+        filters.append('AND u.rowid > :rowid')
+    if since:
+        filters.append('AND u.created_utc >= :since')
+    return QUERY.format(filters='\n  '.join(filters),
+                        earlier_filter='AND d.created_utc >= :since' if since else '')
+
+
+def iter_rows(conn, since=0, state=None, chunk_size=CHUNK_SIZE):
+    """Yield chunks of unified rows, newest first and one per content hash, from a consistent snapshot."""
+    state = state or {'rowid': 0}
+    max_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM unified_text").fetchone()[0]
+
+    query = export_query(since, incremental=state['rowid'] > 0)
+    started = time.perf_counter()
+    cursor = conn.execute(query, {'since': since, 'rowid': state['rowid'], 'max_rowid': max_rowid})
+    query_seconds, rows = time.perf_counter() - started, 0
+    while True:
+        started = time.perf_counter()
+        chunk = cursor.fetchmany(chunk_size)
+        query_seconds += time.perf_counter() - started
+        if not chunk:
+            break
+        rows += len(chunk)
+        yield chunk
+
+    # only the time spent in SQLite, not in the consumer of the chunks
+    record('sql_query', query_seconds, {'rows': rows}, query='export')
+    state.update(rowid=max_rowid)
+
+
+class CsvSink:
+    def __init__(self, path, append=False):
+        write_header = not (append and path.exists())
+        self.f = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.f)
+        if write_header:
+            self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetSink:
+    def __init__(self, path, append=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("[ERROR] Parquet output needs pyarrow: pip install pyarrow")
+        if append:
+            # Parquet files cannot be appended to, so incremental runs add a part file
+            stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+            path = path.with_name(f"{path.stem}-{stamp}{path.suffix}")
+        self.pa = pa
+        self.schema = pa.schema([
+            ('source', pa.string()), ('id', pa.string()), ('title', pa.string()),
+            ('content', pa.string()), ('subreddit', pa.string()), ('created_utc', pa.float64()),
+            ('keywords', pa.string()), ('content_hash', pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in COLUMNS]
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(col, type=field.type) for col, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+def export(db_path=DB_PATH, output_path=OUTPUT_CSV, fmt='csv', since=0, incremental=False,
+           chunk_size=CHUNK_SIZE, near_dup_threshold=None):
+    """Export unified rows; with near_dup_threshold, only one text per near-duplicate group."""
+    init_db(db_path)
+    state = load_state(output_path) if incremental else {'rowid': 0}
+    hash_col = COLUMNS.index('content_hash')
+    sink = (ParquetSink if fmt == 'parquet' else CsvSink)(output_path, append=incremental)
+
+    exported = near_duplicates = 0
+    conn = sqlite3.connect(db_path)
+    try:
+        collapsed = set()
+        if near_dup_threshold is not None:
+            update_index(conn)
+            collapsed = duplicate_hashes(conn, near_dup_threshold)
+        for chunk in iter_rows(conn, since, state, chunk_size):
+            fresh = [row for row in chunk if row[hash_col] not in collapsed]
+            near_duplicates += len(chunk) - len(fresh)
+            if fresh:
+                sink.write(fresh)
+                exported += len(fresh)
+    finally:
+        sink.close()
+        conn.close()
+
+    state_path(output_path).write_text(json.dumps(state))
+    log("INFO", f"Exported {exported} rows to {output_path} ({near_duplicates} near-duplicates skipped)")
+    return exported
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Export posts and comments from reddit_data.db.")
+    parser.add_argument('-o', '--output', type=Path, default=OUTPUT_CSV,
+                        help="Output file (.csv or .parquet)")
+    parser.add_argument('--format', choices=['csv', 'parquet'],
+                        help="Output format, defaults to the output file's suffix")
+    parser.add_argument('--since',
+                        help="Only export rows created at or after this unix timestamp or ISO date")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Append only rows added since the previous export of this output")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="Rows fetched from SQLite per chunk")
+    parser.add_argument('--near-dup-threshold', type=float, nargs='?', const=NEAR_DUP_THRESHOLD,
+                        help="Keep one text per group of near-duplicates at this estimated similarity "
+                             f"(default {NEAR_DUP_THRESHOLD})")
+    return parser
+
+
+def run(args):
+    fmt = args.format or ('parquet' if args.output.suffix == '.parquet' else 'csv')
+    since = parse_since(args.since) if args.since else 0
+    with span('export', format=fmt) as fields:
+        fields['rows'] = export(DB_PATH, args.output, fmt, since, args.incremental, args.chunk_size,
+                                args.near_dup_threshold)
+    return fields['rows']
+
+
+def main(argv=None):
+    parser = build_parser()
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.configure_from_args(args)
+    run(args)
 
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', 0)
-pd.set_option('display.max_colwidth', None)
 
-print(df.head(20))
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+
+from instrumentation import log
+
+CACHE_DIR = Path(__file__).resolve().parent / ".feature_cache"
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+MAX_SHARDS = 16                    # merge small shards once a version has more than this
+COMPACT_BYTES = 64 * 1024 ** 2     # shards at least this large are left alone
+
+
+def cache_version(params):
+    """Stable version key for a featurizer configuration."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class FeatureCache:
+    """On-disk cache of per-text feature rows keyed by content hash.
+
+    Rows are written in append-only shards of .npy arrays that are memory-mapped on
+    read: CSR components for sparse features, one 2-D array for dense ones. index.db
+    maps every hash to its shard and row. Each featurizer configuration gets its own
+    version directory, so changed parameters never mix with old vectors. Small shards
+    are merged once there are more than MAX_SHARDS, and whole shards are evicted
+    least-recently-used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, version, root=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.dir = Path(root) / version
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(self.dir / 'index.db')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY,
+                kind TEXT,
+                n_rows INT,
+                n_cols INT,
+                bytes INT,
+                last_used REAL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                hash TEXT PRIMARY KEY,
+                shard INT,
+                row INT
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_shard ON entries (shard);
+        ''')
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, hashes):
+        """Return {position: (shard, row)} for the hashes that are cached."""
+        self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (pos INTEGER, hash TEXT)')
+        self.conn.execute('DELETE FROM wanted')
+        self.conn.executemany('INSERT INTO wanted VALUES (?, ?)', enumerate(hashes))
+        found = {
+            pos: (shard, row)
+            for pos, shard, row in self.conn.execute('''
+                SELECT w.pos, e.shard, e.row FROM wanted w JOIN entries e ON e.hash = w.hash
+            ''')
+        }
+        self.conn.execute('DELETE FROM wanted')
+        return found
+
+    def shard_path(self, shard):
+        return self.dir / f"shard-{shard}"
+
+    def load_shard(self, shard):
+        kind, n_rows, n_cols = self.conn.execute(
+            'SELECT kind, n_rows, n_cols FROM shards WHERE id = ?', (shard,)).fetchone()
+        path = self.shard_path(shard)
+        if kind == 'dense':
+            return np.load(path / 'vectors.npy', mmap_mode='r')
+        return sp.csr_matrix((
+            np.load(path / 'data.npy', mmap_mode='r'),
+            np.load(path / 'indices.npy', mmap_mode='r'),
+            np.load(path / 'indptr.npy', mmap_mode='r'),
+        ), shape=(n_rows, n_cols))
+
+    def write_shard(self, matrix, last_used):
+        """Save matrix as a new shard and return its id; the caller adds the entries and commits."""
+        sparse = sp.issparse(matrix)
+        cursor = self.conn.execute(
+            'INSERT INTO shards (kind, n_rows, n_cols, bytes, last_used) VALUES (?, ?, ?, 0, ?)',
+            ('sparse' if sparse else 'dense', matrix.shape[0], matrix.shape[1], last_used))
+        shard = cursor.lastrowid
+        path = self.shard_path(shard)
+        path.mkdir()
+        if sparse:
+            matrix = sp.csr_matrix(matrix)
+            np.save(path / 'data.npy', matrix.data)
+            np.save(path / 'indices.npy', matrix.indices)
+            np.save(path / 'indptr.npy', matrix.indptr)
+        else:
+            np.save(path / 'vectors.npy', np.ascontiguousarray(matrix))
+        size = sum(f.stat().st_size for f in path.iterdir())
+        self.conn.execute('UPDATE shards SET bytes = ? WHERE id = ?', (size, shard))
+        return shard
+
+    def put(self, hashes, matrix):
+        shard = self.write_shard(matrix, time.time())
+        self.conn.executemany('INSERT OR IGNORE INTO entries (hash, shard, row) VALUES (?, ?, ?)',
+                              ((h, shard, row) for row, h in enumerate(hashes)))
+        self.conn.commit()
+        self.compact()
+        self.evict()
+
+    def fetch(self, hashes, compute):
+        """Feature rows for hashes, in order; compute(positions) builds the missing ones."""
+        found = self.lookup(hashes)
+        missing = [pos for pos in range(len(hashes)) if pos not in found]
+        log("INFO", f"Feature cache: {len(found)} cached, {len(missing)} to vectorize")
+
+        # read cached rows before writing, since writing may evict old shards
+        parts, order = [], []
+        by_shard = {}
+        for pos, (shard, row) in found.items():
+            by_shard.setdefault(shard, []).append((pos, row))
+        now = time.time()
+        for shard, items in by_shard.items():
+            positions, rows = zip(*items)
+            shard_matrix = self.load_shard(shard)
+            part = shard_matrix[list(rows)]
+            parts.append(part.copy() if sp.issparse(part) else np.array(part))
+            order.extend(positions)
+            self.conn.execute('UPDATE shards SET last_used = ? WHERE id = ?', (now, shard))
+        self.conn.commit()
+
+        if missing:
+            new = compute(missing)
+            self.put([hashes[pos] for pos in missing], new)
+            parts.append(new)
+            order.extend(missing)
+
+        if not parts:
+            return None
+        if any(sp.issparse(part) for part in parts):
+            stacked = sp.vstack([sp.csr_matrix(part) for part in parts]).tocsr()
+        else:
+            stacked = np.vstack([np.asarray(part) for part in parts])
+        return stacked[np.argsort(order)]
+
+    def compact(self):
+        """Merge the small shards into one once there are more than MAX_SHARDS.
+
+        Every run that vectorizes new texts adds a shard, and fetch loads each shard it
+        hits separately. Only rows that entries still point to are copied.
+        """
+        n_shards = self.conn.execute('SELECT COUNT(*) FROM shards').fetchone()[0]
+        small = self.conn.execute(
+            'SELECT id, last_used FROM shards WHERE bytes < ? ORDER BY id', (COMPACT_BYTES,)).fetchall()
+        if n_shards <= MAX_SHARDS or len(small) < 2:
+            return
+
+        hashes, parts = [], []
+        for shard, _ in small:
+            entries = self.conn.execute(
+                'SELECT hash, row FROM entries WHERE shard = ? ORDER BY row', (shard,)).fetchall()
+            if not entries:
+                continue
+            part = self.load_shard(shard)[[row for _, row in entries]]
+            parts.append(part.copy() if sp.issparse(part) else np.array(part))
+            hashes.extend(h for h, _ in entries)
+
+        old = [shard for shard, _ in small]
+        marks = ','.join('?' * len(old))
+        if parts:
+            if any(sp.issparse(part) for part in parts):
+                merged = sp.vstack([sp.csr_matrix(part) for part in parts]).tocsr()
+            else:
+                merged = np.vstack(parts)
+            # the merged shard is as recent as its most recently used member
+            shard = self.write_shard(merged, max(last_used for _, last_used in small))
+            self.conn.execute(f'DELETE FROM entries WHERE shard IN ({marks})', old)
+            self.conn.executemany('INSERT INTO entries (hash, shard, row) VALUES (?, ?, ?)',
+                                  ((h, shard, row) for row, h in enumerate(hashes)))
+        self.conn.execute(f'DELETE FROM shards WHERE id IN ({marks})', old)
+        self.conn.commit()
+        for shard in old:
+            shutil.rmtree(self.shard_path(shard), ignore_errors=True)
+        log("INFO", f"Feature cache: merged {len(old)} shards ({len(hashes)} rows)")
+
+    def evict(self):
+        total = self.conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM shards').fetchone()[0]
+        for shard, size in self.conn.execute('SELECT id, bytes FROM shards ORDER BY last_used').fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute('DELETE FROM entries WHERE shard = ?', (shard,))
+            self.conn.execute('DELETE FROM shards WHERE id = ?', (shard,))
+            shutil.rmtree(self.shard_path(shard), ignore_errors=True)
+            total -= size
+        self.conn.commit()
@@ -0,0 +1,192 @@
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+METRIC_PREFIX = 'reddit_pipeline'
+PROFILE_DIR = Path(__file__).resolve().parent / 'profiles'
+
+_lock = threading.Lock()
+_spans = {}         # (name, labels) -> [calls, total seconds, max seconds]
+_counters = {}      # (name, labels) -> value
+_config = {'log_json': None, 'metrics_file': None, 'profile': set(), 'profile_dir': PROFILE_DIR}
+_log_file = None
+_profiling = False
+_registered = False
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _emit(event):
+    if _log_file is None:
+        return
+    event = {'ts': round(time.time(), 6), 'pid': os.getpid(), **event}
+    line = json.dumps(event, ensure_ascii=False, default=str)
+    with _lock:
+        _log_file.write(line + '\n')
+        _log_file.flush()
+
+
+def log(level, message, **fields):
+    """Print a '[LEVEL] message' line and, with JSON logging on, write it as an event."""
+    print(f"[{level}] {message}")
+    _emit({'level': level, 'msg': message, **fields})
+
+
+def count(name, value=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def record(name, seconds, fields=None, **labels):
+    """Add a duration measured elsewhere (e.g. in a worker process) to a span."""
+    with _lock:
+        stats = _spans.setdefault(_key(name, labels), [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+    _emit({'span': name, 'seconds': round(seconds, 6), **labels, **(fields or {})})
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block. Yields a dict; fields put into it end up in the JSON event.
+
+    Spans named with --profile also run under cProfile and tracemalloc.
+    """
+    global _profiling
+    fields = {}
+    profiler = None
+    if name in _config['profile'] and not _profiling:
+        _profiling = True
+        profiler = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields['error'] = e.__class__.__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+            fields['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+            if started_tracing:
+                tracemalloc.stop()
+            fields['profile'] = str(_dump_profile(profiler, name))
+            _profiling = False
+        if 'rows' in fields and seconds > 0:
+            fields['rows_per_s'] = round(fields['rows'] / seconds, 1)
+        record(name, seconds, fields, **labels)
+
+
+def _dump_profile(profiler, name):
+    directory = Path(_config['profile_dir'])
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.prof"
+    profiler.dump_stats(path)
+    log("INFO", f"Profile of {name} written to {path} (python -m pstats {path})")
+    return path
+
+
+def _number(value):
+    # full precision: .6g would round counters past a million
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def metrics_text():
+    """Spans and counters in the Prometheus text exposition format."""
+    with _lock:
+        spans = sorted(_spans.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    if spans:
+        for suffix, kind, index, help_text in (
+            ('span_calls_total', 'counter', 0, 'Number of times a span ran'),
+            ('span_seconds_total', 'counter', 1, 'Wall time spent in a span'),
+            ('span_seconds_max', 'gauge', 2, 'Longest single run of a span'),
+        ):
+            metric = f"{METRIC_PREFIX}_{suffix}"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            lines += [f"{metric}{_labels((('span', name),) + labels)} {_number(stats[index])}"
+                      for (name, labels), stats in spans]
+    for name in sorted({name for (name, _), _ in counters}):
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines += [f"{metric}{_labels(labels)} {_number(value)}"
+                  for (counter, labels), value in counters if counter == name]
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path):
+    # write and rename, so the node_exporter textfile collector never reads a partial file
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(metrics_text())
+    tmp.replace(path)
+
+
+def summary():
+    with _lock:
+        return {
+            'spans': {name + _labels(labels): {'calls': stats[0], 'seconds': round(stats[1], 6)}
+                      for (name, labels), stats in _spans.items()},
+            'counters': {name + _labels(labels): value for (name, labels), value in _counters.items()},
+        }
+
+
+def _finish():
+    _emit({'summary': summary()})
+    if _config['metrics_file']:
+        write_metrics(_config['metrics_file'])
+
+
+def configure(log_json=None, metrics_file=None, profile=(), profile_dir=PROFILE_DIR):
+    """Turn on JSON event logs ('-' for stderr), a Prometheus textfile written at exit, and profiling."""
+    global _log_file, _registered
+    _config.update(log_json=log_json, metrics_file=metrics_file, profile=set(profile or ()),
+                   profile_dir=profile_dir)
+    if log_json:
+        _log_file = sys.stderr if str(log_json) == '-' else open(log_json, 'a', encoding='utf-8')
+    if not _registered and (log_json or metrics_file):
+        atexit.register(_finish)
+        _registered = True
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument('--log-json', metavar='FILE',
+                       help="Append structured JSON events (log lines, spans, a final summary) to FILE, "
+                            "or '-' for stderr")
+    group.add_argument('--metrics-file', type=Path, metavar='FILE',
+                       help="Write span timings and counters in Prometheus text format to FILE at exit")
+    group.add_argument('--profile', nargs='+', default=[], metavar='SPAN',
+                       help="Run these spans under cProfile and tracemalloc, e.g. fit sql_write")
+    group.add_argument('--profile-dir', type=Path, default=PROFILE_DIR,
+                       help="Where --profile writes its .prof files")
+
+
+def configure_from_args(args):
+    configure(args.log_json, args.metrics_file, args.profile, args.profile_dir)
@@ -0,0 +1,110 @@
+from collections import deque
+
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+AUTOMATON_MIN_KEYWORDS = 150    # below this, one str.find per keyword beats the pure-Python automaton
+
+
+class KeywordMatcher:
+    """Aho–Corasick automaton that finds all keywords in a text in a single pass.
+
+    Small keyword sets are matched with plain substring searches instead, which
+    run in C and are faster until there are about AUTOMATON_MIN_KEYWORDS keywords.
+    Texts are lowercased once per call. With normalize_umlauts, ä/ö/ü/ß and their
+    ae/oe/ue/ss spellings match each other. With word_boundary, a keyword only
+    matches when it is not part of a longer word.
+    """
+
+    def __init__(self, keywords, word_boundary=False, normalize_umlauts=False):
+        self.keywords = list(dict.fromkeys(keywords))
+        self.word_boundary = word_boundary
+        self.normalize_umlauts = normalize_umlauts
+
+        # several keywords can normalize to the same pattern
+        patterns = {}
+        for kw in self.keywords:
+            pattern = self.normalize(kw)
+            if pattern:
+                patterns.setdefault(pattern, []).append(kw)
+        self.patterns = list(patterns)
+        self.pattern_keywords = list(patterns.values())
+        self.use_automaton = len(self.patterns) >= AUTOMATON_MIN_KEYWORDS
+        if self.use_automaton:
+            self.build()
+
+    def normalize(self, text):
+        text = text.lower()
+        return text.translate(UMLAUTS) if self.normalize_umlauts else text
+
+    def build(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for idx, pattern in enumerate(self.patterns):
+            node = 0
+            for ch in pattern:
+                if ch not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][ch] = len(self.goto) - 1
+                node = self.goto[node][ch]
+            self.out[node].append(idx)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def scan(self, text, found):
+        for idx, pattern in enumerate(self.patterns):
+            if idx in found:
+                continue
+            start = text.find(pattern)
+            while start != -1:
+                if not self.word_boundary or self.on_boundary(text, start, start + len(pattern)):
+                    found.add(idx)
+                    break
+                start = text.find(pattern, start + 1)
+
+    def find(self, text, found):
+        goto, fail, out = self.goto, self.fail, self.out
+        total = len(self.patterns)
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                if idx in found:
+                    continue
+                if self.word_boundary and not self.on_boundary(text, i - len(self.patterns[idx]) + 1, i + 1):
+                    continue
+                found.add(idx)
+                if len(found) == total:
+                    return
+
+    @staticmethod
+    def on_boundary(text, start, end):
+        before = text[start - 1] if start > 0 else ' '
+        after = text[end] if end < len(text) else ' '
+        return not (before.isalnum() or before == '_') and not (after.isalnum() or after == '_')
+
+    def match(self, *texts):
+        """Return the keywords found in any of the texts, in the order they were given."""
+        found = set()
+        for text in texts:
+            if text and len(found) < len(self.patterns):
+                (self.find if self.use_automaton else self.scan)(self.normalize(text), found)
+        matched = {kw for idx in found for kw in self.pattern_keywords[idx]}
+        return [kw for kw in self.keywords if kw in matched]
+
+
+def as_matcher(keywords):
+    return keywords if isinstance(keywords, KeywordMatcher) else KeywordMatcher(keywords)
@@ -0,0 +1,176 @@
+import json
+import re
+import zlib
+
+import numpy as np
+
+from instrumentation import log
+
+NUM_PERM = 128
+BANDS, ROWS = 32, 4         # LSH bands x rows per band = NUM_PERM; candidates from ~0.4 similarity
+SHINGLE_WORDS = 3
+PAIR_SIMILARITY = 0.5       # pairs at or above this estimated Jaccard similarity are stored
+NEAR_DUP_THRESHOLD = 0.7    # default similarity at which texts are collapsed
+INDEX_CHUNK_SIZE = 10000
+MAX_CANDIDATES = 1000       # per text; bounds the work for huge buckets of boilerplate
+
+WORD_RE = re.compile(r"\w+")
+PRIME = (1 << 31) - 1       # a * x + b stays below 2**63 for 32-bit shingle hashes
+
+_rng = np.random.default_rng(1)
+PERM_A = _rng.integers(1, PRIME, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, PRIME, NUM_PERM, dtype=np.uint64)
+BAND_MIX = _rng.integers(1, 1 << 63, ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def shingles(text):
+    """CRC32 hashes of the lowercased word n-grams of a text."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        grams = [' '.join(words)] if words else []
+    else:
+        grams = [' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    return np.fromiter({zlib.crc32(gram.encode('utf-8')) for gram in grams}, dtype=np.uint64)
+
+
+def signature(text):
+    """MinHash signature of a text, or None when it has no words."""
+    x = shingles(text)
+    if not len(x):
+        return None
+    return ((PERM_A[:, None] * x[None, :] + PERM_B[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signatures):
+    """One bucket key per band for each signature row, as signed 64-bit ints for SQLite."""
+    bands = signatures.astype(np.uint64).reshape(len(signatures), BANDS, ROWS)
+    with np.errstate(over='ignore'):
+        keys = (bands * BAND_MIX).sum(axis=2) + np.arange(BANDS, dtype=np.uint64)
+    return keys.view(np.int64)
+
+
+def similarity(sig, others):
+    """Estimated Jaccard similarity of one signature to each row of others."""
+    return (others == sig).mean(axis=1)
+
+
+def update_index(conn, chunk_size=INDEX_CHUNK_SIZE):
+    """Add unified_text rows past the stored high-water rowid to the MinHash LSH index.
+
+    Each new text is compared only with the texts sharing one of its band buckets,
+    so indexing stays roughly linear in the number of new texts. Verified pairs
+    are stored in near_duplicate_pairs, pointing from the newer to the older text.
+    """
+    start = conn.execute('SELECT indexed_rowid FROM minhash_state').fetchone()[0]
+    end = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_text').fetchone()[0]
+    if end <= start:
+        return 0
+
+    indexed = pairs = 0
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS new_buckets '
+                 '(content_hash TEXT, seq INTEGER, band INTEGER, bucket INTEGER)')
+    rows = conn.execute('''
+        SELECT content_hash, content FROM unified_text
+        WHERE rowid > ? AND rowid <= ? AND content IS NOT NULL
+    ''', (start, end))
+    while True:
+        chunk = rows.fetchmany(chunk_size)
+        if not chunk:
+            break
+        new = {}
+        for text_hash, content in chunk:
+            if text_hash not in new:
+                sig = signature(content)
+                if sig is not None:
+                    new[text_hash] = sig
+        if not new:
+            continue
+
+        # exact duplicates share a content_hash, so texts indexed earlier are skipped
+        known = {row[0] for row in conn.execute(
+            'SELECT content_hash FROM minhash_signatures WHERE content_hash IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(new)),))}
+        hashes = [text_hash for text_hash in new if text_hash not in known]
+        if not hashes:
+            continue
+        first = conn.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM minhash_signatures').fetchone()[0]
+        sigs = np.stack([new[text_hash] for text_hash in hashes])
+        buckets = band_buckets(sigs).tolist()
+        band_rows = sorted(
+            (band, bucket, text_hash, seq)
+            for seq, (text_hash, keys) in enumerate(zip(hashes, buckets), start=first)
+            for band, bucket in enumerate(keys)
+        )
+
+        with conn:
+            conn.executemany('INSERT INTO minhash_signatures (seq, content_hash, signature) VALUES (?, ?, ?)',
+                             ((seq, text_hash, new[text_hash].tobytes())
+                              for seq, text_hash in enumerate(hashes, start=first)))
+            conn.executemany('INSERT OR IGNORE INTO minhash_buckets (band, bucket, content_hash) VALUES (?, ?, ?)',
+                             (row[:3] for row in band_rows))
+            conn.execute('DELETE FROM new_buckets')
+            conn.executemany('INSERT INTO new_buckets (band, bucket, content_hash, seq) VALUES (?, ?, ?, ?)',
+                             band_rows)
+
+            candidates = {}
+            for text_hash, other, other_sig in conn.execute('''
+                SELECT DISTINCT n.content_hash, s.content_hash, s.signature
+                FROM new_buckets n
+                JOIN minhash_buckets b ON b.band = n.band AND b.bucket = n.bucket
+                JOIN minhash_signatures s ON s.content_hash = b.content_hash
+                WHERE s.seq < n.seq
+            '''):
+                found = candidates.setdefault(text_hash, ([], []))
+                if len(found[0]) < MAX_CANDIDATES:
+                    found[0].append(other)
+                    found[1].append(np.frombuffer(other_sig, dtype=np.uint32))
+
+            found_pairs = []
+            for text_hash, (others, other_sigs) in candidates.items():
+                sims = similarity(new[text_hash], np.stack(other_sigs))
+                found_pairs.extend((text_hash, other, float(sim))
+                                   for other, sim in zip(others, sims) if sim >= PAIR_SIMILARITY)
+            conn.executemany('INSERT OR REPLACE INTO near_duplicate_pairs VALUES (?, ?, ?)', found_pairs)
+        indexed += len(hashes)
+        pairs += len(found_pairs)
+
+    with conn:
+        conn.execute('UPDATE minhash_state SET indexed_rowid = ?', (end,))
+    log("INFO", f"Near-duplicate index: {indexed} new texts, {pairs} near-duplicate pairs")
+    return indexed
+
+
+def duplicate_hashes(conn, threshold=NEAR_DUP_THRESHOLD):
+    """Content hashes to drop so that each near-duplicate group keeps one text.
+
+    Groups are connected components of the pairs at or above threshold; the
+    earliest indexed text of each group is kept.
+    """
+    if threshold < PAIR_SIMILARITY:
+        log("WARN", f"Near-duplicate pairs are only stored from similarity {PAIR_SIMILARITY}")
+    parent, seq = {}, {}
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while node != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for newer, newer_seq, older, older_seq in conn.execute('''
+        SELECT p.content_hash, a.seq, p.duplicate_of, b.seq
+        FROM near_duplicate_pairs p
+        JOIN minhash_signatures a ON a.content_hash = p.content_hash
+        JOIN minhash_signatures b ON b.content_hash = p.duplicate_of
+        WHERE p.similarity >= ?
+    ''', (threshold,)):
+        for node, order in ((newer, newer_seq), (older, older_seq)):
+            parent.setdefault(node, node)
+            seq[node] = order
+        a, b = find(newer), find(older)
+        if a != b:
+            if seq[a] < seq[b]:
+                a, b = b, a
+            parent[a] = b
+    return {node for node in parent if find(node) != node}
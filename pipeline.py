@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import json
+import shlex
+import sqlite3
+import time
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+import cluster
+import content
+import export_all_to_csv
+import instrumentation
+import scraper
+from instrumentation import log, span
+from keyword_matcher import KeywordMatcher
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DB_PATH = scraper.DB_PATH
+STATE_PATH = SCRIPT_DIR / '.pipeline_state.json'
+CONTENT_OUTPUT = SCRIPT_DIR / 'carousel_ideas.md'
+STAGES = ('scrape', 'export', 'cluster', 'content')
+SCRAPE_INTERVAL = 0         # seconds; a scrape is due again after this long
+
+# tables whose row counts and max rowids make up the database fingerprint;
+# stages only write to tables outside this list (assignments, MinHash index)
+DB_TABLES = ('reddit_post', 'reddit_comment', 'reddit_post_keywords', 'reddit_comment_keywords', 'unified_text')
+
+
+def fingerprint(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def db_fingerprint(db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        return {
+            table: conn.execute(f'SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM {table}').fetchone()
+            for table in DB_TABLES
+        }
+
+
+def file_hash(path, known):
+    """sha256 of a file, or None if it is missing.
+
+    known maps paths to their last size, mtime and hash, so unchanged files
+    are not read again.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    entry = known.get(str(path))
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    known[str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def load_state(path=STATE_PATH):
+    state = json.loads(path.read_text()) if path.exists() else {}
+    return {'stages': state.get('stages', {}), 'files': state.get('files', {})}
+
+
+def save_state(state, path=STATE_PATH):
+    path.write_text(json.dumps(state, indent=2))
+
+
+def options(namespace, **overrides):
+    return argparse.Namespace(**{**vars(namespace), **overrides})
+
+
+def build_stages(args):
+    """The pipeline DAG: name -> deps, config, data fingerprint, outputs and runner.
+
+    Clustering reads reddit_data.db directly and hands its representatives to the
+    content stage in-process, so the export CSV is an artifact, not an input.
+    """
+    export_args = export_all_to_csv.build_parser().parse_args(shlex.split(args.export_args))
+    cluster_args = cluster.build_parser().parse_args(['--from-db'] + shlex.split(args.cluster_args))
+    content_args = content.build_parser().parse_args(shlex.split(args.content_args))
+    content_args.input = cluster_args.output
+    content_args.output = content_args.output or CONTENT_OUTPUT
+
+    stages = {}
+    if args.subreddits and args.keywords:
+        def scrape(results, config_changed):
+            matcher = KeywordMatcher(args.keywords, args.word_boundary, args.normalize_umlauts)
+            return scraper.run_reddit_scraper(args.subreddits, args.keywords, args.jobs,
+                                              incremental=True, matcher=matcher,
+                                              backend=args.backend, base_url=args.base_url,
+                                              ingest_workers=args.workers)
+
+        stages['scrape'] = {
+            'deps': [],
+            'config': {key: getattr(args, key)
+                       for key in ('subreddits', 'keywords', 'word_boundary', 'normalize_umlauts')},
+            'data': lambda: None,
+            'outputs': [],
+            'max_age': args.scrape_interval,
+            'run': scrape,
+        }
+    else:
+        log("INFO", "No --subreddits/--keywords given, working on the stored data")
+
+    if not args.no_export:
+        def export(results, config_changed):
+            # an unchanged configuration only needs the rows added since the last export
+            return export_all_to_csv.run(options(
+                export_args, incremental=not config_changed and export_args.output.exists()))
+
+        stages['export'] = {
+            'deps': ['scrape'],
+            'config': vars(options(export_args, incremental=None)),
+            'data': db_fingerprint,
+            'outputs': [export_args.output],
+            'run': export,
+        }
+
+    def cluster_stage(results, config_changed):
+        # new rows are assigned to the saved clusters unless the clustering itself changed
+        return cluster.run(options(cluster_args, assign=not config_changed))
+
+    stages['cluster'] = {
+        'deps': ['scrape'],
+        'config': vars(options(cluster_args, assign=None)),
+        'data': db_fingerprint,
+        'outputs': [cluster_args.output, cluster_args.model_dir / 'model.json'],
+        'run': cluster_stage,
+    }
+    stages['content'] = {
+        'deps': ['cluster'],
+        'config': vars(content_args),
+        'data': lambda: file_hash(cluster_args.output, {}),
+        'outputs': [content_args.output],
+        'run': lambda results, config_changed: content.run(content_args, results.get('cluster')),
+    }
+
+    for stage in stages.values():
+        stage['deps'] = [dep for dep in stage['deps'] if dep in stages]
+    return stages
+
+
+def stale_reason(previous, config, data, outputs, max_age=None):
+    """Why a stage has to run, or None when it is up to date."""
+    if previous is None:
+        return "never run"
+    if previous['config'] != config:
+        return "configuration changed"
+    if previous['data'] != data:
+        return "input data changed"
+    if previous['outputs'] != outputs:
+        return "outputs missing or modified"
+    if max_age is not None and time.time() - previous['finished_utc'] >= max_age:
+        return "due"
+    return None
+
+
+def run_pipeline(stages, state, force=(), plan=False, state_path=STATE_PATH):
+    """Run the stages in dependency order, skipping those whose inputs did not change."""
+    order = TopologicalSorter({name: stage['deps'] for name, stage in stages.items()}).static_order()
+    results = {}
+    pending = set()
+    for name in order:
+        stage = stages[name]
+        config = fingerprint(stage['config'])
+        data = fingerprint(stage['data']())
+        outputs = {str(path): file_hash(path, state['files']) for path in stage['outputs']}
+        previous = state['stages'].get(name)
+
+        reason = stale_reason(previous, config, data, outputs, stage.get('max_age'))
+        if name in force:
+            reason = "forced"
+        elif reason is None and pending.intersection(stage['deps']):
+            # in a plan the upstream stage has not run, so its effect is unknown
+            reason = "upstream stage runs first"
+        if reason is None:
+            log("INFO", f"{name}: up to date, skipped")
+            continue
+        log("INFO", f"{name}: running ({reason})")
+        if plan:
+            pending.add(name)
+            continue
+
+        started = time.time()
+        with span('stage', stage=name):
+            results[name] = stage['run'](results, config_changed=previous is None or previous['config'] != config)
+        state['stages'][name] = {
+            'config': config,
+            'data': data,
+            'outputs': {str(path): file_hash(path, state['files']) for path in stage['outputs']},
+            'finished_utc': time.time(),
+        }
+        save_state(state, state_path)
+        log("INFO", f"{name}: done in {time.time() - started:.1f}s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scrape -> export -> cluster -> content, "
+                                                 "skipping stages whose inputs did not change.")
+    parser.add_argument('-s', '--subreddits', nargs='+',
+                        help="Subreddits to scrape; without them the scrape stage is left out")
+    parser.add_argument('-k', '--keywords', nargs='+',
+                        help="Keywords to search for")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of URS searches and comment fetches to run concurrently")
+    parser.add_argument('--workers', type=int, default=scraper.INGEST_WORKERS,
+                        help="Processes that parse and tag scrape files for the single SQLite writer")
+    parser.add_argument('--backend', choices=scraper.FETCH_BACKENDS, default='urs',
+                        help="Fetch with URS subprocesses or in-process over HTTP")
+    parser.add_argument('--base-url',
+                        help="Reddit host for the http backend, e.g. a local stand-in")
+    parser.add_argument('--word-boundary', action='store_true',
+                        help="Only tag keywords that appear as whole words")
+    parser.add_argument('--normalize-umlauts', action='store_true',
+                        help="Match ä/ö/ü/ß and ae/oe/ue/ss spellings interchangeably")
+    parser.add_argument('--scrape-interval', type=float, default=SCRAPE_INTERVAL,
+                        help="Seconds after which the same scrape is run again (0: every run)")
+    parser.add_argument('--no-export', action='store_true',
+                        help="Leave out the CSV export; clustering reads the database directly")
+    parser.add_argument('--export-args', default='',
+                        help="Options for export_all_to_csv.py, e.g. '--near-dup-threshold'")
+    parser.add_argument('--cluster-args', default='',
+                        help="Options for cluster.py, e.g. '--engine minibatch -k auto'")
+    parser.add_argument('--content-args', default='',
+                        help=f"Options for content.py, e.g. '--mode map-reduce'; "
+                             f"the ideas are written to {CONTENT_OUTPUT.name}")
+    parser.add_argument('--force', nargs='+', choices=STAGES, default=[],
+                        help="Run these stages even if they are up to date")
+    parser.add_argument('--plan', action='store_true',
+                        help="Only print which stages would run and why")
+    parser.add_argument('--state', type=Path, default=STATE_PATH,
+                        help="File with the fingerprints of the last successful stage runs")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure_from_args(args)
+
+    load_dotenv()
+    scraper.init_db()
+    state = load_state(args.state)
+    run_pipeline(build_stages(args), state, args.force, args.plan, args.state)
+
+
+if __name__ == '__main__':
+    main()
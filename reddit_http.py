@@ -0,0 +1,181 @@
+"""In-process fetch backend: Reddit's JSON listings over one pooled, keep-alive httpx client.
+
+Searches and comment trees are requested concurrently on an asyncio loop and handed
+straight to ingestion, so there is no URS process start-up and no scrape file per
+fetch. Unlike URS, "load more comments" stubs are not expanded; very large threads
+come back with the comments Reddit includes in the first response.
+"""
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from instrumentation import count, log, span
+from scraper import (POST_FIELDS, URS_BACKOFF, URS_RATE_LIMIT, URS_RETRIES, URS_TIMEOUT, SqliteWriter,
+                     TokenBucket, flatten_comments, insert_parsed, sync_fts)
+
+BASE_URL = 'https://www.reddit.com'
+USER_AGENT = 'python:reddit-keyword-scraper:1.0'   # Reddit throttles generic user agents
+SEARCH_PAGE_SIZE = 100      # Reddit's maximum listing page
+SEARCH_MAX_PAGES = 10       # Reddit stops paginating a search after about 1000 results
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    pass
+
+
+def listing_children(listing, kind):
+    data = listing.get('data') if isinstance(listing, dict) else None
+    if not isinstance(data, dict):
+        return []
+    return [
+        child['data'] for child in data.get('children') or []
+        if isinstance(child, dict) and child.get('kind') == kind and isinstance(child.get('data'), dict)
+    ]
+
+
+def comment_tree(listing):
+    """Reddit t1 listing -> comments shaped like URS output, with nested replies."""
+    return [
+        {
+            'id': comment.get('id'),
+            'body': comment.get('body'),
+            'author': comment.get('author'),
+            'created_utc': comment.get('created_utc'),
+            'replies': comment_tree(comment.get('replies')),
+        }
+        for comment in listing_children(listing, 't1')
+    ]
+
+
+class HttpBackend:
+    """Fetch backend with the same search/comments interface as scraper.UrsBackend."""
+
+    def __init__(self, jobs=1, timeout=URS_TIMEOUT, retries=URS_RETRIES, rate_limit=URS_RATE_LIMIT,
+                 writer_options=None, base_url=None, backoff=URS_BACKOFF):
+        self.jobs = max(1, jobs)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.writer_options = writer_options
+        self.base_url = (base_url or os.getenv('REDDIT_BASE_URL') or BASE_URL).rstrip('/')
+        self.user_agent = os.getenv('REDDIT_USER_AGENT') or USER_AGENT
+        self.bucket = TokenBucket(rate_limit, capacity=self.jobs)
+
+    def search(self, searches, matcher, on_result=None):
+        jobs = [
+            (label, lambda client, result, s=subreddit, k=keyword, t=time_filter:
+                self.fetch_search(client, result, s, k, t))
+            for label, subreddit, keyword, time_filter in searches
+        ]
+        return self.run(jobs, matcher, on_result)
+
+    def comments(self, posts, matcher, on_result=None):
+        jobs = [
+            (label, lambda client, result, post=post: self.fetch_comments(client, result, post))
+            for label, post in posts
+        ]
+        return self.run(jobs, matcher, on_result)[0]
+
+    def run(self, jobs, matcher, on_result=None):
+        """Run (label, fetch) jobs and insert each (kind, payload) record as soon as it arrives."""
+        results = []
+        posts_to_scrape = []
+        with SqliteWriter(**(self.writer_options or {})) as writer:
+            asyncio.run(self.gather(jobs, writer, matcher, results, posts_to_scrape, on_result))
+            writer.flush()
+            sync_fts(writer.conn)
+        return results, posts_to_scrape
+
+    async def gather(self, jobs, writer, matcher, results, posts_to_scrape, on_result):
+        semaphore = asyncio.Semaphore(self.jobs)
+        limits = httpx.Limits(max_connections=self.jobs, max_keepalive_connections=self.jobs)
+        async with httpx.AsyncClient(base_url=self.base_url, headers={'User-Agent': self.user_agent},
+                                     timeout=self.timeout, limits=limits, follow_redirects=True) as client:
+            async def run_job(label, fetch):
+                async with semaphore:
+                    return await self.fetch_job(client, label, fetch)
+
+            tasks = [run_job(label, fetch) for label, fetch in jobs]
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                result, record = await task
+                if record is not None:
+                    # SQLite writes stay on the loop thread; the batched writer keeps them short
+                    posts_to_scrape.extend(insert_parsed(writer, *record, matcher))
+                    # commit the job's rows before on_result marks it done, so a crash cannot
+                    # leave a job recorded as done whose rows were never written
+                    writer.flush()
+                results.append(result)
+                if on_result:
+                    on_result(result)
+                status = 'OK' if result['ok'] else f"FAILED ({result['error']})"
+                log("INFO", f"[{done}/{len(jobs)}] {result['label']}: {status} "
+                    f"after {result['attempts']} request(s), {result['elapsed']:.1f}s")
+
+    async def fetch_job(self, client, label, fetch):
+        result = {'label': label, 'ok': False, 'attempts': 0, 'error': None}
+        started = time.monotonic()
+        record = None
+        try:
+            record = await fetch(client, result)
+            result['ok'] = True
+        except (FetchError, httpx.HTTPError, ValueError) as e:
+            result['error'] = str(e) or e.__class__.__name__
+        result['elapsed'] = time.monotonic() - started
+        return result, record
+
+    async def get_json(self, client, path, params, result, kind):
+        for attempt in range(self.retries + 1):
+            while (wait := self.bucket.wait_time()) > 0:
+                await asyncio.sleep(wait)
+            result['attempts'] += 1
+            delay = self.backoff * 2 ** attempt
+            try:
+                with span('http_request', kind=kind) as fields:
+                    response = await client.get(path, params=params)
+                    fields['status'] = response.status_code
+                count('http_requests', kind=kind, status=response.status_code)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"HTTP {response.status_code} for {path}"
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+            except httpx.TransportError as e:
+                error = f"{e.__class__.__name__} for {path}"
+
+            if attempt < self.retries:
+                count('http_retries', kind=kind)
+                await asyncio.sleep(delay)
+        raise FetchError(error)
+
+    async def fetch_search(self, client, result, subreddit, keyword, time_filter=None):
+        posts = []
+        after = None
+        for _ in range(SEARCH_MAX_PAGES):
+            params = {'q': keyword, 'restrict_sr': 1, 't': time_filter or 'all', 'limit': SEARCH_PAGE_SIZE,
+                      'raw_json': 1}
+            if after:
+                params['after'] = after
+            listing = await self.get_json(client, f"/r/{subreddit}/search.json", params, result, 'search')
+            if not isinstance(listing, dict) or not isinstance(listing.get('data'), dict):
+                raise FetchError(f"Unexpected search response for r/{subreddit}")
+            posts += [{field: post.get(field) for field in POST_FIELDS} for post in listing_children(listing, 't3')]
+            after = listing['data'].get('after')
+            if not after:
+                break
+        return 'subreddit_post', (subreddit, keyword, posts)
+
+    async def fetch_comments(self, client, result, post):
+        path = urlsplit(post['url']).path.rstrip('/') + '.json'
+        params = {'limit': post['num_comments'] or 100, 'raw_json': 1}
+        document = await self.get_json(client, path, params, result, 'comments')
+        # [submission listing, comment listing]; anything else (an error page, a
+        # redirect to a search) fails the job instead of the whole run
+        if not (isinstance(document, list) and len(document) == 2 and isinstance(document[1], dict)):
+            raise FetchError(f"Unexpected comments response for {path}")
+        return 'comment', flatten_comments(comment_tree(document[1]), post['id'], post['subreddit'])
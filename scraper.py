@@ -1,11 +1,22 @@
 import argparse
+import hashlib
+import os
 import platform
+import re
 import subprocess
 import shutil
 import json
+import multiprocessing
 import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from queue import Empty
 from dotenv import load_dotenv
+import instrumentation
+from instrumentation import count, log, record, span
+from keyword_matcher import UMLAUTS, KeywordMatcher, as_matcher
 import codecs
 
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -18,6 +29,76 @@ URS_VENV_PYTHON = (
 SCRAPES_DIR = SCRIPT_DIR / 'scrapes'
 DB_PATH = SCRIPT_DIR / 'reddit_data.db'
 
+URS_TIMEOUT = 15 * 60       # seconds per URS subprocess
+URS_RETRIES = 2             # extra attempts after a failed URS run
+URS_BACKOFF = 5.0           # seconds, doubled on every retry
+URS_RATE_LIMIT = 30         # URS launches per minute across all workers
+FETCH_BACKENDS = ('urs', 'http')
+
+DB_SYNCHRONOUS = 'NORMAL'   # safe with WAL; use FULL for power-loss durability
+DB_CACHE_SIZE = -64000      # negative values are KiB, i.e. 64 MB page cache
+WRITE_BATCH_SIZE = 5000     # rows per executemany transaction
+
+INGEST_WORKERS = os.cpu_count() or 1
+INGEST_BATCH_SIZE = 2000    # rows per batch an ingest worker sends to the writer
+INGEST_QUEUE_BATCHES = 4    # batches in flight per worker before workers block on the writer
+STREAM_THRESHOLD = 64 * 1024 * 1024    # bytes; larger comment dumps are streamed
+STREAM_CHUNK_SIZE = 1 << 20             # characters read at a time while streaming
+POST_FIELDS = ('id', 'title', 'selftext', 'num_comments', 'author', 'created_utc', 'permalink')
+
+# URS search time filters, smallest window first
+SEARCH_TIME_FILTERS = [
+    ('hour', 60 * 60),
+    ('day', 24 * 60 * 60),
+    ('week', 7 * 24 * 60 * 60),
+    ('month', 31 * 24 * 60 * 60),
+    ('year', 366 * 24 * 60 * 60),
+]
+
+
+INSERT_POST = '''
+    INSERT INTO reddit_post (
+        id, title, selftext, num_comments, author, created_utc, subreddit, url, content_hash
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        num_comments = MAX(COALESCE(num_comments, 0), COALESCE(excluded.num_comments, 0))
+'''
+
+INSERT_POST_KEYWORD = '''
+    INSERT OR IGNORE INTO reddit_post_keywords (post_id, keyword)
+    VALUES (?, ?)
+'''
+
+# rows are the tuples yielded by flatten_comments; comments stored before
+# parent_id/depth existed get them filled in when they are scraped again
+INSERT_COMMENT = '''
+    INSERT INTO reddit_comment (
+        id, comment, author, created_utc, parent_post_id, subreddit, parent_id, depth, content_hash
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET parent_id = excluded.parent_id, depth = excluded.depth
+    WHERE reddit_comment.depth IS NULL
+'''
+
+INSERT_COMMENT_KEYWORD = '''
+    INSERT OR IGNORE INTO reddit_comment_keywords (comment_id, keyword)
+    VALUES (?, ?)
+'''
+
+TABLE_RE = re.compile(r'\bINTO\s+(\w+)', re.IGNORECASE)
+
+ADVANCE_HIGH_WATER_MARK = '''
+    INSERT INTO scrape_state (kind, subreddit, target, newest_created_utc, newest_id, updated_at)
+    VALUES ('search', ?, ?, ?, ?, ?)
+    ON CONFLICT(kind, subreddit, target) DO UPDATE SET
+        newest_id = CASE
+            WHEN excluded.newest_created_utc > COALESCE(newest_created_utc, 0)
+            THEN excluded.newest_id ELSE newest_id END,
+        newest_created_utc = MAX(COALESCE(newest_created_utc, 0), excluded.newest_created_utc),
+        updated_at = excluded.updated_at
+'''
+
 
 def clear_scrapes_folder(scrapes_root: Path):
     if scrapes_root.exists():
@@ -28,8 +109,81 @@ def clear_scrapes_folder(scrapes_root: Path):
                 child.unlink()
 
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
+def content_hash(text):
+    return None if text is None else hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def connect_db(db_path=None, synchronous=DB_SYNCHRONOUS, cache_size=DB_CACHE_SIZE):
+    conn = sqlite3.connect(db_path or DB_PATH)
+    # used by migration 2 when it builds unified_text; the triggers no longer call it
+    conn.create_function('content_hash', 1, content_hash, deterministic=True)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA synchronous={synchronous}')
+    conn.execute(f'PRAGMA cache_size={int(cache_size)}')
+    return conn
+
+
+class SqliteWriter:
+    """Buffers rows per statement and writes them with executemany, one transaction per batch."""
+
+    def __init__(self, db_path=None, batch_size=WRITE_BATCH_SIZE,
+                 synchronous=DB_SYNCHRONOUS, cache_size=DB_CACHE_SIZE):
+        self.conn = connect_db(db_path, synchronous, cache_size)
+        self.batch_size = batch_size
+        self.pending = {}
+        self.pending_rows = 0
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def add(self, sql, row):
+        self.pending.setdefault(sql, []).append(row)
+        self.pending_rows += 1
+        if self.pending_rows >= self.batch_size:
+            self.flush()
+
+    def add_many(self, sql, rows):
+        self.pending.setdefault(sql, []).extend(rows)
+        self.pending_rows += len(rows)
+        if self.pending_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with span('sql_write') as fields, self.conn:
+            fields['rows'] = self.pending_rows
+            for sql, rows in self.pending.items():
+                count('rows_written', len(rows), table=TABLE_RE.search(sql).group(1))
+                try:
+                    self.conn.executemany(sql, rows)
+                except sqlite3.Error:
+                    # retry row by row so one bad row does not drop the whole batch
+                    for row in rows:
+                        try:
+                            self.conn.execute(sql, row)
+                        except sqlite3.Error as e:
+                            log("ERROR", f"Failed to insert {row[0]}: {e}")
+        self.rows += self.pending_rows
+        self.pending = {}
+        self.pending_rows = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        elapsed = time.monotonic() - self.started
+        if self.rows:
+            log("INFO", f"Wrote {self.rows} rows in {elapsed:.1f}s "
+                f"({self.rows / max(elapsed, 1e-9):.0f} rows/s)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def init_db(db_path=None):
+    conn = connect_db(db_path)
     cursor = conn.cursor()
 
     # cursor.executescript("""
@@ -81,68 +235,677 @@ def init_db():
         )
     ''')
 
+    # kind is 'search' (target = keyword) or 'comments' (target = post id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_state (
+            kind TEXT,
+            subreddit TEXT,
+            target TEXT,
+            status TEXT,
+            newest_created_utc REAL,
+            newest_id TEXT,
+            num_comments INT,
+            updated_at REAL,
+            PRIMARY KEY (kind, subreddit, target)
+        )
+    ''')
+
+    init_fts(cursor)
+
     conn.commit()
+    migrate_db(conn)
     conn.close()
 
 
-def run_reddit_scraper(subreddits, keywords):
-    clear_scrapes_folder(SCRAPES_DIR)
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Append new migrations; never edit one that has shipped.
+MIGRATIONS = [
+    # 1: secondary indexes for export, comment dedupe and keyword lookups
+    '''
+    CREATE INDEX IF NOT EXISTS idx_post_created_utc ON reddit_post (created_utc);
+    CREATE INDEX IF NOT EXISTS idx_comment_created_utc ON reddit_comment (created_utc);
+    CREATE INDEX IF NOT EXISTS idx_comment_parent_post_id ON reddit_comment (parent_post_id);
+    CREATE INDEX IF NOT EXISTS idx_post_keywords_keyword ON reddit_post_keywords (keyword);
+    CREATE INDEX IF NOT EXISTS idx_comment_keywords_keyword ON reddit_comment_keywords (keyword);
+    ''',
+
+    # 2: posts and comments in one trigger-maintained table with keywords and content hash
+    '''
+    CREATE TABLE IF NOT EXISTS unified_text (
+        source TEXT,
+        id TEXT,
+        title TEXT,
+        content TEXT,
+        author TEXT,
+        subreddit TEXT,
+        created_utc REAL,
+        keywords TEXT,
+        content_hash TEXT,
+        PRIMARY KEY (source, id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_unified_created_utc ON unified_text (created_utc);
+    CREATE INDEX IF NOT EXISTS idx_unified_content_hash ON unified_text (content_hash);
+
+    CREATE TRIGGER IF NOT EXISTS unified_post_insert AFTER INSERT ON reddit_post BEGIN
+        INSERT OR REPLACE INTO unified_text
+        VALUES ('post', new.id, new.title, new.selftext, new.author, new.subreddit, new.created_utc,
+                (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_post_keywords WHERE post_id = new.id),
+                content_hash(new.selftext));
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_post_update
+    AFTER UPDATE OF title, selftext, author, subreddit, created_utc ON reddit_post BEGIN
+        UPDATE unified_text
+        SET title = new.title, content = new.selftext, author = new.author, subreddit = new.subreddit,
+            created_utc = new.created_utc, content_hash = content_hash(new.selftext)
+        WHERE source = 'post' AND id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_post_delete AFTER DELETE ON reddit_post BEGIN
+        DELETE FROM unified_text WHERE source = 'post' AND id = old.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS unified_comment_insert AFTER INSERT ON reddit_comment BEGIN
+        INSERT OR REPLACE INTO unified_text
+        VALUES ('comment', new.id, NULL, new.comment, new.author, new.subreddit, new.created_utc,
+                (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_comment_keywords WHERE comment_id = new.id),
+                content_hash(new.comment));
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_comment_update
+    AFTER UPDATE OF comment, author, subreddit, created_utc ON reddit_comment BEGIN
+        UPDATE unified_text
+        SET content = new.comment, author = new.author, subreddit = new.subreddit,
+            created_utc = new.created_utc, content_hash = content_hash(new.comment)
+        WHERE source = 'comment' AND id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_comment_delete AFTER DELETE ON reddit_comment BEGIN
+        DELETE FROM unified_text WHERE source = 'comment' AND id = old.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS unified_post_keyword_insert AFTER INSERT ON reddit_post_keywords BEGIN
+        UPDATE unified_text
+        SET keywords = (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_post_keywords WHERE post_id = new.post_id)
+        WHERE source = 'post' AND id = new.post_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_post_keyword_delete AFTER DELETE ON reddit_post_keywords BEGIN
+        UPDATE unified_text
+        SET keywords = (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_post_keywords WHERE post_id = old.post_id)
+        WHERE source = 'post' AND id = old.post_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_comment_keyword_insert AFTER INSERT ON reddit_comment_keywords BEGIN
+        UPDATE unified_text
+        SET keywords = (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_comment_keywords WHERE comment_id = new.comment_id)
+        WHERE source = 'comment' AND id = new.comment_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_comment_keyword_delete AFTER DELETE ON reddit_comment_keywords BEGIN
+        UPDATE unified_text
+        SET keywords = (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_comment_keywords WHERE comment_id = old.comment_id)
+        WHERE source = 'comment' AND id = old.comment_id;
+    END;
+
+    INSERT OR IGNORE INTO unified_text
+    SELECT 'post', p.id, p.title, p.selftext, p.author, p.subreddit, p.created_utc,
+           (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_post_keywords WHERE post_id = p.id),
+           content_hash(p.selftext)
+    FROM reddit_post p;
+    INSERT OR IGNORE INTO unified_text
+    SELECT 'comment', c.id, NULL, c.comment, c.author, c.subreddit, c.created_utc,
+           (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_comment_keywords WHERE comment_id = c.id),
+           content_hash(c.comment)
+    FROM reddit_comment c;
+    ''',
+
+    # 3: stable cluster ids per text, written by cluster.py
+    '''
+    CREATE TABLE IF NOT EXISTS cluster_assignments (
+        content_hash TEXT PRIMARY KEY,
+        cluster INTEGER NOT NULL,
+        distance REAL,
+        assigned_utc REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_cluster_assignments_cluster ON cluster_assignments (cluster);
+    ''',
+
+    # 4: MinHash LSH near-duplicate index over unified_text, see near_duplicates.py
+    '''
+    CREATE TABLE IF NOT EXISTS minhash_signatures (
+        seq INTEGER PRIMARY KEY,
+        content_hash TEXT UNIQUE,
+        signature BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS minhash_buckets (
+        band INTEGER,
+        bucket INTEGER,
+        content_hash TEXT,
+        PRIMARY KEY (band, bucket, content_hash)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS near_duplicate_pairs (
+        content_hash TEXT,
+        duplicate_of TEXT,
+        similarity REAL,
+        PRIMARY KEY (content_hash, duplicate_of)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS minhash_state (
+        indexed_rowid INTEGER NOT NULL
+    );
+    INSERT INTO minhash_state SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM minhash_state);
+    ''',
+
+    # 5: reply structure; parent_id is the parent comment (NULL for top-level comments),
+    # depth is 0 for top-level comments
+    '''
+    ALTER TABLE reddit_comment ADD COLUMN parent_id TEXT;
+    ALTER TABLE reddit_comment ADD COLUMN depth INTEGER;
+    CREATE INDEX IF NOT EXISTS idx_comment_parent_id ON reddit_comment (parent_id);
+    ''',
+
+    # 6: content hashes are computed in Python at insert time and stored with the rows, so
+    # the unified_text triggers work on connections without the content_hash() function.
+    # Tools that edit texts directly must update content_hash too.
+    '''
+    ALTER TABLE reddit_post ADD COLUMN content_hash TEXT;
+    ALTER TABLE reddit_comment ADD COLUMN content_hash TEXT;
+    UPDATE reddit_post SET content_hash =
+        (SELECT u.content_hash FROM unified_text u WHERE u.source = 'post' AND u.id = reddit_post.id);
+    UPDATE reddit_comment SET content_hash =
+        (SELECT u.content_hash FROM unified_text u WHERE u.source = 'comment' AND u.id = reddit_comment.id);
+
+    DROP TRIGGER unified_post_insert;
+    DROP TRIGGER unified_post_update;
+    DROP TRIGGER unified_comment_insert;
+    DROP TRIGGER unified_comment_update;
+    CREATE TRIGGER unified_post_insert AFTER INSERT ON reddit_post BEGIN
+        INSERT OR REPLACE INTO unified_text
+        VALUES ('post', new.id, new.title, new.selftext, new.author, new.subreddit, new.created_utc,
+                (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_post_keywords WHERE post_id = new.id),
+                new.content_hash);
+    END;
+    CREATE TRIGGER unified_post_update
+    AFTER UPDATE OF title, selftext, author, subreddit, created_utc, content_hash ON reddit_post BEGIN
+        UPDATE unified_text
+        SET title = new.title, content = new.selftext, author = new.author, subreddit = new.subreddit,
+            created_utc = new.created_utc, content_hash = new.content_hash
+        WHERE source = 'post' AND id = new.id;
+    END;
+    CREATE TRIGGER unified_comment_insert AFTER INSERT ON reddit_comment BEGIN
+        INSERT OR REPLACE INTO unified_text
+        VALUES ('comment', new.id, NULL, new.comment, new.author, new.subreddit, new.created_utc,
+                (SELECT GROUP_CONCAT(keyword, ', ') FROM reddit_comment_keywords WHERE comment_id = new.id),
+                new.content_hash);
+    END;
+    CREATE TRIGGER unified_comment_update
+    AFTER UPDATE OF comment, author, subreddit, created_utc, content_hash ON reddit_comment BEGIN
+        UPDATE unified_text
+        SET content = new.comment, author = new.author, subreddit = new.subreddit,
+            created_utc = new.created_utc, content_hash = new.content_hash
+        WHERE source = 'comment' AND id = new.id;
+    END;
+    ''',
+]
+
+
+def migrate_db(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        log("INFO", f"Migrating database schema to version {number}")
+        # executescript commits first, so the migration runs in its own transaction
+        conn.executescript(f"BEGIN;\n{migration}\nPRAGMA user_version = {number};\nCOMMIT;")
+
+
+# FTS table, content table and indexed columns
+FTS_TABLES = [
+    ('reddit_post_fts', 'reddit_post', 'title, selftext'),
+    ('reddit_comment_fts', 'reddit_comment', 'comment'),
+]
+
+
+def init_fts(cursor):
+    """Trigram FTS5 indexes over posts and comments.
+
+    The indexes use external content keyed by rowid. New rows are indexed in bulk
+    by sync_fts(), which is several times cheaper than a trigger per inserted row;
+    fts_state holds the highest rowid indexed so far. Triggers only keep updates
+    and deletes of already indexed rows in sync. reddit_post and reddit_comment
+    have no INTEGER PRIMARY KEY, so VACUUM may renumber rowids; run rebuild_fts()
+    after a VACUUM.
+    """
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS reddit_post_fts USING fts5(
+                title, selftext, content='reddit_post', content_rowid='rowid', tokenize='trigram'
+            )
+        ''')
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS reddit_comment_fts USING fts5(
+                comment, content='reddit_comment', content_rowid='rowid', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        log("WARN", f"Full-text index unavailable, SQLite needs FTS5 with the trigram tokenizer: {e}")
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fts_state (
+            name TEXT PRIMARY KEY,
+            indexed_rowid INTEGER NOT NULL
+        )
+    ''')
+    for fts, table, _ in FTS_TABLES:
+        # indexes that existed before fts_state were kept complete by insert triggers
+        indexed = cursor.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0] \
+            if fts in existing else 0
+        cursor.execute('INSERT OR IGNORE INTO fts_state VALUES (?, ?)', (fts, indexed))
+
+    # rows at or below the indexed rowid are in the index; the insert triggers only
+    # fire when SQLite reuses such a rowid, e.g. after the newest row was deleted
+    cursor.executescript('''
+        DROP TRIGGER IF EXISTS reddit_post_fts_insert;
+        DROP TRIGGER IF EXISTS reddit_post_fts_delete;
+        DROP TRIGGER IF EXISTS reddit_post_fts_update;
+        DROP TRIGGER IF EXISTS reddit_comment_fts_insert;
+        DROP TRIGGER IF EXISTS reddit_comment_fts_delete;
+        DROP TRIGGER IF EXISTS reddit_comment_fts_update;
 
+        CREATE TRIGGER reddit_post_fts_insert AFTER INSERT ON reddit_post
+        WHEN new.rowid <= (SELECT indexed_rowid FROM fts_state WHERE name = 'reddit_post_fts') BEGIN
+            INSERT INTO reddit_post_fts (rowid, title, selftext) VALUES (new.rowid, new.title, new.selftext);
+        END;
+        CREATE TRIGGER reddit_post_fts_delete AFTER DELETE ON reddit_post
+        WHEN old.rowid <= (SELECT indexed_rowid FROM fts_state WHERE name = 'reddit_post_fts') BEGIN
+            INSERT INTO reddit_post_fts (reddit_post_fts, rowid, title, selftext)
+            VALUES ('delete', old.rowid, old.title, old.selftext);
+        END;
+        CREATE TRIGGER reddit_post_fts_update AFTER UPDATE OF title, selftext ON reddit_post
+        WHEN old.rowid <= (SELECT indexed_rowid FROM fts_state WHERE name = 'reddit_post_fts') BEGIN
+            INSERT INTO reddit_post_fts (reddit_post_fts, rowid, title, selftext)
+            VALUES ('delete', old.rowid, old.title, old.selftext);
+            INSERT INTO reddit_post_fts (rowid, title, selftext) VALUES (new.rowid, new.title, new.selftext);
+        END;
+
+        CREATE TRIGGER reddit_comment_fts_insert AFTER INSERT ON reddit_comment
+        WHEN new.rowid <= (SELECT indexed_rowid FROM fts_state WHERE name = 'reddit_comment_fts') BEGIN
+            INSERT INTO reddit_comment_fts (rowid, comment) VALUES (new.rowid, new.comment);
+        END;
+        CREATE TRIGGER reddit_comment_fts_delete AFTER DELETE ON reddit_comment
+        WHEN old.rowid <= (SELECT indexed_rowid FROM fts_state WHERE name = 'reddit_comment_fts') BEGIN
+            INSERT INTO reddit_comment_fts (reddit_comment_fts, rowid, comment)
+            VALUES ('delete', old.rowid, old.comment);
+        END;
+        CREATE TRIGGER reddit_comment_fts_update AFTER UPDATE OF comment ON reddit_comment
+        WHEN old.rowid <= (SELECT indexed_rowid FROM fts_state WHERE name = 'reddit_comment_fts') BEGIN
+            INSERT INTO reddit_comment_fts (reddit_comment_fts, rowid, comment)
+            VALUES ('delete', old.rowid, old.comment);
+            INSERT INTO reddit_comment_fts (rowid, comment) VALUES (new.rowid, new.comment);
+        END;
+    ''')
+
+
+def fts_available(conn):
+    """Whether init_fts() could create the indexes; SQLite may lack FTS5 or the trigram tokenizer."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fts_state'").fetchone() \
+        is not None
+
+
+def sync_fts(conn):
+    """Index the rows added since the last sync with one bulk insert per table."""
+    if not fts_available(conn):
+        return
+    state = dict(conn.execute('SELECT name, indexed_rowid FROM fts_state'))
+    for fts, table, columns in FTS_TABLES:
+        if fts not in state:
+            continue
+        newest = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+        if newest <= state[fts]:
+            continue
+        with span('fts_sync', table=table) as fields, conn:
+            fields['rows'] = conn.execute(f'''
+                INSERT INTO {fts} (rowid, {columns})
+                SELECT rowid, {columns} FROM {table} WHERE rowid > ? AND rowid <= ?
+            ''', (state[fts], newest)).rowcount
+            conn.execute('UPDATE fts_state SET indexed_rowid = ? WHERE name = ?', (newest, fts))
+
+
+def rebuild_fts():
+    with connect_db() as conn:
+        for fts, table, _ in FTS_TABLES:
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            conn.execute(f'UPDATE fts_state SET indexed_rowid = (SELECT COALESCE(MAX(rowid), 0) FROM {table}) '
+                         'WHERE name = ?', (fts,))
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by all URS workers."""
+
+    def __init__(self, rate_per_minute, capacity=1):
+        if not rate_per_minute > 0:
+            raise ValueError(f"rate limit must be positive, got {rate_per_minute}")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """Take a token and return 0, or return the seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while (wait := self.wait_time()) > 0:
+            time.sleep(wait)
+
+
+def run_urs_command(command, bucket, input_text=None, timeout=URS_TIMEOUT,
+                    retries=URS_RETRIES, backoff=URS_BACKOFF):
+    result = {'command': command, 'ok': False, 'attempts': 0, 'returncode': None, 'error': None}
+    kind = 'search' if '-r' in command else 'comments'
+    started = time.monotonic()
+
+    for attempt in range(1, retries + 2):
+        bucket.acquire()
+        result['attempts'] = attempt
+        try:
+            with span('urs_call', kind=kind) as fields:
+                fields['attempt'] = attempt
+                proc = subprocess.run(
+                    command,
+                    cwd=URS_PATH,
+                    input=input_text,
+                    stdin=None if input_text is not None else subprocess.DEVNULL,
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout
+                )
+                fields['returncode'] = proc.returncode
+            result['returncode'] = proc.returncode
+            if proc.returncode == 0:
+                result['ok'] = True
+                result['error'] = None
+                break
+            stderr = proc.stderr.strip().splitlines()
+            result['error'] = f"exit code {proc.returncode}" + (f": {stderr[-1]}" if stderr else '')
+        except subprocess.TimeoutExpired:
+            result['error'] = f"timed out after {timeout}s"
+        except OSError as e:
+            result['error'] = str(e)
+            break
+
+        if attempt <= retries:
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+    result['elapsed'] = time.monotonic() - started
+    count('urs_calls', kind=kind, status='ok' if result['ok'] else 'failed')
+    count('urs_retries', result['attempts'] - 1, kind=kind)
+    return result
+
+
+def run_urs_jobs(jobs, workers=1, timeout=URS_TIMEOUT, retries=URS_RETRIES, rate_limit=URS_RATE_LIMIT,
+                 on_result=None):
+    """Run (label, command, input_text) jobs on a bounded pool and collect the results."""
+    bucket = TokenBucket(rate_limit, capacity=workers)
+    results = []
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(run_urs_command, command, bucket, input_text, timeout, retries): label
+            for label, command, input_text in jobs
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            result['label'] = futures[future]
+            results.append(result)
+            if on_result:
+                on_result(result)
+            status = 'OK' if result['ok'] else f"FAILED ({result['error']})"
+            log("INFO", f"[{done}/{len(jobs)}] {result['label']}: {status} "
+                f"after {result['attempts']} attempt(s), {result['elapsed']:.1f}s")
+
+    return results
+
+
+def report_failures(results):
+    failed = [r for r in results if not r['ok']]
+    if failed:
+        log("ERROR", f"{len(failed)} of {len(results)} fetch jobs failed:")
+        for r in failed:
+            log("ERROR", f"  - {r['label']}: {r['error']}", label=r['label'], error=r['error'])
+    return failed
+
+
+def set_job_status(kind, subreddit, target, status, num_comments=None):
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute('''
+            INSERT INTO scrape_state (kind, subreddit, target, status, num_comments, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(kind, subreddit, target) DO UPDATE SET
+                status = excluded.status,
+                num_comments = COALESCE(excluded.num_comments, num_comments),
+                updated_at = excluded.updated_at
+        ''', (kind, subreddit, target, status, num_comments, time.time()))
+
+
+def load_search_state(subreddits, keywords):
+    with sqlite3.connect(DB_PATH) as conn:
+        rows = conn.execute('''
+            SELECT subreddit, target, status, newest_created_utc
+            FROM scrape_state
+            WHERE kind = 'search'
+        ''').fetchall()
+    return {
+        (subreddit, keyword): {'status': status, 'newest_created_utc': newest}
+        for subreddit, keyword, status, newest in rows
+        if subreddit in subreddits and keyword in keywords
+    }
+
+
+def advance_high_water_mark(writer, subreddit, keyword, posts):
+    dated = [post for post in posts if post.get('created_utc') is not None]
+    if not dated:
+        return
+    newest = max(dated, key=lambda post: post['created_utc'])
+    writer.add(ADVANCE_HIGH_WATER_MARK, (subreddit, keyword, newest['created_utc'], newest.get('id'), time.time()))
+
+
+def search_time_filter(newest_created_utc):
+    """Smallest URS time filter that still covers everything since the high-water mark."""
+    if not newest_created_utc:
+        return None
+    age = time.time() - newest_created_utc
+    for name, seconds in SEARCH_TIME_FILTERS:
+        if age <= seconds:
+            return name
+    return None
+
+
+def comment_trees_to_refresh(posts):
+    """Keep posts whose num_comments grew since their comment tree was last fetched."""
+    with sqlite3.connect(DB_PATH) as conn:
+        fetched = dict(conn.execute('''
+            SELECT target, num_comments
+            FROM scrape_state
+            WHERE kind = 'comments' AND status = 'done'
+        ''').fetchall())
+    return [
+        post for post in posts
+        if post['id'] not in fetched or (post['num_comments'] or 0) > (fetched[post['id']] or 0)
+    ]
+
+
+class UrsBackend:
+    """Fetch backend that launches URS once per search or comment tree and ingests the files it writes.
+
+    Fetch backends have search(searches, matcher, on_result) for (label, subreddit,
+    keyword, time_filter) searches, returning the job results and the keyword-matching
+    posts, and comments(posts, matcher, on_result) for (label, post) pairs, returning
+    the job results. Both store what they fetched before returning.
+    """
+
+    def __init__(self, jobs=1, timeout=URS_TIMEOUT, retries=URS_RETRIES, rate_limit=URS_RATE_LIMIT,
+                 writer_options=None, ingest_workers=INGEST_WORKERS):
+        self.jobs = jobs
+        self.timeout = timeout
+        self.retries = retries
+        self.rate_limit = rate_limit
+        self.writer_options = writer_options
+        self.ingest_workers = ingest_workers
+        self.ingested = set()
+
+    def search(self, searches, matcher, on_result=None):
+        urs_jobs = []
+        for label, subreddit, keyword, time_filter in searches:
+            command = [str(URS_VENV_PYTHON), '-m', 'urs.Urs', '-r', subreddit, 's', keyword]
+            if time_filter:
+                command.append(time_filter)
+            urs_jobs.append((label, command, 'y\n'))
+        results = run_urs_jobs(urs_jobs, self.jobs, self.timeout, self.retries, self.rate_limit, on_result)
+        return results, self.ingest_new(matcher)
+
+    def comments(self, posts, matcher, on_result=None):
+        urs_jobs = [(label, comments_command(post['url'], post['num_comments']), None) for label, post in posts]
+        results = run_urs_jobs(urs_jobs, self.jobs, self.timeout, self.retries, self.rate_limit, on_result)
+        self.ingest_new(matcher)
+        return results
+
+    def ingest_new(self, matcher):
+        json_files = set(SCRAPES_DIR.rglob("*.json")) - self.ingested
+        self.ingested |= json_files
+        return ingest_jsons(json_files, matcher, self.ingest_workers, self.writer_options)
+
+
+def make_backend(name, jobs=1, timeout=URS_TIMEOUT, retries=URS_RETRIES, rate_limit=URS_RATE_LIMIT,
+                 writer_options=None, base_url=None, ingest_workers=INGEST_WORKERS):
+    if name == 'urs':
+        return UrsBackend(jobs, timeout, retries, rate_limit, writer_options, ingest_workers)
+    if name == 'http':
+        from reddit_http import HttpBackend
+        return HttpBackend(jobs, timeout, retries, rate_limit, writer_options, base_url)
+    raise ValueError(f"Unknown fetch backend: {name}")
+
+
+def run_reddit_scraper(subreddits, keywords, jobs=1, timeout=URS_TIMEOUT,
+                       retries=URS_RETRIES, rate_limit=URS_RATE_LIMIT,
+                       resume=False, incremental=False, writer_options=None, matcher=None,
+                       backend='urs', base_url=None, ingest_workers=INGEST_WORKERS):
+    matcher = matcher or KeywordMatcher(keywords)
+    fetcher = make_backend(backend, jobs, timeout, retries, rate_limit, writer_options, base_url,
+                           ingest_workers)
+
+    if resume:
+        log("INFO", "Resuming: keeping scrapes folder and skipping completed searches")
+    else:
+        clear_scrapes_folder(SCRAPES_DIR)
+        for subreddit in subreddits:
+            for keyword in keywords:
+                set_job_status('search', subreddit, keyword, 'pending')
+
+    state = load_search_state(subreddits, keywords)
+    searches = []
+    job_keys = {}
     for subreddit in subreddits:
         for keyword in keywords:
-            command = [
-                str(URS_VENV_PYTHON), '-m', 'urs.Urs',
-                '-r', subreddit,
-                's', keyword
-            ]
-            print(f"[INFO] Running Reddit scraper: {' '.join(command)}")
-            subprocess.run(
-                command,
-                cwd=URS_PATH,
-                input='y\n',
-                text=True
-            )
+            job_state = state.get((subreddit, keyword), {})
+            if resume and job_state.get('status') == 'done':
+                continue
+            time_filter = search_time_filter(job_state.get('newest_created_utc')) if incremental else None
+            label = f"search r/{subreddit} '{keyword}'" + (f" ({time_filter})" if time_filter else '')
+            job_keys[label] = (subreddit, keyword)
+            searches.append((label, subreddit, keyword, time_filter))
 
-    posts_to_scrape = []
-    all_jsons = list(SCRAPES_DIR.rglob("*.json"))
-    for json_file in all_jsons:
-        if classify_urs_output(json_file) in ('subreddit_post',):
-            posts_to_scrape.extend(insert_subreddit_posts(json_file, keywords))
+    def record_search(result):
+        subreddit, keyword = job_keys[result['label']]
+        set_job_status('search', subreddit, keyword, 'done' if result['ok'] else 'failed')
+
+    log("INFO", f"Running {len(searches)} Reddit searches with {jobs} worker(s) using the {backend} backend")
+    results, posts_to_scrape = fetcher.search(searches, matcher, on_result=record_search)
+
+    if resume:
+        # skipped searches return no posts, and the http backend leaves no scrape files
+        # to re-ingest, so pick up the matching posts stored by the interrupted run
+        posts_to_scrape += stored_posts(subreddits, keywords)
+    if resume or incremental:
+        posts_to_scrape = comment_trees_to_refresh(posts_to_scrape)
+
+    results += scrape_comments(posts_to_scrape, fetcher, matcher)
 
-    scraped = set()
-    for post in posts_to_scrape:
-        if post['id'] not in scraped:
-            print(f"[INFO] Scraping comments for post: {post['id']}")
-            scrape_comments_only(post['url'], post['num_comments'])
-            scraped.add(post['id'])
+    return report_failures(results)
 
-    process_jsons(SCRAPES_DIR, keywords)
 
+def stored_posts(subreddits, keywords):
+    """Keyword-matching posts of these subreddits already in the database, shaped like insert_post_rows output."""
+    with sqlite3.connect(DB_PATH) as conn:
+        rows = conn.execute('''
+            SELECT DISTINCT p.id, p.url, p.num_comments, p.subreddit
+            FROM reddit_post p
+            JOIN reddit_post_keywords k ON k.post_id = p.id
+            WHERE p.subreddit IN (SELECT value FROM json_each(?))
+              AND k.keyword IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(subreddits)), json.dumps(list(keywords)))).fetchall()
+    return [
+        {'id': post_id, 'url': url, 'num_comments': num_comments, 'subreddit': subreddit}
+        for post_id, url, num_comments, subreddit in rows
+    ]
+
+
+def posts_missing_comments(posts):
+    """Drop duplicate posts and posts whose comment tree is already complete in the database."""
+    unique = {post['id']: post for post in posts}
+    if not unique:
+        return []
+
+    with sqlite3.connect(DB_PATH) as conn:
+        complete = {
+            row[0] for row in conn.execute('''
+                SELECT p.id
+                FROM reddit_post p
+                LEFT JOIN (
+                    SELECT parent_post_id, COUNT(*) AS stored
+                    FROM reddit_comment
+                    WHERE parent_post_id IN (SELECT value FROM json_each(?))
+                    GROUP BY parent_post_id
+                ) c ON c.parent_post_id = p.id
+                WHERE p.id IN (SELECT value FROM json_each(?))
+                  AND COALESCE(c.stored, 0) >= COALESCE(p.num_comments, 0)
+            ''', (json.dumps(list(unique)), json.dumps(list(unique))))
+        }
+
+    return [post for post_id, post in unique.items() if post_id not in complete]
+
+
+def scrape_comments(posts, fetcher, matcher):
+    pending = posts_missing_comments(posts)
+    skipped = len({post['id'] for post in posts}) - len(pending)
+    log("INFO", f"Scraping comments for {len(pending)} posts with {fetcher.jobs} worker(s), "
+        f"{skipped} already complete in the database")
 
+    by_label = {f"comments {post['id']}": post for post in pending}
 
-def scrape_comments_only(url: str, num_comments: int):
-    command = [
+    def record_comments(result):
+        post = by_label[result['label']]
+        set_job_status('comments', post['subreddit'], post['id'],
+                       'done' if result['ok'] else 'failed', post['num_comments'] if result['ok'] else None)
+
+    return fetcher.comments(list(by_label.items()), matcher, on_result=record_comments)
+
+
+def comments_command(url: str, num_comments: int):
+    return [
         str(URS_VENV_PYTHON), '-m', 'urs.Urs',
         '-c', url, str(num_comments or 100)
     ]
-    subprocess.run(command, cwd=URS_PATH)
-
 
-def process_jsons(scrapes_root: Path, keywords):
-    jsons = list(scrapes_root.rglob("*.json"))
-    for json_file in jsons:
-        kind = classify_urs_output(json_file)
-        if kind == 'comment':
-            insert_comments(json_file, keywords)
 
+def process_jsons(scrapes_root: Path, keywords, workers=INGEST_WORKERS, writer_options=None):
+    return ingest_jsons(list(scrapes_root.rglob("*.json")), keywords, workers, writer_options)
 
-def classify_urs_output(json_path: Path):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            return 'unknown'
 
+def classify_urs_data(data):
     if not data:
         return 'empty'
 
@@ -158,127 +921,582 @@ def classify_urs_output(json_path: Path):
     return 'unknown'
 
 
+def classify_urs_output(json_path: Path):
+    data = load_urs_json(json_path)
+    return 'unknown' if data is None else classify_urs_data(data)
+
+
+def load_urs_json(json_path: Path):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return None
+
+
+def post_settings(json_data):
+    settings = json_data.get("scrape_settings", {})
+    return settings.get("subreddit", ""), settings.get("n_results_or_keywords")
+
+
+def post_id_from_url(url):
+    parts = url.split("/")
+    return parts[-3] if len(parts) >= 3 else ''
+
+
+def comment_settings(json_data):
+    metadata = json_data.get("data", {}).get("submission_metadata", {})
+    return (
+        post_id_from_url(json_data.get("scrape_settings", {}).get("url", "")),
+        metadata.get("subreddit", "")
+    )
+
+
+def parse_urs_file(json_path: Path):
+    """Parse one URS file and reduce it to what ingestion needs. Runs in worker processes."""
+    data = load_urs_json(json_path)
+    kind = 'unknown' if data is None else classify_urs_data(data)
+
+    if kind == 'subreddit_post':
+        subreddit, keyword = post_settings(data)
+        posts = [{field: post.get(field) for field in POST_FIELDS} for post in data['data']]
+        return kind, (subreddit, keyword, posts)
+
+    if kind == 'comment':
+        parent_post_id, subreddit = comment_settings(data)
+        comments = data.get("data", {}).get("comments", [])
+        return kind, flatten_comments(comments, parent_post_id, subreddit)
+
+    return kind, None
+
+
+def ingest_urs_file(json_path: Path, writer, matcher):
+    """Parse, flatten and tag one URS file into writer. Returns its kind and the posts to scrape.
+
+    Comment dumps above STREAM_THRESHOLD bytes are streamed instead of loaded whole.
+    """
+    if json_path.stat().st_size > STREAM_THRESHOLD:
+        try:
+            stream_comments(writer, json_path, matcher)
+            return 'comment', []
+        except ValueError:
+            pass
+    kind, payload = parse_urs_file(json_path)
+    return kind, insert_parsed(writer, kind, payload, matcher)
+
+
+class QueueWriter:
+    """SqliteWriter stand-in for ingest workers: sends (sql, rows) batches to the writer's queue.
+
+    put() blocks while the queue is full, so workers cannot run ahead of SQLite;
+    the time spent blocked adds up in waited.
+    """
+
+    def __init__(self, queue, batch_size=INGEST_BATCH_SIZE):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.pending = {}
+        self.pending_rows = 0
+        self.waited = 0.0
+
+    def add(self, sql, row):
+        self.pending.setdefault(sql, []).append(row)
+        self.pending_rows += 1
+        if self.pending_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            started = time.perf_counter()
+            self.queue.put(('rows', list(self.pending.items())))
+            self.waited += time.perf_counter() - started
+        self.pending = {}
+        self.pending_rows = 0
+
+
+_ingest_worker = {}     # the QueueWriter and matcher of this ingest worker process
+
+
+def init_ingest_worker(queue, matcher, batch_size):
+    _ingest_worker['writer'] = QueueWriter(queue, batch_size)
+    _ingest_worker['matcher'] = matcher
+
+
+def ingest_worker(json_path: Path):
+    """Runs in a worker process; ends every file with a 'done' message after its rows."""
+    writer = _ingest_worker['writer']
+    writer.waited = 0.0
+    started = time.perf_counter()
+    kind, posts, error = 'unknown', [], None
+    try:
+        kind, posts = ingest_urs_file(json_path, writer, _ingest_worker['matcher'])
+    except Exception as e:
+        # reported by the writer, which would otherwise wait for this file forever
+        error = f"{e.__class__.__name__}: {e}"
+    writer.flush()
+    # parse/tag time only; time blocked on the full queue is reported separately
+    seconds = time.perf_counter() - started - writer.waited
+    writer.queue.put(('done', (json_path, kind, posts, seconds, writer.waited, error)))
+
+
+def ingest_parallel(json_files, matcher, writer, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE):
+    """Producer/consumer ingestion: worker processes parse, flatten and tag files and send
+    row batches over a bounded queue; this process is the only SQLite writer."""
+    queue = multiprocessing.Queue(maxsize=workers * INGEST_QUEUE_BATCHES)
+    # largest files first, so a big comment dump does not finish last on a single core
+    json_files = sorted(json_files, key=lambda path: path.stat().st_size, reverse=True)
+    posts_to_scrape = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_ingest_worker,
+                             initargs=(queue, matcher, batch_size)) as pool:
+        futures = [pool.submit(ingest_worker, path) for path in json_files]
+        remaining = len(futures)
+        while remaining:
+            try:
+                message, body = queue.get(timeout=1)
+            except Empty:
+                # a crashed worker process never sends its 'done' message
+                for future in futures:
+                    if future.done() and future.exception():
+                        raise future.exception()
+                continue
+
+            if message == 'rows':
+                for sql, rows in body:
+                    writer.add_many(sql, rows)
+                continue
+            path, kind, posts, seconds, waited, error = body
+            remaining -= 1
+            record('json_parse', seconds, {'file': path.name}, kind=kind)
+            count('ingest_queue_wait_seconds', waited)
+            if error:
+                log("ERROR", f"Failed to ingest {path}: {error}")
+            posts_to_scrape.extend(posts)
+
+    return posts_to_scrape
+
+
+def ingest_jsons(json_files, keywords, workers=INGEST_WORKERS, writer_options=None):
+    """Parse every URS file exactly once and insert it according to its shape.
+
+    keywords is a list or a prebuilt KeywordMatcher. Returns the keyword-matching
+    posts whose comment trees should be scraped. With more than one worker, files
+    are ingested by ingest_parallel.
+    """
+    matcher = as_matcher(keywords)
+    json_files = list(json_files)
+
+    posts_to_scrape = []
+    with SqliteWriter(**(writer_options or {})) as writer:
+        if workers > 1 and len(json_files) > 1:
+            posts_to_scrape = ingest_parallel(json_files, matcher, writer, min(workers, len(json_files)))
+        else:
+            for path in json_files:
+                # like in the workers, this covers flattening and keyword tagging too
+                started = time.perf_counter()
+                kind, posts = ingest_urs_file(path, writer, matcher)
+                record('json_parse', time.perf_counter() - started, {'file': path.name}, kind=kind)
+                posts_to_scrape.extend(posts)
+
+        writer.flush()
+        sync_fts(writer.conn)
+
+    return posts_to_scrape
+
+
+def insert_parsed(writer, kind, payload, matcher):
+    if kind == 'subreddit_post':
+        subreddit, keyword, posts = payload
+        result_posts = insert_post_rows(writer, subreddit, posts, matcher)
+        if keyword:
+            advance_high_water_mark(writer, subreddit, keyword, posts)
+        return result_posts
+
+    if kind == 'comment':
+        insert_comment_rows(writer, payload, matcher)
+
+    return []
+
 
 def insert_subreddit_posts(json_path: Path, keywords):
+    json_data = load_urs_json(json_path) or {}
+    subreddit, keyword = post_settings(json_data)
+    posts = json_data.get("data", [])
+    with SqliteWriter() as writer:
+        result_posts = insert_post_rows(writer, subreddit, posts, as_matcher(keywords))
+        if keyword:
+            advance_high_water_mark(writer, subreddit, keyword, posts)
+    return result_posts
+
+
+def insert_post_rows(writer, subreddit, posts, matcher):
     result_posts = []
-    with sqlite3.connect(DB_PATH) as conn, open(json_path, 'r', encoding='utf-8') as f:
-        json_data = json.load(f)
-        subreddit = json_data.get("scrape_settings", {}).get("subreddit", "")
-        posts = json_data.get("data", [])
-        for post in posts:
-            post_id = post.get('id')
-            url = f"https://www.reddit.com{post.get('permalink')}"
-            num_comments = post.get('num_comments')
-            try:
-                conn.execute('''
-                    INSERT OR IGNORE INTO reddit_post (
-                        id, title, selftext, num_comments, author, created_utc, subreddit, url
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    post_id,
-                    post.get('title'),
-                    post.get('selftext'),
-                    num_comments,
-                    post.get('author'),
-                    post.get('created_utc'),
-                    subreddit,
-                    url,
-                ))
-
-                matched_keywords = [
-                    kw for kw in keywords
-                    if kw.lower() in post.get('title', '').lower()
-                    or kw.lower() in post.get('selftext', '').lower()
-                ]
-                for kw in matched_keywords:
-                    conn.execute('''
-                        INSERT OR IGNORE INTO reddit_post_keywords (post_id, keyword)
-                        VALUES (?, ?)
-                    ''', (post_id, kw))
-
-                if matched_keywords:
-                    result_posts.append({
-                        'id': post_id,
-                        'url': url,
-                        'num_comments': num_comments
-                    })
-
-            except Exception as e:
-                print(f"[ERROR] Failed to insert post {post_id}: {e}")
+    for post in posts:
+        post_id = post.get('id')
+        url = f"https://www.reddit.com{post.get('permalink')}"
+        num_comments = post.get('num_comments')
+        writer.add(INSERT_POST, (
+            post_id,
+            post.get('title'),
+            post.get('selftext'),
+            num_comments,
+            post.get('author'),
+            post.get('created_utc'),
+            subreddit,
+            url,
+            content_hash(post.get('selftext')),
+        ))
+
+        matched_keywords = matcher.match(post.get('title'), post.get('selftext'))
+        for kw in matched_keywords:
+            writer.add(INSERT_POST_KEYWORD, (post_id, kw))
+
+        if matched_keywords:
+            result_posts.append({
+                'id': post_id,
+                'url': url,
+                'num_comments': num_comments,
+                'subreddit': subreddit
+            })
     return result_posts
 
 
 def flatten_comments(comments, parent_post_id, subreddit):
-    flat = []
-    stack = list(comments)
+    """Yield one INSERT_COMMENT row per comment of a reply tree, depth first.
+
+    Rows are (id, body, author, created_utc, parent_post_id, subreddit, parent_id, depth,
+    content_hash) tuples, so a tree can be inserted without building a second copy of it.
+    """
+    stack = [(comment, None, 0) for comment in reversed(comments)]
 
     while stack:
-        comment = stack.pop()
-        flat.append({
-            'id': comment.get('id'),
-            'body': comment.get('body'),
-            'author': comment.get('author'),
-            'created_utc': comment.get('created_utc'),
-            'parent_post_id': parent_post_id,
-            'subreddit': subreddit
-        })
+        comment, parent_id, depth = stack.pop()
+        comment_id = comment.get('id')
+        body = comment.get('body')
+        yield (comment_id, body, comment.get('author'), comment.get('created_utc'),
+               parent_post_id, subreddit, parent_id, depth, content_hash(body))
         # Push replies to stack for processing
-        stack.extend(comment.get('replies', []))
-    return flat
+        stack.extend((reply, comment_id, depth + 1) for reply in reversed(comment.get('replies') or []))
 
 
 def insert_comments(json_path: Path, keywords):
-    with sqlite3.connect(DB_PATH) as conn, open(json_path, 'r', encoding='utf-8') as f:
-        json_data = json.load(f)
-        comments = json_data.get("data", {}).get("comments", [])
-        metadata = json_data.get("data", {}).get("submission_metadata", {})
-        subreddit = metadata.get("subreddit", "")
-        parent_post_id = json_data.get("scrape_settings", {}).get("url", "").split("/")[-3]
+    json_data = load_urs_json(json_path) or {}
+    parent_post_id, subreddit = comment_settings(json_data)
+    comments = json_data.get("data", {}).get("comments", [])
+    with SqliteWriter() as writer:
+        insert_comment_rows(writer, flatten_comments(comments, parent_post_id, subreddit), as_matcher(keywords))
+
+
+def insert_comment_rows(writer, rows, matcher):
+    """Insert rows from flatten_comments, consuming them one at a time."""
+    for row in rows:
+        writer.add(INSERT_COMMENT, row)
+
+        matched_keywords = matcher.match(row[1])
+        for kw in matched_keywords:
+            writer.add(INSERT_COMMENT_KEYWORD, (row[0], kw))
+
+
+class JsonStream:
+    """Incremental reader over a JSON text file that decodes one value at a time."""
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def read_more(self, size):
+        chunk = self.f.read(size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self.read_more(self.chunk_size)
 
-        flat_comments = flatten_comments(comments, parent_post_id, subreddit)
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos}")
+        self.pos += 1
 
-        for comment in flat_comments:
+    def value(self):
+        size = self.chunk_size
+        while True:
+            self.peek()
             try:
-                conn.execute('''
-                    INSERT OR IGNORE INTO reddit_comment (id, comment, author, created_utc, parent_post_id, subreddit)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    comment['id'],
-                    comment['body'],
-                    comment['author'],
-                    comment['created_utc'],
-                    comment['parent_post_id'],
-                    comment['subreddit']
-                ))
-
-                matched_keywords = [
-                    kw for kw in keywords if kw.lower() in (comment['body'] or '').lower()
-                ]
-                for kw in matched_keywords:
-                    conn.execute('''
-                        INSERT OR IGNORE INTO reddit_comment_keywords (comment_id, keyword)
-                        VALUES (?, ?)
-                    ''', (comment['id'], kw))
-
-            except Exception as e:
-                print(f"[ERROR] Failed to insert comment {comment['id']}: {e}")
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer might continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ValueError(f"invalid JSON at offset {self.pos}")
+            # grow reads geometrically so huge values are not re-decoded too often
+            self.read_more(size)
+            size *= 2
+
+    def object_keys(self):
+        """Yield the keys of an object; the caller must consume each value before resuming."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def array_items(self):
+        """Yield once per array element; the caller must consume each element before resuming."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+def iter_comment_dump(json_path: Path, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream a URS comment file as ('scrape_settings' | 'submission_metadata' | 'comment', value) events.
+
+    Only one top-level comment tree is held in memory at a time. Raises ValueError
+    if the file is not shaped like a URS comment dump.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        stream = JsonStream(f, chunk_size)
+        for key in stream.object_keys():
+            if key != 'data':
+                yield key, stream.value()
+                continue
+            if stream.peek() != '{':
+                raise ValueError(f"{json_path} is not a comment dump")
+            for data_key in stream.object_keys():
+                if data_key != 'comments':
+                    yield data_key, stream.value()
+                    continue
+                for _ in stream.array_items():
+                    yield 'comment', stream.value()
+
+
+def stream_comments(writer, json_path: Path, matcher, batch_size=1000, chunk_size=STREAM_CHUNK_SIZE):
+    parent_post_id = subreddit = None
+    pending = []
+
+    for key, value in iter_comment_dump(json_path, chunk_size):
+        if key == 'scrape_settings':
+            parent_post_id = post_id_from_url(value.get("url", ""))
+        elif key == 'submission_metadata':
+            subreddit = value.get("subreddit", "")
+        elif key == 'comment':
+            pending.append(value)
+            # rows need both settings; URS writes them before the comments
+            if parent_post_id is not None and subreddit is not None and len(pending) >= batch_size:
+                insert_comment_rows(writer, flatten_comments(pending, parent_post_id, subreddit), matcher)
+                pending = []
+
+    if pending:
+        insert_comment_rows(writer, flatten_comments(pending, parent_post_id or '', subreddit or ''), matcher)
+
+
+def fts_query(keyword, normalize_umlauts=False):
+    """FTS5 phrase query for a keyword, OR-ing its umlaut spellings when normalizing."""
+    variants = {keyword}
+    if normalize_umlauts:
+        folded = keyword.lower().translate(UMLAUTS)
+        variants.add(folded)
+        for plain, umlaut in (('ae', 'ä'), ('oe', 'ö'), ('ue', 'ü'), ('ss', 'ß')):
+            folded = folded.replace(plain, umlaut)
+        variants.add(folded)
+    return ' OR '.join('"' + variant.replace('"', '""') + '"' for variant in sorted(variants))
+
+
+def retag_keywords(matcher, writer_options=None):
+    """Fill the keyword tables from the FTS index instead of re-scraping.
+
+    FTS results are only candidates; every hit is confirmed with the matcher so
+    retagging follows the same rules as tagging at insert time. Keywords shorter
+    than the trigram length cannot use the index and fall back to a full scan,
+    as do all keywords when SQLite has no FTS5.
+    """
+    counts = {}
+    with connect_db() as conn, SqliteWriter(**(writer_options or {})) as writer:
+        use_fts = fts_available(conn)
+        sync_fts(conn)
+        for keyword in matcher.keywords:
+            single = KeywordMatcher([keyword], matcher.word_boundary, matcher.normalize_umlauts)
+            if use_fts and len(keyword) >= 3:
+                query = fts_query(keyword, matcher.normalize_umlauts)
+                posts = conn.execute('''
+                    SELECT p.id, p.title, p.selftext
+                    FROM reddit_post_fts JOIN reddit_post p ON p.rowid = reddit_post_fts.rowid
+                    WHERE reddit_post_fts MATCH ?
+                ''', (query,))
+                comments = conn.execute('''
+                    SELECT c.id, c.comment
+                    FROM reddit_comment_fts JOIN reddit_comment c ON c.rowid = reddit_comment_fts.rowid
+                    WHERE reddit_comment_fts MATCH ?
+                ''', (query,))
+            else:
+                posts = conn.execute("SELECT id, title, selftext FROM reddit_post")
+                comments = conn.execute("SELECT id, comment FROM reddit_comment")
+
+            tagged = 0
+            for post_id, title, selftext in posts:
+                if single.match(title, selftext):
+                    writer.add(INSERT_POST_KEYWORD, (post_id, keyword))
+                    tagged += 1
+            for comment_id, body in comments:
+                if single.match(body):
+                    writer.add(INSERT_COMMENT_KEYWORD, (comment_id, keyword))
+                    tagged += 1
+            counts[keyword] = tagged
+            log("INFO", f"Tagged {tagged} posts and comments with '{keyword}'")
+    return counts
+
+
+def search_corpus(query, limit=20):
+    # snippets count trigram tokens, i.e. roughly characters; 64 is the FTS5 maximum
+    with connect_db() as conn:
+        if not fts_available(conn):
+            log("ERROR", "Search needs the full-text index, which this SQLite build cannot create")
+            return []
+        sync_fts(conn)
+        return conn.execute('''
+            SELECT 'post', p.id, p.subreddit,
+                   snippet(reddit_post_fts, -1, '[', ']', '…', 64) AS snippet,
+                   bm25(reddit_post_fts) AS score
+            FROM reddit_post_fts JOIN reddit_post p ON p.rowid = reddit_post_fts.rowid
+            WHERE reddit_post_fts MATCH ?
+            UNION ALL
+            SELECT 'comment', c.id, c.subreddit,
+                   snippet(reddit_comment_fts, -1, '[', ']', '…', 64) AS snippet,
+                   bm25(reddit_comment_fts) AS score
+            FROM reddit_comment_fts JOIN reddit_comment c ON c.rowid = reddit_comment_fts.rowid
+            WHERE reddit_comment_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ''', (query, query, limit)).fetchall()
+
+
+def positive_rate(value):
+    rate = float(value)
+    if not rate > 0:
+        raise argparse.ArgumentTypeError(f"expected requests per minute above 0, got {value!r}")
+    return rate
+
 
 def main():
     parser = argparse.ArgumentParser(description="Multi-platform scraper CLI.")
-    subparsers = parser.add_subparsers(dest='platform', required=True)
+    instrumentation.add_arguments(parser)
+    subparsers = parser.add_subparsers(dest='command', required=True)
 
     reddit_parser = subparsers.add_parser('reddit', help='Run Reddit scraper')
     reddit_parser.add_argument('-s', '--subreddits', nargs='+', required=True,
                            help="One or more subreddits to search")
     reddit_parser.add_argument('-k', '--keywords', nargs='+', required=True,
                            help="One or more keywords to search for")
+    reddit_parser.add_argument('-j', '--jobs', type=int, default=1,
+                           help="Number of searches and comment fetches to run concurrently")
+    reddit_parser.add_argument('--backend', choices=FETCH_BACKENDS, default='urs',
+                           help="Fetch with URS subprocesses or in-process over HTTP")
+    reddit_parser.add_argument('--base-url',
+                           help="Reddit host for the http backend, e.g. a local stand-in "
+                                "(default: $REDDIT_BASE_URL or https://www.reddit.com)")
+    reddit_parser.add_argument('--timeout', type=float, default=URS_TIMEOUT,
+                           help="Seconds before a single URS run or HTTP request is abandoned")
+    reddit_parser.add_argument('--retries', type=int, default=URS_RETRIES,
+                           help="Retries with exponential backoff for failed URS runs or HTTP requests")
+    reddit_parser.add_argument('--rate-limit', type=positive_rate, default=URS_RATE_LIMIT,
+                           help="Maximum URS launches or HTTP requests per minute across all workers")
+    reddit_parser.add_argument('--resume', action='store_true',
+                           help="Continue an interrupted run: keep the scrapes folder and skip completed searches")
+    reddit_parser.add_argument('--incremental', action='store_true',
+                           help="Only fetch posts newer than the stored high-water marks and "
+                                "re-fetch comment trees whose num_comments grew")
+    reddit_parser.add_argument('--word-boundary', action='store_true',
+                           help="Only tag keywords that appear as whole words")
+    reddit_parser.add_argument('--normalize-umlauts', action='store_true',
+                           help="Match ä/ö/ü/ß and ae/oe/ue/ss spellings interchangeably")
+
+    ingest_parser = subparsers.add_parser('ingest', help='Ingest an existing folder of URS scrape files')
+    ingest_parser.add_argument('folder', nargs='?', type=Path, default=SCRAPES_DIR,
+                           help="Folder searched recursively for URS JSON files (default: scrapes/)")
+    ingest_parser.add_argument('-k', '--keywords', nargs='+', required=True,
+                           help="One or more keywords to tag")
+    ingest_parser.add_argument('--word-boundary', action='store_true',
+                           help="Only tag keywords that appear as whole words")
+    ingest_parser.add_argument('--normalize-umlauts', action='store_true',
+                           help="Match ä/ö/ü/ß and ae/oe/ue/ss spellings interchangeably")
+
+    for subparser in (reddit_parser, ingest_parser):
+        subparser.add_argument('--workers', type=int, default=INGEST_WORKERS,
+                               help="Processes that parse and tag scrape files for the single SQLite writer "
+                                    "(1: ingest in this process)")
+        subparser.add_argument('--batch-size', type=int, default=WRITE_BATCH_SIZE,
+                               help="Rows per SQLite write transaction")
+        subparser.add_argument('--synchronous', default=DB_SYNCHRONOUS,
+                               choices=['OFF', 'NORMAL', 'FULL', 'EXTRA'],
+                               help="SQLite synchronous pragma used while ingesting")
+        subparser.add_argument('--cache-size', type=int, default=DB_CACHE_SIZE,
+                               help="SQLite cache_size pragma (negative values are KiB)")
 
+    retag_parser = subparsers.add_parser('retag', help='Tag stored posts and comments with new keywords')
+    retag_parser.add_argument('-k', '--keywords', nargs='+', required=True,
+                           help="One or more keywords to tag")
+    retag_parser.add_argument('--word-boundary', action='store_true',
+                           help="Only tag keywords that appear as whole words")
+    retag_parser.add_argument('--normalize-umlauts', action='store_true',
+                           help="Match ä/ö/ü/ß and ae/oe/ue/ss spellings interchangeably")
+
+    search_parser = subparsers.add_parser('search', help='Full-text search over stored posts and comments')
+    search_parser.add_argument('query',
+                           help="FTS5 query, e.g. '\"Quereinstieg\" AND Gehalt'")
+    search_parser.add_argument('-n', '--limit', type=int, default=20,
+                           help="Maximum number of results")
 
     args = parser.parse_args()
+    instrumentation.configure_from_args(args)
+
+    if args.command == 'retag':
+        retag_keywords(KeywordMatcher(args.keywords, args.word_boundary, args.normalize_umlauts))
+
+    elif args.command == 'search':
+        for source, item_id, subreddit, snippet, score in search_corpus(args.query, args.limit):
+            print(f"{source:<8} {item_id:<10} r/{subreddit or '':<20} {snippet}")
 
-    if args.platform == 'reddit':
-        run_reddit_scraper(args.subreddits, args.keywords)
+    elif args.command in ('reddit', 'ingest'):
+        writer_options = {
+            'batch_size': args.batch_size,
+            'synchronous': args.synchronous,
+            'cache_size': args.cache_size,
+        }
+        matcher = KeywordMatcher(args.keywords, args.word_boundary, args.normalize_umlauts)
+        if args.command == 'ingest':
+            posts = process_jsons(args.folder, matcher, args.workers, writer_options)
+            log("INFO", f"{len(posts)} keyword-matching posts ingested")
+        else:
+            run_reddit_scraper(args.subreddits, args.keywords, args.jobs, args.timeout,
+                               args.retries, args.rate_limit, args.resume, args.incremental,
+                               writer_options, matcher, args.backend, args.base_url, args.workers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,87 @@
+"""content.py token budgeting with the characters / 4 fallback counter."""
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import content  # noqa: E402
+import tokens  # noqa: E402
+from tokens import approx_tokens  # noqa: E402
+
+WORDS = "ich habe seit jahren und frage mich ob das normal ist bei euch wirklich über größe".split()
+
+
+@pytest.fixture(autouse=True)
+def no_tiktoken(monkeypatch):
+    monkeypatch.setattr(tokens, 'encoding_for', lambda model=tokens.OPENAI_MODEL: None)
+
+
+def make_reps(seed, n_clusters=6):
+    rng = random.Random(seed)
+    return [
+        {
+            "cluster": cluster,
+            "size": rng.choice([1, 5, 40, 300, 2000]),
+            "samples": [{"source": rng.choice(["post", "comment"]),
+                         "text": ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 400)))}
+                        for _ in range(rng.randint(1, 8))],
+        }
+        for cluster in range(n_clusters)
+    ]
+
+
+def minimum_share(needs, sizes, budget, c):
+    """What a cluster gets at least: all it needs, or its size-proportional share."""
+    weights = {c: size or 1 for c, size in sizes.items()}
+    return min(needs[c], int(budget * weights[c] / sum(weights.values())))
+
+
+@pytest.mark.parametrize('budget', [50, 400, 2000, 10000])
+@pytest.mark.parametrize('seed', range(10))
+def test_allocation_stays_in_budget_and_gives_minimum_shares(budget, seed):
+    rng = random.Random(seed)
+    needs = {c: rng.randint(0, 3000) for c in range(8)}
+    sizes = {c: rng.choice([0, 1, 10, 500]) for c in range(8)}
+    allocation = content.allocate_budget(needs, sizes, budget)
+
+    assert sum(allocation.values()) <= budget
+    for c in needs:
+        assert allocation[c] <= needs[c]
+        assert allocation[c] >= minimum_share(needs, sizes, budget, c)
+
+
+@pytest.mark.parametrize('max_prompt_tokens', [1200, 3000, 12000])
+@pytest.mark.parametrize('seed', range(10))
+def test_packed_prompt_fits_the_budget(max_prompt_tokens, seed):
+    reps = make_reps(seed)
+    budget = content.data_budget(content.TASK, max_prompt_tokens)
+    packed = content.pack_reps(reps, budget)
+
+    data = '\n\n'.join(content.cluster_block(rep) for rep in packed)
+    assert approx_tokens(data) <= budget
+    assert content.chat_tokens(content.build_openai_prompt(packed)) <= max_prompt_tokens
+
+    # every cluster fills its minimum share, short of a snippet too small to keep
+    # (MIN_SNIPPET_TOKENS plus its line frame); clusters that fit are kept whole
+    needs = {rep["cluster"]: approx_tokens(content.cluster_block(rep)) for rep in reps}
+    sizes = {rep["cluster"]: rep["size"] for rep in reps}
+    packed_tokens = {rep["cluster"]: approx_tokens(content.cluster_block(rep)) for rep in packed}
+    for rep in reps:
+        share = minimum_share(needs, sizes, budget - 2 * len(reps), rep["cluster"])
+        if share == needs[rep["cluster"]]:
+            assert packed_tokens[rep["cluster"]] == share
+        else:
+            assert packed_tokens.get(rep["cluster"], 0) >= share - content.MIN_SNIPPET_TOKENS - 10
+
+
+def test_samples_keep_their_order_and_only_the_last_is_truncated():
+    rep = {"cluster": 1, "size": 1,
+           "samples": [{"source": "post", "text": f"text {i} " + "wort " * 100} for i in range(5)]}
+    packed, = content.pack_reps([rep], 400)
+    texts = [sample["text"] for sample in packed["samples"]]
+    assert texts[:-1] == [sample["text"] for sample in rep["samples"][:len(texts) - 1]]
+    assert texts[-1].endswith("…")
+    assert approx_tokens(content.cluster_block(packed)) <= 400
@@ -0,0 +1,65 @@
+"""export_all_to_csv: the export query plan and deduplication by content hash."""
+import csv
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import export_all_to_csv  # noqa: E402
+import scraper  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / 'reddit_data.db'
+    scraper.init_db(path)
+    return path
+
+
+def add_comments(db, comments):
+    """comments: (id, text, created_utc) tuples."""
+    with sqlite3.connect(db) as conn:
+        conn.executemany(
+            "INSERT INTO reddit_comment (id, comment, created_utc, parent_post_id, subreddit, content_hash) "
+            "VALUES (?, ?, ?, 'p1', 'test', ?)",
+            [(cid, text, created, scraper.content_hash(text)) for cid, text, created in comments])
+
+
+def exported_ids(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row['id'] for row in csv.DictReader(f)]
+
+
+@pytest.mark.parametrize('since', [0, 1000.0])
+@pytest.mark.parametrize('incremental', [False, True])
+def test_export_query_sorts_by_index(db, since, incremental):
+    query = export_all_to_csv.export_query(since, incremental)
+    with sqlite3.connect(db) as conn:
+        plan = [row[-1] for row in conn.execute(
+            'EXPLAIN QUERY PLAN ' + query, {'since': since, 'rowid': 0, 'max_rowid': 0})]
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+    assert any('idx_unified_created_utc' in step for step in plan), plan
+    assert any('idx_unified_content_hash' in step for step in plan), plan
+
+
+def test_export_keeps_first_row_per_content_hash(db, tmp_path):
+    add_comments(db, [('c1', 'same text', 100), ('c2', 'other text', 200), ('c3', 'same text', 300)])
+    output = tmp_path / 'out.csv'
+
+    assert export_all_to_csv.export(db, output) == 2
+    assert exported_ids(output) == ['c2', 'c1']
+
+
+def test_incremental_export_skips_texts_exported_before(db, tmp_path):
+    add_comments(db, [('c1', 'same text', 100), ('c2', 'other text', 200)])
+    output = tmp_path / 'out.csv'
+    assert export_all_to_csv.export(db, output, incremental=True) == 2
+
+    # a repeat of an exported text, a new text and a repeat of that within the new rows
+    add_comments(db, [('c3', 'same text', 300), ('c4', 'new text', 400), ('c5', 'new text', 500)])
+    assert export_all_to_csv.export(db, output, incremental=True) == 1
+    assert exported_ids(output) == ['c2', 'c1', 'c4']
+    assert export_all_to_csv.export(db, output, incremental=True) == 0
@@ -0,0 +1,86 @@
+"""FeatureCache: reads by content hash across shard merging and eviction."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import feature_cache  # noqa: E402
+from feature_cache import FeatureCache  # noqa: E402
+
+
+def batches(n_batches, rows=20, cols=50, sparse=True):
+    for i in range(n_batches):
+        matrix = sp.random(rows, cols, density=0.2, format='csr', random_state=i)
+        yield [f"h{i}-{row}" for row in range(rows)], matrix if sparse else matrix.toarray()
+
+
+def dense(matrix):
+    return matrix.toarray() if sp.issparse(matrix) else np.asarray(matrix)
+
+
+def n_shards(cache):
+    return cache.conn.execute('SELECT COUNT(*) FROM shards').fetchone()[0]
+
+
+def not_cached(positions):
+    raise AssertionError(f"{len(positions)} rows were not cached")
+
+
+@pytest.mark.parametrize('sparse', [True, False])
+def test_rows_round_trip_after_compaction(tmp_path, sparse):
+    cache = FeatureCache('v1', tmp_path)
+    expected = {}
+    for hashes, matrix in batches(feature_cache.MAX_SHARDS + 3, sparse=sparse):
+        # one hash from the previous batch is already cached and must not be recomputed
+        wanted = hashes + list(expected)[:1]
+        computed = []
+
+        def compute(positions, matrix=matrix):
+            computed.extend(positions)
+            return matrix[positions]
+
+        cache.fetch(wanted, compute)
+        assert computed == list(range(len(hashes)))
+        expected.update(zip(hashes, dense(matrix)))
+
+    # the first MAX_SHARDS + 1 shards were merged into one
+    assert n_shards(cache) == 3
+    assert len(list(cache.dir.glob('shard-*'))) == 3
+    hashes = list(expected)[::-1]
+    rows = dense(cache.fetch(hashes, not_cached))
+    assert np.allclose(rows, np.array([expected[h] for h in hashes]))
+    cache.close()
+
+    # and again from a fresh connection
+    cache = FeatureCache('v1', tmp_path)
+    assert np.allclose(dense(cache.fetch(hashes, not_cached)), np.array([expected[h] for h in hashes]))
+    cache.close()
+
+
+def test_eviction_drops_least_recently_used_shards(tmp_path):
+    cache = FeatureCache('v1', tmp_path)
+    data = list(batches(3))
+    for hashes, matrix in data:
+        cache.fetch(hashes, lambda positions, matrix=matrix: matrix[positions])
+    first, second, third = [hashes for hashes, _ in data]
+    cache.fetch(first, not_cached)      # the first shard is now the most recently used
+
+    sizes = dict(cache.conn.execute('SELECT id, bytes FROM shards').fetchall())
+    cache.max_bytes = sum(sizes.values()) - 1
+    cache.evict()
+
+    assert n_shards(cache) == 2
+    assert len(cache.lookup(second)) == 0
+    assert len(cache.lookup(first)) == len(cache.lookup(third)) == len(first)
+    assert np.allclose(dense(cache.fetch(first, not_cached)), dense(data[0][1]))
+    cache.close()
+
+
+def test_versions_are_kept_apart(tmp_path):
+    hashes, matrix = next(batches(1))
+    FeatureCache('v1', tmp_path).fetch(hashes, lambda positions: matrix[positions])
+    assert FeatureCache('v2', tmp_path).lookup(hashes) == {}
@@ -0,0 +1,22 @@
+"""instrumentation: the Prometheus textfile keeps exact values."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import instrumentation  # noqa: E402
+
+
+def test_metrics_are_not_rounded(monkeypatch):
+    monkeypatch.setattr(instrumentation, '_counters', {})
+    monkeypatch.setattr(instrumentation, '_spans', {})
+    instrumentation.count('rows_written', 12345678, table='reddit_comment')
+    instrumentation.count('queue_wait_seconds', 0.25)
+    instrumentation.count('queue_wait_seconds', 1234567.125)
+    instrumentation.record('scrape', 98765.4321)
+
+    lines = instrumentation.metrics_text().splitlines()
+    assert 'reddit_pipeline_rows_written_total{table="reddit_comment"} 12345678' in lines
+    assert 'reddit_pipeline_queue_wait_seconds_total 1234567.375' in lines
+    assert 'reddit_pipeline_span_seconds_total{span="scrape"} 98765.4321' in lines
+    assert 'reddit_pipeline_span_calls_total{span="scrape"} 1' in lines
@@ -0,0 +1,77 @@
+"""The incremental comment-dump parser against json.load with tiny reads."""
+import io
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / 'benchmarks')]
+
+import scraper  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from synthetic import comments_document, make_comment_tree, make_posts  # noqa: E402
+
+# escapes, surrogate pairs and multi-byte characters, to be split across reads
+ODD_BODIES = ['Quote "this" \\ and\nnew line', 'Über Größe ß – 😀 and é', 'tab\there', '', '{"not": "json"}']
+
+
+class Collect:
+    """Stands in for SqliteWriter and keeps the rows."""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, sql, row):
+        if sql == scraper.INSERT_COMMENT:
+            self.rows.append(row)
+
+
+def comment_dump(seed=3):
+    rng = random.Random(seed)
+    post = make_posts('test', 'job', 1, rng, comments_per_post=60)[0]
+    comments = make_comment_tree(post['id'], 60, 8, rng, keyword='job')
+    stack = list(comments)
+    while stack:
+        comment = stack.pop()
+        if rng.random() < 0.3:
+            comment['body'] += ' ' + rng.choice(ODD_BODIES)
+        comment['score'] = rng.choice([0, -1, 12345678901, 1.5e-3])
+        stack.extend(comment['replies'])
+    return comments_document(post, comments)
+
+
+@pytest.mark.parametrize('ensure_ascii', [False, True])
+def test_streamed_rows_match_json_load(tmp_path, ensure_ascii):
+    path = tmp_path / 'comments.json'
+    path.write_text(json.dumps(comment_dump(), ensure_ascii=ensure_ascii, indent=1), encoding='utf-8')
+
+    document = json.loads(path.read_text(encoding='utf-8'))
+    post_id = scraper.post_id_from_url(document['scrape_settings']['url'])
+    expected = list(scraper.flatten_comments(document['data']['comments'], post_id,
+                                             document['data']['submission_metadata']['subreddit']))
+
+    writer = Collect()
+    scraper.stream_comments(writer, path, KeywordMatcher(['job']), batch_size=4, chunk_size=7)
+    assert writer.rows == expected
+    assert max(row[7] for row in expected) > 1      # depth
+    assert any(row[6] for row in expected)          # parent_id
+
+
+def test_values_split_across_utf8_reads():
+    document = comment_dump()
+    data = json.dumps(document, ensure_ascii=False).encode('utf-8')
+    f = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+    f._CHUNK_SIZE = 7       # bytes per read from the buffer, so multi-byte characters are split
+    stream = scraper.JsonStream(f, chunk_size=7)
+    assert stream.value() == document
+    assert stream.peek() == ''
+
+
+def test_truncated_dump_is_rejected(tmp_path):
+    path = tmp_path / 'comments.json'
+    path.write_text(json.dumps(comment_dump())[:-40], encoding='utf-8')
+    with pytest.raises(ValueError):
+        scraper.stream_comments(Collect(), path, KeywordMatcher(['job']), chunk_size=7)
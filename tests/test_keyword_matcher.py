@@ -0,0 +1,68 @@
+"""KeywordMatcher: the Aho–Corasick automaton and the substring scan must agree."""
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from keyword_matcher import AUTOMATON_MIN_KEYWORDS, KeywordMatcher  # noqa: E402
+
+# overlapping (arbeit/arbeitsamt/amt, he/she/hers), case and umlaut variants
+KEYWORDS = ['arbeit', 'Arbeitsamt', 'amt', 'he', 'she', 'hers', 'his', 'Über', 'ueberstunden', 'überstunden',
+            'Job', 'job', 'jobcenter', 'c++', 'a b']
+TEXTS = [
+    '',
+    'Ushers',
+    'Das ARBEITSAMT hat angerufen',
+    'Überstunden ohne Ende, ueberstunden überall',
+    'Mein Jobcenter-Termin; ein job_ und ein Job.',
+    'c++ oder c#? a  b, a b',
+    'amtlich: sie hat hers, er his',
+    'nothing here at all',
+    'über',
+]
+
+
+def both_paths(keywords, **options):
+    automaton = KeywordMatcher(keywords, **options)
+    automaton.use_automaton = True
+    automaton.build()
+    scan = KeywordMatcher(keywords, **options)
+    scan.use_automaton = False
+    return automaton, scan
+
+
+def random_texts(n=300, seed=7):
+    rng = random.Random(seed)
+    vocabulary = [kw.upper() if rng.random() < 0.3 else kw for kw in KEYWORDS] + \
+        ['ich', 'habe', 'sheer', 'ahem', 'arbeiten', 'job-', '_amt', 'ä', 'ß', 'x']
+    return [rng.choice(' -_.,').join(rng.choice(vocabulary) for _ in range(rng.randint(0, 12))) for _ in range(n)]
+
+
+@pytest.mark.parametrize('word_boundary', [False, True])
+@pytest.mark.parametrize('normalize_umlauts', [False, True])
+def test_automaton_and_scan_agree(word_boundary, normalize_umlauts):
+    automaton, scan = both_paths(KEYWORDS, word_boundary=word_boundary, normalize_umlauts=normalize_umlauts)
+    for text in TEXTS + random_texts():
+        assert automaton.match(text) == scan.match(text), text
+    assert automaton.match(*TEXTS) == scan.match(*TEXTS)
+
+
+def test_expected_matches():
+    for matcher in both_paths(KEYWORDS):
+        assert matcher.match('Ushers') == ['he', 'she', 'hers']
+        assert matcher.match('Das ARBEITSAMT') == ['arbeit', 'Arbeitsamt', 'amt']
+        assert matcher.match('ein JOB') == ['Job', 'job']
+    for matcher in both_paths(KEYWORDS, word_boundary=True, normalize_umlauts=True):
+        assert matcher.match('Ushers') == []
+        assert matcher.match('Überstunden') == ['ueberstunden', 'überstunden']
+        assert matcher.match('job_ jobcenter') == ['jobcenter']
+
+
+def test_large_keyword_sets_use_the_automaton():
+    keywords = [f"wort{i}" for i in range(AUTOMATON_MIN_KEYWORDS)]
+    assert KeywordMatcher(keywords).use_automaton
+    assert not KeywordMatcher(keywords[:-1]).use_automaton
+    assert KeywordMatcher(keywords).match('ein wort42 und wort7') == ['wort4', 'wort7', 'wort42']
@@ -0,0 +1,61 @@
+"""near_duplicates: LSH index updates and near-duplicate groups."""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import scraper  # noqa: E402
+from near_duplicates import duplicate_hashes, update_index  # noqa: E402
+
+ORIGINAL = ("Ich habe nach zehn Jahren im Büro eine Umschulung zur Fachinformatikerin gemacht "
+            "und bereue es kein bisschen, auch wenn das erste Jahr finanziell wirklich hart war.")
+# a lightly edited repost: one word added at the end
+EDITED = ORIGINAL.replace("war.", "war. Echt!")
+UNRELATED = ("Mein Vermieter will die Nebenkosten nachträglich um dreihundert Euro erhöhen, "
+             "obwohl die Abrechnung schon seit Monaten abgeschlossen ist. Darf er das?")
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = tmp_path / 'reddit_data.db'
+    scraper.init_db(path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def add_comments(conn, texts, start=0):
+    with conn:
+        conn.executemany(
+            "INSERT INTO reddit_comment (id, comment, parent_post_id, subreddit, content_hash) "
+            "VALUES (?, ?, 'p1', 'test', ?)",
+            [(f"c{start + i}", text, scraper.content_hash(text)) for i, text in enumerate(texts)])
+
+
+def test_only_the_near_duplicate_pair_is_grouped(conn):
+    add_comments(conn, [ORIGINAL, UNRELATED, EDITED])
+    assert update_index(conn) == 3
+
+    # the later text of the pair is dropped, the original and the unrelated text are kept
+    assert duplicate_hashes(conn, 0.7) == {scraper.content_hash(EDITED)}
+    assert duplicate_hashes(conn, 0.99) == set()
+    pairs = conn.execute('SELECT content_hash, duplicate_of FROM near_duplicate_pairs').fetchall()
+    assert pairs == [(scraper.content_hash(EDITED), scraper.content_hash(ORIGINAL))]
+
+
+def test_update_index_only_indexes_new_rows(conn):
+    add_comments(conn, [ORIGINAL, UNRELATED])
+    assert update_index(conn) == 2
+    assert update_index(conn) == 0
+    mark = conn.execute('SELECT indexed_rowid FROM minhash_state').fetchone()[0]
+    assert mark == conn.execute('SELECT MAX(rowid) FROM unified_text').fetchone()[0]
+
+    # an exact repeat is not indexed again; the edited copy is, and pairs with the original
+    add_comments(conn, [EDITED, ORIGINAL], start=2)
+    assert update_index(conn) == 1
+    assert conn.execute('SELECT COUNT(*) FROM minhash_signatures').fetchone()[0] == 3
+    assert conn.execute('SELECT indexed_rowid FROM minhash_state').fetchone()[0] > mark
+    assert duplicate_hashes(conn) == {scraper.content_hash(EDITED)}
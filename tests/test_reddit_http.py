@@ -0,0 +1,135 @@
+"""The http fetch backend against the local fake Reddit server (benchmarks/fake_reddit.py)."""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / 'benchmarks')]
+
+import fake_reddit  # noqa: E402
+import scraper  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from reddit_http import HttpBackend  # noqa: E402
+
+RATE_LIMIT = 10 ** 6
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / 'reddit_data.db'
+    monkeypatch.setattr(scraper, 'DB_PATH', path)
+    monkeypatch.setattr(scraper, 'SCRAPES_DIR', tmp_path / 'scrapes')
+    scraper.init_db(path)
+    return path
+
+
+@pytest.fixture
+def server(request):
+    options = getattr(request, 'param', {})
+    server = fake_reddit.serve(**{'posts': 150, 'depth': 6, **options})
+    yield server
+    server.shutdown()
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def query(db, sql, *params):
+    with sqlite3.connect(db) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def matching_posts(db):
+    return query(db, '''
+        SELECT p.id, p.num_comments FROM reddit_post p
+        WHERE p.id IN (SELECT post_id FROM reddit_post_keywords)
+    ''')
+
+
+def test_scrape_stores_posts_and_comment_trees(db, server):
+    failures = scraper.run_reddit_scraper(['bench'], ['job'], jobs=4, rate_limit=RATE_LIMIT,
+                                          backend='http', base_url=base_url(server))
+    assert failures == []
+
+    # 150 results take two search pages of 100
+    assert query(db, 'SELECT COUNT(*) FROM reddit_post') == [(150,)]
+    posts = matching_posts(db)
+    assert posts
+    assert server.requests == 2 + len(posts)
+
+    stored = dict(query(db, 'SELECT parent_post_id, COUNT(*) FROM reddit_comment GROUP BY parent_post_id'))
+    assert {post_id: stored.get(post_id, 0) for post_id, _ in posts} == dict(posts)
+    assert query(db, 'SELECT MAX(depth) FROM reddit_comment')[0][0] > 0
+    assert query(db, "SELECT COUNT(*) FROM reddit_comment WHERE depth > 0 AND parent_id IS NULL") == [(0,)]
+
+    # the search is done and its high-water mark is the newest post
+    assert query(db, '''
+        SELECT s.status, s.newest_created_utc = (SELECT MAX(created_utc) FROM reddit_post)
+        FROM scrape_state s WHERE kind = 'search' AND subreddit = 'bench' AND target = 'job'
+    ''') == [('done', 1)]
+    assert query(db, "SELECT COUNT(*) FROM scrape_state WHERE kind = 'comments' AND status = 'done'") == \
+        [(len(posts),)]
+
+
+@pytest.mark.parametrize('server', [{'posts': 30, 'fail_every': 3}], indirect=True)
+def test_rate_limited_requests_are_retried(db, server):
+    backend = HttpBackend(jobs=2, retries=3, rate_limit=RATE_LIMIT, base_url=base_url(server), backoff=0)
+    matcher = KeywordMatcher(['job'])
+
+    results, posts = backend.search([('search', 'bench', 'job', None)], matcher)
+    results += backend.comments([(f"comments {post['id']}", post) for post in posts], matcher)
+    assert all(result['ok'] for result in results)
+
+    # every third request got a 429 and was repeated
+    attempts = sum(result['attempts'] for result in results)
+    assert attempts == server.requests
+    assert attempts - len(results) == server.requests // 3
+    assert query(db, 'SELECT COUNT(*) FROM reddit_comment')[0][0] == sum(n for _, n in matching_posts(db))
+
+
+def test_bad_responses_fail_only_their_job(db, server):
+    backend = HttpBackend(jobs=2, retries=0, rate_limit=RATE_LIMIT, base_url=base_url(server), backoff=0)
+    _, posts = backend.search([('search', 'bench', 'job', None)], KeywordMatcher(['job']))
+    good = posts[0]
+    not_found = {**good, 'id': 'gone', 'url': 'https://www.reddit.com/gone/'}
+    # a search listing where a [submission, comments] pair is expected
+    wrong_shape = {**good, 'id': 'odd', 'url': 'https://www.reddit.com/r/bench/search'}
+
+    results = backend.comments([('good', good), ('not found', not_found), ('wrong shape', wrong_shape)],
+                               KeywordMatcher(['job']))
+    by_label = {result['label']: result for result in results}
+    assert by_label['good']['ok']
+    assert not by_label['not found']['ok'] and '404' in by_label['not found']['error']
+    assert not by_label['wrong shape']['ok'] and 'Unexpected' in by_label['wrong shape']['error']
+    assert query(db, 'SELECT COUNT(*) FROM reddit_comment WHERE parent_post_id = ?', good['id']) == \
+        [(good['num_comments'],)]
+
+
+def test_resume_fetches_comments_after_an_interrupted_run(db, server, monkeypatch):
+    def interrupted(posts, fetcher, matcher):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(scraper, 'scrape_comments', interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            scraper.run_reddit_scraper(['bench'], ['job'], jobs=4, rate_limit=RATE_LIMIT,
+                                       backend='http', base_url=base_url(server))
+    assert query(db, 'SELECT COUNT(*) FROM reddit_comment') == [(0,)]
+    searched = server.requests
+
+    failures = scraper.run_reddit_scraper(['bench'], ['job'], jobs=4, rate_limit=RATE_LIMIT, resume=True,
+                                          backend='http', base_url=base_url(server))
+    assert failures == []
+    posts = matching_posts(db)
+    # the completed search is skipped; every matching post's comments are fetched once
+    assert server.requests - searched == len(posts)
+    assert query(db, 'SELECT COUNT(*) FROM reddit_comment')[0][0] == sum(n for _, n in posts)
+
+    # nothing is left to do on a second resume
+    before = server.requests
+    assert scraper.run_reddit_scraper(['bench'], ['job'], jobs=4, rate_limit=RATE_LIMIT, resume=True,
+                                      backend='http', base_url=base_url(server)) == []
+    assert server.requests == before
@@ -0,0 +1,67 @@
+"""Row-level behaviour of the scraper's SQLite writes."""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import scraper  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / 'reddit_data.db'
+    scraper.init_db(path)
+    return path
+
+
+def test_post_comment_count_only_grows(db):
+    def ingest(num_comments):
+        with scraper.SqliteWriter(db) as writer:
+            writer.add(scraper.INSERT_POST, ('p1', 'title', 'text', num_comments, 'author', 0, 'test',
+                                             'https://www.reddit.com/r/test/comments/p1/', scraper.content_hash('text')))
+        with sqlite3.connect(db) as conn:
+            return conn.execute("SELECT num_comments FROM reddit_post WHERE id = 'p1'").fetchone()[0]
+
+    assert ingest(5) == 5
+    # a listing without a count must not wipe the stored one
+    assert ingest(None) == 5
+    assert ingest(3) == 5
+    assert ingest(8) == 8
+
+
+@pytest.mark.parametrize('with_fts', [True, False])
+def test_retag_without_fts_falls_back_to_a_scan(tmp_path, monkeypatch, with_fts):
+    if not with_fts:
+        # what init_fts() leaves behind when SQLite has no FTS5: no indexes, no fts_state
+        monkeypatch.setattr(scraper, 'init_fts', lambda cursor: None)
+    path = tmp_path / 'reddit_data.db'
+    scraper.init_db(path)
+    monkeypatch.setattr(scraper, 'DB_PATH', path)
+    with scraper.SqliteWriter(path) as writer:
+        writer.add(scraper.INSERT_POST, ('p1', 'Quereinstieg', 'mit 40 in die IT', 2, 'author', 0, 'test',
+                                         'https://www.reddit.com/r/test/comments/p1/', scraper.content_hash('x')))
+        writer.add(scraper.INSERT_COMMENT, ('c1', 'Der Quereinstieg hat geklappt', 'author', 0, 'p1', 'test',
+                                            None, 0, scraper.content_hash('Der Quereinstieg hat geklappt')))
+        writer.add(scraper.INSERT_COMMENT, ('c2', 'Nichts davon', 'author', 0, 'p1', 'test',
+                                            None, 0, scraper.content_hash('Nichts davon')))
+
+    with sqlite3.connect(path) as conn:
+        assert scraper.fts_available(conn) == with_fts
+    counts = scraper.retag_keywords(scraper.KeywordMatcher(['quereinstieg', 'IT']))
+    assert counts == {'quereinstieg': 2, 'IT': 1}
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('SELECT comment_id FROM reddit_comment_keywords').fetchall() == [('c1',)]
+    assert len(scraper.search_corpus('"Quereinstieg"')) == (2 if with_fts else 0)
+
+
+@pytest.mark.parametrize('rate', ['0', '-5', 'nan'])
+def test_rate_limit_must_be_positive(rate, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['scraper.py', 'reddit', '-s', 'test', '-k', 'job', '--rate-limit', rate])
+    with pytest.raises(SystemExit):
+        scraper.main()
+    assert 'above 0' in capsys.readouterr().err
+    with pytest.raises(ValueError):
+        scraper.TokenBucket(float(rate))
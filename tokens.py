@@ -0,0 +1,82 @@
+from functools import lru_cache
+
+from instrumentation import log
+
+OPENAI_MODEL = "gpt-4-turbo"
+FALLBACK_ENCODING = "cl100k_base"
+
+# USD per million tokens (input, output); update when OpenAI changes its prices
+PRICES = {
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+CONTEXT_WINDOWS = {
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+}
+
+
+def approx_tokens(text):
+    return len(text) // 4
+
+
+@lru_cache(maxsize=None)
+def encoding_for(model=OPENAI_MODEL):
+    """tiktoken encoding for an OpenAI model, or None when it is unavailable.
+
+    tiktoken downloads its encoding files once and caches them; without tiktoken
+    or those files, callers fall back to a characters / 4 estimate.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        log("WARN", "tiktoken not installed, estimating tokens as characters / 4")
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        log("WARN", f"Could not load the tiktoken encoding for {model} ({e.__class__.__name__}), "
+            "estimating tokens as characters / 4")
+        return None
+
+
+def token_counter(model=OPENAI_MODEL):
+    """Return a function that counts the tokens of a text for an OpenAI model."""
+    encoding = encoding_for(model)
+    if encoding is None:
+        return approx_tokens
+
+    def count(text):
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return count
+
+
+def token_truncator(model=OPENAI_MODEL):
+    """Return a function that cuts a text down to at most max_tokens tokens."""
+    encoding = encoding_for(model)
+
+    def truncate(text, max_tokens):
+        if encoding is None:
+            return text[:max(max_tokens, 0) * 4]
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max(max_tokens, 0)])
+
+    return truncate
+
+
+def estimate_cost(model, prompt_tokens, output_tokens=0):
+    """Estimated USD cost of a request, or None for models without a known price."""
+    if model not in PRICES:
+        return None
+    input_price, output_price = PRICES[model]
+    return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000